@@ -0,0 +1,102 @@
+"""Сравнение времени рассылки первого вопроса опроса N получателям.
+
+Запуск из корня репозитория:
+    python -m benchmarks.broadcast_benchmark --recipients 3000 --latency 0.05
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+import uuid
+from typing import Any, Dict, List
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from vkwave.api.methods._error import APIError
+from broadcaster import Broadcaster, DeliveryReport
+
+
+class FakeMessages:
+    """Имитация метода messages.send с задержкой сети и лимитом запросов VK."""
+
+    def __init__(self, latency: float, rate_limit: int, forbidden: set) -> None:
+        self.latency = latency
+        self.rate_limit = rate_limit
+        self.forbidden = forbidden
+        self.calls: int = 0
+        self._window_start: float = time.monotonic()
+        self._window_calls: int = 0
+
+    def _check_rate_limit(self) -> None:
+        now: float = time.monotonic()
+        if now - self._window_start >= 1:
+            self._window_start, self._window_calls = now, 0
+        self._window_calls += 1
+        if self._window_calls > self.rate_limit:
+            raise APIError(6, "Too many requests per second", {})
+
+    def _peer_result(self, peer_id: int) -> Dict[str, Any]:
+        if peer_id in self.forbidden:
+            return {
+                "peer_id": peer_id,
+                "error": {"code": 901, "description": "Can't send messages for users without permission"},
+            }
+        return {"peer_id": peer_id, "message_id": self.calls}
+
+    async def send(self, peer_id: int = None, peer_ids: List[int] = None, **kwargs: Any) -> Dict[str, Any]:
+        self.calls += 1
+        self._check_rate_limit()
+        await asyncio.sleep(self.latency)
+        if peer_ids is not None:
+            return {"response": [self._peer_result(int(pid)) for pid in peer_ids]}
+        if int(peer_id) in self.forbidden:
+            raise APIError(901, "Can't send messages for users without permission", {})
+        return {"response": self.calls}
+
+
+class FakeAPIContext:
+    def __init__(self, latency: float, rate_limit: int, forbidden: set) -> None:
+        self.messages = FakeMessages(latency, rate_limit, forbidden)
+
+
+async def sequential_send(api_context: FakeAPIContext, peer_ids: List[int]) -> float:
+    """Рассылка по одному сообщению на получателя, как в исходном start_handler."""
+    started_at: float = time.monotonic()
+    for peer_id in peer_ids:
+        try:
+            await api_context.messages.send(
+                peer_id=peer_id, random_id=uuid.uuid4().int, message="Вы болеете?"
+            )
+        except APIError:
+            continue
+    return time.monotonic() - started_at
+
+
+async def main(recipients: int, latency: float, rate_limit: int, skip_sequential: bool) -> None:
+    peer_ids: List[int] = list(range(100_000_000, 100_000_000 + recipients))
+    forbidden: set = set(peer_ids[::50])
+
+    api_context = FakeAPIContext(latency, rate_limit, forbidden)
+    report: DeliveryReport = await Broadcaster(api_context, rate=rate_limit).broadcast(
+        peer_ids, message="Вы болеете?"
+    )
+    print(
+        f"broadcaster: {report.total} recipients, {len(report.delivered)} delivered,"
+        f" {len(report.failed)} failed, {api_context.messages.calls} calls, {report.elapsed:.2f}s"
+    )
+
+    if not skip_sequential:
+        api_context = FakeAPIContext(latency, rate_limit, forbidden)
+        elapsed: float = await sequential_send(api_context, peer_ids)
+        print(f"sequential:  {recipients} recipients, {api_context.messages.calls} calls, {elapsed:.2f}s")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--recipients", type=int, default=3000)
+    parser.add_argument("--latency", type=float, default=0.05, help="Задержка одного вызова API, с")
+    parser.add_argument("--rate-limit", type=int, default=20, help="Лимит вызовов в секунду")
+    parser.add_argument("--skip-sequential", action="store_true")
+    args = parser.parse_args()
+    asyncio.run(main(args.recipients, args.latency, args.rate_limit, args.skip_sequential))
@@ -0,0 +1,134 @@
+"""Холодный запуск: время от запуска процесса bot.py до первого обработанного события.
+
+Основной процесс поднимает FakeVKServer и --runs раз запускает bot.py в новом процессе
+с VK_API_URL, указывающим на имитацию: бот импортирует vkwave и свои модули, восстанавливает
+состояние из файлов, подключается к Long Poll и готовит клиенты в фоне, как в работе.
+Как только бот запросил сервер Long Poll, ему приходит "!report"; событие считается
+обработанным, когда ответ бота дошел до FakeVKServer. Затем бот останавливается по SIGTERM.
+Печатаются медианы этапов запуска из лога бота (StartupTimer) и время, измеренное
+основным процессом от запуска процесса до получения ответа.
+
+С --eager-imports pygsheets импортируется до bot.py, как до ленивой загрузки;
+с --no-prewarm бот не готовит клиенты в фоне (PREWARM=0).
+
+Запуск из корня репозитория:
+    python benchmarks/cold_start_benchmark.py --runs 5
+    python benchmarks/cold_start_benchmark.py --runs 5 --eager-imports
+"""
+import argparse
+import asyncio
+import os
+import re
+import signal
+import statistics
+import sys
+import tempfile
+import time
+from collections import defaultdict
+from typing import Dict, List, Tuple
+
+ROOT: str = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from loguru import logger
+
+from fake_vk import FakeVKServer
+
+BOT: str = os.path.join(ROOT, "bot.py")
+USER_ID: int = 100_000_001
+# Строка разбивки в логе бота: "  <этап>  +<длительность> ms  <время с запуска> ms"
+PHASE_LINE: re.Pattern = re.compile(r"^\s{2}(\S.*?)\s+\+\s*([\d.]+) ms\s+([\d.]+) ms$")
+
+
+def bot_command(eager_imports: bool) -> List[str]:
+    """Возвращает команду запуска бота."""
+    if not eager_imports:
+        return [sys.executable, BOT]
+    return [
+        sys.executable,
+        "-c",
+        f"import sys, runpy, pygsheets; sys.path.insert(0, {ROOT!r}); runpy.run_path({BOT!r}, run_name='__main__')",
+    ]
+
+
+def parse_breakdown(log: str) -> List[Tuple[str, float]]:
+    """Возвращает этапы запуска и время с запуска процесса (с) из лога бота."""
+    phases: List[Tuple[str, float]] = []
+    for line in log.split("Startup breakdown:", 1)[-1].splitlines():
+        match = PHASE_LINE.match(line)
+        if match:
+            phases.append((match.group(1), float(match.group(3)) / 1000))
+        elif phases:
+            break
+    return phases
+
+
+async def run_once(
+    server: FakeVKServer, state_dir: str, eager_imports: bool, prewarm: bool
+) -> Tuple[float, List[Tuple[str, float]]]:
+    """Запускает бота и возвращает время до ответа на первое событие и этапы запуска по логу бота."""
+    env: Dict[str, str] = dict(
+        os.environ,
+        TOKEN="fake",
+        VK_GROUP_ID=str(server.group_id),
+        VK_API_URL=server.url,
+        LOG_FILE="",
+        CONSOLE_LOG_LEVEL="INFO",
+        METRICS_LOG_INTERVAL="0",
+        PREWARM="1" if prewarm else "0",
+    )
+    connected: int = server.calls["groups.getLongPollServer"]
+    started_at: float = time.perf_counter()
+    process: asyncio.subprocess.Process = await asyncio.create_subprocess_exec(
+        *bot_command(eager_imports), cwd=state_dir, env=env, stderr=asyncio.subprocess.PIPE
+    )
+    while server.calls["groups.getLongPollServer"] == connected:
+        if process.returncode is not None:
+            raise RuntimeError(f"bot.py exited with code {process.returncode}")
+        await asyncio.sleep(0.001)
+    server.push_message(USER_ID, "!report")
+    await server.inbox[USER_ID].get()
+    first_event: float = time.perf_counter() - started_at
+    # Разбивка пишется в лог сразу после ответа; SIGTERM останавливает бота штатно
+    await asyncio.sleep(0.2)
+    process.send_signal(signal.SIGTERM)
+    _, stderr = await process.communicate()
+    return first_event, parse_breakdown(stderr.decode(errors="replace"))
+
+
+async def main(runs: int, eager_imports: bool, prewarm: bool) -> None:
+    logger.remove()
+    server: FakeVKServer = FakeVKServer()
+    await server.start()
+    first_events: List[float] = []
+    phases: Dict[str, List[float]] = defaultdict(list)
+    with tempfile.TemporaryDirectory() as state_dir:
+        for _ in range(runs):
+            first_event, bot_phases = await run_once(server, state_dir, eager_imports, prewarm)
+            first_events.append(first_event)
+            for phase, elapsed in bot_phases:
+                phases[phase].append(elapsed)
+    await server.stop()
+
+    print(
+        f"runs: {runs}, {'eager' if eager_imports else 'lazy'} pygsheets import,"
+        f" prewarm {'on' if prewarm else 'off'}"
+    )
+    previous: float = 0.0
+    for phase, values in phases.items():
+        median: float = statistics.median(values)
+        print(f"  {phase:<28} +{(median - previous) * 1000:8.1f} ms  {median * 1000:8.1f} ms (median)")
+        previous = median
+    print(
+        f"process start -> first event handled: median {statistics.median(first_events) * 1000:.1f} ms,"
+        f" min {min(first_events) * 1000:.1f} ms, max {max(first_events) * 1000:.1f} ms"
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--eager-imports", action="store_true", help="Импортировать pygsheets до запуска бота")
+    parser.add_argument("--no-prewarm", action="store_true", help="Не готовить клиенты в фоне (PREWARM=0)")
+    args = parser.parse_args()
+    asyncio.run(main(args.runs, args.eager_imports, not args.no_prewarm))
@@ -0,0 +1,128 @@
+"""Пропускная способность обработки сообщений опроса (сообщений в секунду).
+
+Сравнивается перебор regex-фильтров исходных обработчиков с вложенными словарями
+bot.respondents и таблица переходов PollDispatcher.
+
+Запуск из корня репозитория:
+    python benchmarks/dispatcher_benchmark.py --respondents 5000
+"""
+import argparse
+import json
+import os
+import re
+import sys
+import time
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from poll_dispatcher import PollDispatcher
+from state_store import MemoryStateStore, PollStage, RespondentRecord
+
+POLL_DATE: str = "2021-12-19"
+# Ответы респондента на всех стадиях опроса, с payload кнопок как у VK
+ANSWERS: List[Tuple[str, Optional[Dict[str, str]]]] = [
+    ("Да", {"yes_no": "Да"}),
+    ("Будет", {"will_certificate": "Будет"}),
+    ("10.12.2021", None),
+    ("температура, кашель", None),
+    ("09.12.2021", None),
+]
+
+# Фильтры исходных обработчиков в порядке их регистрации
+LEGACY_FILTERS: List[Tuple[str, Callable[[str, Optional[Dict]], bool]]] = [
+    ("date", lambda text, payload: re.match(r"(\d{1,2}(\.|\\|\/)\d{1,2}(\.|\\|\/)\d{2,4})", text) is not None),
+    ("will_certificate", lambda text, payload: payload is not None and "will_certificate" in payload),
+    ("yes_no", lambda text, payload: payload is not None and "yes_no" in payload),
+    ("start", lambda text, payload: re.match(r"((!|\/)start (.*?) (https://docs.google.com/(.*?)))", text) is not None),
+    (
+        "symptoms",
+        lambda text, payload: re.match(
+            r"(^[^!\/](@|#)?[\d\w\s\W]+)|(^(?!\d{1,2}(\.|\\|\/)\d{1,2}(\.|\\|\/)\d{2,4})*$)", text
+        ) is not None,
+    ),
+]
+
+
+def legacy_handle(respondents: Dict[str, Dict], user_id: str, text: str, payload: Optional[Dict]) -> None:
+    """Упрощенная копия исходных обработчиков: перебор фильтров и цепочки поиска в словарях."""
+    for handler_name, check in LEGACY_FILTERS:
+        if check(text, payload):
+            break
+    else:
+        return
+    if user_id not in respondents:
+        return
+    stage = respondents[user_id][POLL_DATE]["poll_stage"]
+    if handler_name == "yes_no" and stage == PollStage.IN_PROGRESS:
+        respondents[user_id][POLL_DATE]["ill"] = True
+        respondents[user_id][POLL_DATE]["poll_stage"] = PollStage.WILL_CERTIFICATE
+    elif handler_name == "will_certificate" and stage == PollStage.WILL_CERTIFICATE:
+        respondents[user_id][POLL_DATE]["medical_certificate"] = True
+        respondents[user_id][POLL_DATE]["poll_stage"] = PollStage.CERTIFICATE_DATA
+    elif handler_name == "date":
+        if respondents[user_id][POLL_DATE]["poll_stage"] == PollStage.LAST_DAY_IN_UNIVERSATY:
+            respondents[user_id][POLL_DATE]["date_of_last_class_attendance"] = text
+            respondents[user_id][POLL_DATE]["poll_stage"] = PollStage.DONE
+        elif respondents[user_id][POLL_DATE]["poll_stage"] == PollStage.CERTIFICATE_DATA:
+            respondents[user_id][POLL_DATE]["medical_certificate_data"] = text
+            respondents[user_id][POLL_DATE]["poll_stage"] = PollStage.SYMPTOMS
+    elif handler_name == "symptoms" and stage == PollStage.SYMPTOMS:
+        respondents[user_id][POLL_DATE]["diagnosis"] = text
+        respondents[user_id][POLL_DATE]["poll_stage"] = PollStage.LAST_DAY_IN_UNIVERSATY
+
+
+def run_legacy(user_ids: List[str]) -> float:
+    respondents: Dict[str, Dict[str, Dict[str, Any]]] = {
+        user_id: {
+            POLL_DATE: {
+                "poll_stage": PollStage.IN_PROGRESS,
+                "ill": False,
+                "diagnosis": "",
+                "medical_certificate": False,
+                "medical_certificate_data": "",
+                "date_of_last_class_attendance": "",
+            }
+        }
+        for user_id in user_ids
+    }
+    started_at: float = time.perf_counter()
+    for text, payload in ANSWERS:
+        for user_id in user_ids:
+            legacy_handle(respondents, user_id, text, payload)
+    elapsed: float = time.perf_counter() - started_at
+    assert all(poll[POLL_DATE]["poll_stage"] == PollStage.DONE for poll in respondents.values())
+    return elapsed
+
+
+def run_dispatcher(user_ids: List[str]) -> float:
+    dispatcher: PollDispatcher = PollDispatcher(
+        lambda answers, payload_name: json.dumps([{payload_name: answer} for answer in answers])
+    )
+    store: MemoryStateStore = MemoryStateStore()
+    store.save_many(POLL_DATE, ((user_id, RespondentRecord()) for user_id in user_ids))
+    started_at: float = time.perf_counter()
+    for text, _ in ANSWERS:
+        for user_id in user_ids:
+            respondent: Optional[RespondentRecord] = store.get(user_id, POLL_DATE)
+            if respondent is not None:
+                dispatcher.dispatch(respondent, text)
+                store.save(user_id, POLL_DATE, respondent)
+    elapsed: float = time.perf_counter() - started_at
+    assert all(respondent.done for _, respondent in store.items(POLL_DATE))
+    return elapsed
+
+
+def main(respondents: int) -> None:
+    user_ids: List[str] = [str(100_000_000 + index) for index in range(respondents)]
+    messages: int = respondents * len(ANSWERS)
+    for name, run in (("regex filters", run_legacy), ("PollDispatcher", run_dispatcher)):
+        elapsed: float = run(user_ids)
+        print(f"{name:>14}: {messages} messages in {elapsed:.3f}s, {messages / elapsed:,.0f} msg/s")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--respondents", type=int, default=5000)
+    args = parser.parse_args()
+    main(args.respondents)
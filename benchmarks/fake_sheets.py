@@ -0,0 +1,42 @@
+"""Имитация записи в Google Sheet для нагрузочного тестирования без сервисного аккаунта."""
+import os
+import sys
+import threading
+import time
+from typing import Dict, List, Union
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from googlesheet_inserter import GoogleSheetInserter
+
+
+class FakeGoogleSheetInserter(GoogleSheetInserter):
+    """GoogleSheetInserter, который хранит строки в памяти вместо Google Sheet.
+    Каждая вставка пачки занимает latency секунд, как запрос к Sheets API.
+    """
+
+    def __init__(self, latency: float = 0.0) -> None:
+        """Инициализирует класс.
+        Args:
+            latency (float): Длительность одной вставки пачки строк, в секундах.
+        Returns:
+        """
+        super().__init__()
+        self.latency = latency
+        self.calls: int = 0
+        self.rows: Dict[str, List[List[Union[str, bool]]]] = {}
+        self._rows_lock = threading.Lock()
+
+    @property
+    def rows_written(self) -> int:
+        """Возвращает количество записанных строк во всех таблицах."""
+        return sum(len(rows) for rows in self.rows.values())
+
+    def insert_rows(
+        self, rows: List[List[Union[str, bool]]], googlesheet_file_url: str = ""
+    ) -> bool:
+        time.sleep(self.latency)
+        with self._rows_lock:
+            self.calls += 1
+            self.rows.setdefault(googlesheet_file_url or self.googlesheet_file_url, []).extend(rows)
+        return True
@@ -0,0 +1,240 @@
+"""Локальная имитация VK API для нагрузочного тестирования бота без токена и сети.
+
+Сервер отвечает на groups.getLongPollServer, groups.getLongPollSettings, groups.getById,
+messages.send (peer_id и peer_ids), users.get и на запросы Bots Long Poll (act=a_check),
+поэтому с ним работает и сам bot.py (VK_API_URL). Сообщения участников
+добавляются в Long Poll через push_message, ответы бота складываются в inbox.
+"""
+import asyncio
+import time
+from collections import defaultdict
+from typing import Any, Dict, List, Optional
+
+import aiohttp
+from aiohttp import web
+from vkwave.api.methods._error import APIError
+
+# События Long Poll в ответе groups.getLongPollSettings (все поля обязательны в моделях vkwave)
+LONG_POLL_EVENTS: List[str] = (
+    "audio_new board_post_delete board_post_edit board_post_new board_post_restore group_change_photo"
+    " group_change_settings group_join group_leave group_officers_edit market_comment_delete"
+    " market_comment_edit market_comment_new market_comment_restore message_allow message_deny"
+    " message_new message_read message_reply message_typing_state message_edit photo_comment_delete"
+    " photo_comment_edit photo_comment_new photo_comment_restore photo_new poll_vote_new user_block"
+    " user_unblock video_comment_delete video_comment_edit video_comment_new video_comment_restore"
+    " video_new wall_post_new wall_reply_delete wall_reply_edit wall_reply_new wall_reply_restore wall_repost"
+).split()
+
+
+class FakeVKServer:
+    """HTTP сервер, имитирующий методы VK API и Bots Long Poll."""
+
+    def __init__(self, latency: float = 0.0, rate_limit: int = 0, group_id: int = 1) -> None:
+        """Инициализирует класс.
+        Args:
+            latency (float): Задержка ответа на вызов метода API, в секундах.
+            rate_limit (int): Лимит вызовов методов в секунду (ошибка 6), 0 - без лимита.
+            group_id (int): id сообщества, от имени которого работает бот.
+        Returns:
+        """
+        self.latency = latency
+        self.rate_limit = rate_limit
+        self.group_id = group_id
+        self.calls: Dict[str, int] = defaultdict(int)
+        # Сообщения бота по id получателя
+        self.inbox: Dict[int, asyncio.Queue] = defaultdict(asyncio.Queue)
+        self._updates: List[Dict[str, Any]] = []
+        self._ts: int = 1
+        self._new_updates: asyncio.Event = asyncio.Event()
+        self._window_start: float = time.monotonic()
+        self._window_calls: int = 0
+        self._message_id: int = 0
+        self._runner: Optional[web.AppRunner] = None
+        self.url: str = ""
+
+    async def start(self, host: str = "127.0.0.1", port: int = 0) -> str:
+        """Запускает сервер и возвращает его адрес."""
+        app: web.Application = web.Application()
+        app.router.add_post("/method/{method}", self._method_handler)
+        app.router.add_post("/long-poll", self._long_poll_handler)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        site: web.TCPSite = web.TCPSite(self._runner, host, port)
+        await site.start()
+        bound_port: int = site._server.sockets[0].getsockname()[1]
+        self.url = f"http://{host}:{bound_port}"
+        return self.url
+
+    async def stop(self) -> None:
+        """Останавливает сервер."""
+        # Ожидающие запросы Long Poll завершаются сразу, а не через wait секунд
+        self._new_updates.set()
+        if self._runner is not None:
+            await self._runner.cleanup()
+
+    def push_message(self, from_id: int, text: str) -> None:
+        """Добавляет в Long Poll событие message_new от пользователя."""
+        self._updates.append(
+            {
+                "type": "message_new",
+                "group_id": self.group_id,
+                "object": {
+                    "message": {
+                        "date": int(time.time()),
+                        "from_id": from_id,
+                        "peer_id": from_id,
+                        "id": 0,
+                        "out": 0,
+                        "text": text,
+                    },
+                    "client_info": {},
+                },
+            }
+        )
+        self._ts += 1
+        self._new_updates.set()
+
+    def _rate_limited(self) -> bool:
+        if not self.rate_limit:
+            return False
+        now: float = time.monotonic()
+        if now - self._window_start >= 1:
+            self._window_start, self._window_calls = now, 0
+        self._window_calls += 1
+        return self._window_calls > self.rate_limit
+
+    def _deliver(self, peer_id: int, params: Dict[str, str]) -> int:
+        self._message_id += 1
+        self.inbox[peer_id].put_nowait(
+            {"text": params.get("message", ""), "keyboard": params.get("keyboard")}
+        )
+        return self._message_id
+
+    def _call(self, method: str, params: Dict[str, str]) -> Any:
+        """Выполняет метод API и возвращает поле response."""
+        if method == "groups.getLongPollServer":
+            return {"server": f"{self.url}/long-poll", "key": "fake", "ts": str(self._ts)}
+        if method == "groups.getLongPollSettings":
+            return {
+                "is_enabled": True,
+                "api_version": "5.131",
+                "events": {event: int(event == "message_new") for event in LONG_POLL_EVENTS},
+            }
+        if method == "groups.getById":
+            return [{"id": self.group_id, "name": "Fake", "screen_name": f"club{self.group_id}", "type": "group"}]
+        if method == "messages.send":
+            if "peer_ids" in params:
+                return [
+                    {"peer_id": int(peer_id), "message_id": self._deliver(int(peer_id), params)}
+                    for peer_id in params["peer_ids"].split(",")
+                ]
+            return self._deliver(int(params["peer_id"]), params)
+        if method == "users.get":
+            return [
+                {"id": int(user_id), "first_name": "Имя", "last_name": f"Фамилия{user_id}"}
+                for user_id in params.get("user_ids", "").split(",")
+                if user_id
+            ]
+        raise KeyError(method)
+
+    async def _method_handler(self, request: web.Request) -> web.Response:
+        method: str = request.match_info["method"]
+        params: Dict[str, str] = {**request.query, **(await request.post())}
+        self.calls[method] += 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        if self._rate_limited():
+            return web.json_response(
+                {"error": {"error_code": 6, "error_msg": "Too many requests per second"}}
+            )
+        try:
+            return web.json_response({"response": self._call(method, params)})
+        except KeyError:
+            return web.json_response({"error": {"error_code": 3, "error_msg": "Unknown method passed"}})
+
+    async def _long_poll_handler(self, request: web.Request) -> web.Response:
+        ts: int = int(request.query.get("ts", self._ts))
+        wait: float = float(request.query.get("wait", 25))
+        first_ts: int = self._ts - len(self._updates)
+        if ts >= self._ts:
+            self._new_updates.clear()
+            try:
+                await asyncio.wait_for(self._new_updates.wait(), wait)
+            except asyncio.TimeoutError:
+                pass
+        updates: List[Dict[str, Any]] = self._updates[max(0, ts - first_ts):]
+        # Отданные события больше не нужны
+        del self._updates[: max(0, ts - first_ts)]
+        return web.json_response({"ts": str(self._ts), "updates": updates})
+
+
+class FakeAPIContext:
+    """Клиент VK API с интерфейсом api_context (api_context.messages.send(...)),
+    который отправляет запросы на FakeVKServer по HTTP.
+    """
+
+    def __init__(self, base_url: str, session: aiohttp.ClientSession) -> None:
+        """Инициализирует класс.
+        Args:
+            base_url (str): Адрес FakeVKServer.
+            session (aiohttp.ClientSession): HTTP сессия.
+        Returns:
+        """
+        self.base_url = base_url
+        self.session = session
+
+    def __getattr__(self, category: str) -> "_Category":
+        return _Category(self, category)
+
+    async def call(self, method: str, **params: Any) -> Dict[str, Any]:
+        """Вызывает метод API и возвращает ответ целиком (как return_raw_response=True)."""
+        params.pop("return_raw_response", None)
+        form: Dict[str, str] = {
+            name: ",".join(map(str, value)) if isinstance(value, (list, tuple)) else str(value)
+            for name, value in params.items()
+            if value is not None
+        }
+        async with self.session.post(f"{self.base_url}/method/{method}", data=form) as response:
+            data: Dict[str, Any] = await response.json()
+        if "error" in data:
+            raise APIError(data["error"]["error_code"], data["error"]["error_msg"], form)
+        return data
+
+
+class _Category:
+    def __init__(self, api_context: FakeAPIContext, category: str) -> None:
+        self._api_context = api_context
+        self._category = category
+
+    def __getattr__(self, name: str):
+        method: str = f"{self._category}.{name}"
+
+        async def call(**params: Any) -> Dict[str, Any]:
+            return await self._api_context.call(method, **params)
+
+        return call
+
+
+class FakeLongPoll:
+    """Получение событий Bots Long Poll с FakeVKServer (как SimpleLongPollBot)."""
+
+    def __init__(self, api_context: FakeAPIContext, group_id: int, wait: int = 25) -> None:
+        self.api_context = api_context
+        self.group_id = group_id
+        self.wait = wait
+
+    async def listen(self):
+        """Перебирает события message_new бесконечно."""
+        server: Dict[str, str] = (
+            await self.api_context.groups.getLongPollServer(group_id=self.group_id)
+        )["response"]
+        ts: str = server["ts"]
+        while True:
+            async with self.api_context.session.post(
+                f"{server['server']}?act=a_check&key={server['key']}&ts={ts}&wait={self.wait}"
+            ) as response:
+                data: Dict[str, Any] = await response.json()
+            ts = data["ts"]
+            for update in data["updates"]:
+                if update["type"] == "message_new":
+                    yield update["object"]["message"]
@@ -0,0 +1,199 @@
+"""Нагрузочный тест опроса без VK и Google: N участников проходят опрос целиком.
+
+Поднимается локальный FakeVKServer (VK API и Bots Long Poll), результаты пишутся
+в FakeGoogleSheetInserter. События обрабатывает HealthPollBot из bot.py: vkwave получает
+их через Long Poll имитации (VK_API_URL) и передает обработчикам бота, как в работе.
+Опрос запускается командой !start от INITIATOR_ID. Каждый участник отвечает "Да" -> "Будет" -> дата справки -> симптомы -> последний день
+на занятиях, дожидаясь ответа бота на предыдущее сообщение.
+
+Задержка ответа - время от появления сообщения участника в Long Poll
+до получения им следующего вопроса. Все время теста работает LoopLagMonitor:
+в конце печатаются задержки эвентлупа и число зависаний дольше --lag-threshold.
+С --state-dir состояние, журнал сообщений и кэш имен пишутся в файлы, как в боте.
+
+Запуск из корня репозитория:
+    python benchmarks/load_test.py --respondents 1000 --api-latency 0.02 --sheet-latency 0.5
+    python benchmarks/load_test.py --respondents 5000 --state-dir /tmp/poll --lag-threshold 0.1 --uvloop
+"""
+import argparse
+import asyncio
+import logging
+import os
+import sys
+import tempfile
+import time
+from typing import List
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from loguru import logger
+from vkwave.bots import create_api_session_aiohttp
+
+import config
+from fake_sheets import FakeGoogleSheetInserter
+from fake_vk import FakeVKServer
+from bot import HealthPollBot
+from broadcaster import Broadcaster
+from googlesheet_queue import GoogleSheetWriteQueue
+from metrics import LOOP_LAG_SECONDS
+from name_resolver import NameResolver
+from outbox import Outbox
+from poll_service import PollService
+from runtime import LoopLagMonitor, install_blocking_executor
+from state_store import MemoryStateStore, SQLiteStateStore
+from vk_client import VKAPIClient
+
+GOOGLESHEET_FILE_URL: str = "https://docs.google.com/spreadsheets/d/load-test"
+INITIATOR_ID: int = 1
+# Ответы участника на вопросы IS_ILL, WILL_CERTIFICATE, CERTIFICATE_DATA, SYMPTOMS, LAST_DAY_IN_UNIVERSATY
+ANSWERS: List[str] = ["Да", "Будет", "10.12.2021", "температура, кашель", "09.12.2021"]
+
+
+def percentile(sorted_values: List[float], fraction: float) -> float:
+    """Возвращает перцентиль отсортированного списка."""
+    if not sorted_values:
+        return 0.0
+    return sorted_values[min(len(sorted_values) - 1, int(fraction * len(sorted_values)))]
+
+
+async def respondent(
+    server: FakeVKServer, user_id: int, think_time: float, delivered: List[float], latencies: List[float]
+) -> None:
+    """Проходит опрос за одного участника: ждет вопрос и отвечает на него."""
+    inbox: asyncio.Queue = server.inbox[user_id]
+    await inbox.get()
+    delivered.append(time.perf_counter())
+    for text in ANSWERS:
+        if think_time:
+            await asyncio.sleep(think_time)
+        sent_at: float = time.perf_counter()
+        server.push_message(user_id, text)
+        await inbox.get()
+        latencies.append(time.perf_counter() - sent_at)
+
+
+async def main(
+    respondents: int,
+    api_latency: float,
+    sheet_latency: float,
+    think_time: float,
+    batch_size: int,
+    flush_interval: float,
+    state_dir: str,
+    lag_threshold: float,
+) -> None:
+    logger.remove()
+    # Long Poll vkwave пишет об обрыве соединения, когда FakeVKServer останавливается
+    logging.getLogger("vkwave").setLevel(logging.CRITICAL)
+    install_blocking_executor(8)
+    loop_monitor: LoopLagMonitor = LoopLagMonitor(threshold=lag_threshold)
+    await loop_monitor.start()
+    if state_dir:
+        os.makedirs(state_dir, exist_ok=True)
+        for name in os.listdir(state_dir):
+            os.remove(os.path.join(state_dir, name))
+    server: FakeVKServer = FakeVKServer(latency=api_latency)
+    await server.start()
+    user_ids: List[int] = list(range(100_000_000, 100_000_000 + respondents))
+    with tempfile.NamedTemporaryFile("w", suffix=".txt", delete=False, encoding="UTF-8") as roster:
+        roster.write("\n".join(map(str, user_ids)))
+
+    # Метрики и наблюдение за эвентлупом бота не нужны: эвентлуп наблюдает сам тест
+    config.settings.update(METRICS_PORT=0, METRICS_LOG_INTERVAL=0, LOOP_LAG_THRESHOLD=0, PREWARM=False)
+    client: VKAPIClient = VKAPIClient(server.url)
+    api_context = create_api_session_aiohttp("fake", client=client).api.get_context()
+    inserter: FakeGoogleSheetInserter = FakeGoogleSheetInserter(latency=sheet_latency)
+    broadcaster: Broadcaster = Broadcaster(api_context, rate=1000)
+    service: PollService = PollService(
+        api_context,
+        inserter,
+        state=SQLiteStateStore(os.path.join(state_dir, "poll-state.db")) if state_dir else MemoryStateStore(),
+        sheet_queue=GoogleSheetWriteQueue(inserter, batch_size=batch_size, flush_interval=flush_interval),
+        broadcaster=broadcaster,
+        names=NameResolver(api_context, cache_file=os.path.join(state_dir, "names-cache.json") if state_dir else ""),
+        outbox=Outbox(
+            api_context,
+            os.path.join(state_dir, "outbox.db") if state_dir else ":memory:",
+            workers=32,
+            bucket=broadcaster.bucket,
+        ),
+    )
+    bot: HealthPollBot = HealthPollBot(
+        tokens="fake", group_id=server.group_id, client=client, inserter=inserter, poll=service
+    )
+    await bot.run()
+    # Сообщения, пришедшие до подключения Long Poll, бот не увидит
+    await bot._wait_long_poll()
+
+    delivered: List[float] = []
+    latencies: List[float] = []
+    respondent_tasks: List[asyncio.Task] = [
+        asyncio.create_task(respondent(server, user_id, think_time, delivered, latencies)) for user_id in user_ids
+    ]
+    started_at: float = time.perf_counter()
+    server.push_message(INITIATOR_ID, f"!start {roster.name} {GOOGLESHEET_FILE_URL}")
+    await asyncio.gather(*respondent_tasks)
+    answered_at: float = time.perf_counter()
+    await bot.shutdown()
+    elapsed: float = time.perf_counter() - started_at
+    await server.stop()
+    await client.close()
+    await loop_monitor.close()
+    os.remove(roster.name)
+
+    latencies.sort()
+    done: int = sum(
+        respondent.done
+        for poll_session in service.sessions
+        for _, respondent in service.state.items(poll_session.poll_id)
+    )
+    print(f"respondents:  {respondents}, completed {done}")
+    print(f"broadcast:    {max(delivered) - started_at:.2f}s, {len(delivered)} delivered")
+    print(
+        f"answers:      {len(latencies)} in {answered_at - started_at:.2f}s,"
+        f" {len(latencies) / (answered_at - started_at):,.0f} msg/s"
+    )
+    print(
+        f"latency:      p50 {percentile(latencies, 0.5) * 1000:.1f}ms,"
+        f" p99 {percentile(latencies, 0.99) * 1000:.1f}ms,"
+        f" max {latencies[-1] * 1000 if latencies else 0:.1f}ms"
+    )
+    print(f"sheet rows:   {inserter.rows_written} in {inserter.calls} inserts, all flushed in {elapsed:.2f}s")
+    print(f"API calls:    {dict(server.calls)}")
+    lag_count, lag_mean = LOOP_LAG_SECONDS.summary()
+    print(
+        f"loop lag:     {lag_count} ticks, mean {lag_mean * 1000:.1f}ms, max {loop_monitor.max_lag * 1000:.1f}ms,"
+        f" stalls over {lag_threshold * 1000:.0f}ms: {len(loop_monitor.stalls)}"
+    )
+    for blocked_for, stack in loop_monitor.stalls:
+        print(f"stall {blocked_for * 1000:.0f}ms at:\n{stack.splitlines()[-2].strip()}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--respondents", type=int, default=1000)
+    parser.add_argument("--api-latency", type=float, default=0.02, help="Задержка одного вызова VK API, с")
+    parser.add_argument("--sheet-latency", type=float, default=0.5, help="Задержка одной вставки в Google Sheet, с")
+    parser.add_argument("--think-time", type=float, default=0.0, help="Пауза участника перед ответом, с")
+    parser.add_argument("--batch-size", type=int, default=50)
+    parser.add_argument("--flush-interval", type=float, default=5.0)
+    parser.add_argument("--state-dir", default="", help="Каталог для файлов состояния, по умолчанию в памяти")
+    parser.add_argument("--lag-threshold", type=float, default=0.1, help="Порог зависания эвентлупа, с")
+    parser.add_argument("--uvloop", action="store_true", help="Запустить на uvloop")
+    args = parser.parse_args()
+    if args.uvloop:
+        import uvloop
+
+        asyncio.set_event_loop_policy(uvloop.EventLoopPolicy())
+    asyncio.run(
+        main(
+            args.respondents,
+            args.api_latency,
+            args.sheet_latency,
+            args.think_time,
+            args.batch_size,
+            args.flush_interval,
+            args.state_dir,
+            args.lag_threshold,
+        )
+    )
@@ -0,0 +1,75 @@
+"""Стоимость подготовки клавиатуры к отправке: построение на каждое сообщение или готовая строка.
+
+Исходный бот строил Keyboard и сериализовал ее в JSON для каждого студента при рассылке
+и на каждый ответ. pollutils.get_keybord запоминает результат по ответам и имени payload.
+Для обоих вариантов печатаются время и пиковый объем памяти на одно сообщение,
+а также время подготовки клавиатур для рассылки N студентам.
+
+Запуск из корня репозитория:
+    python benchmarks/payload_benchmark.py --iterations 100000 --students 3000
+"""
+import argparse
+import os
+import sys
+import time
+import tracemalloc
+from typing import Callable, List, Tuple
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pollutils
+from poll_dispatcher import IS_ILL_ANSWERS, QUESTIONS
+from state_store import PollStage
+
+KEYBOARDS: List[Tuple[List[str], str]] = [
+    (IS_ILL_ANSWERS, "yes_no"),
+    (QUESTIONS[PollStage.WILL_CERTIFICATE][1], "will_certificate"),
+]
+
+
+def build_every_time(answers: List[str], payload_name: str) -> str:
+    """Клавиатура строится заново, как в исходном боте."""
+    return pollutils.build_keyboard.__wrapped__(tuple(answers), payload_name)
+
+
+def measure(name: str, build: Callable[[List[str], str], str], iterations: int, students: int) -> float:
+    """Печатает время и пиковую память на одно сообщение и возвращает время на сообщение."""
+    started_at: float = time.perf_counter()
+    for number in range(iterations):
+        answers, payload_name = KEYBOARDS[number % len(KEYBOARDS)]
+        build(answers, payload_name)
+    per_call: float = (time.perf_counter() - started_at) / iterations
+
+    tracemalloc.start()
+    peaks: List[int] = []
+    for answers, payload_name in KEYBOARDS:
+        tracemalloc.reset_peak()
+        baseline: int = tracemalloc.get_traced_memory()[0]
+        build(answers, payload_name)
+        peaks.append(tracemalloc.get_traced_memory()[1] - baseline)
+    tracemalloc.stop()
+
+    started_at = time.perf_counter()
+    for _ in range(students):
+        build(*KEYBOARDS[0])
+    broadcast: float = time.perf_counter() - started_at
+    print(
+        f"{name:<14} {per_call * 1e6:8.2f} us/message, peak {max(peaks):6,} B/message,"
+        f" {students} students {broadcast * 1000:8.2f} ms"
+    )
+    return per_call
+
+
+def main(iterations: int, students: int) -> None:
+    pollutils.build_keyboard.cache_clear()
+    uncached: float = measure("build per send", build_every_time, iterations, students)
+    cached: float = measure("memoized", pollutils.get_keybord, iterations, students)
+    print(f"speedup: x{uncached / cached:.0f}, cache: {pollutils.build_keyboard.cache_info()}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--iterations", type=int, default=100000)
+    parser.add_argument("--students", type=int, default=3000)
+    args = parser.parse_args()
+    main(args.iterations, args.students)
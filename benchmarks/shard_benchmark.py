@@ -0,0 +1,136 @@
+"""Пропускная способность многопроцессного режима (ShardedPollService) в зависимости от числа процессов.
+
+Для каждого числа процессов-обработчиков запускаются процессы FakeVKServer (по одному
+на обработчик, чтобы имитация VK не ограничивала результат), опрос рассылается N участникам,
+затем основной процесс передает все ответы участников (5 на участника) так быстро, как может.
+Время - от первого ответа до остановки обработчиков, когда все ответы бота отправлены
+в FakeVKServer, а все строки переданы в очередь Google Sheet.
+
+Запуск из корня репозитория:
+    python benchmarks/shard_benchmark.py --respondents 20000 --shards 1,2,4 --api-latency 0.005
+"""
+import argparse
+import asyncio
+import multiprocessing
+import os
+import sys
+import tempfile
+import time
+from typing import Any, Awaitable, Callable, List, Tuple
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import aiohttp
+from loguru import logger
+
+from fake_sheets import FakeGoogleSheetInserter
+from fake_vk import FakeAPIContext, FakeVKServer
+from broadcaster import Broadcaster
+from googlesheet_queue import GoogleSheetWriteQueue
+from name_resolver import NameResolver
+from outbox import Outbox
+from poll_service import PollService
+from roster import RosterLoader
+from sharding import ShardedPollService, SheetRowForwarder
+from state_store import MemoryStateStore
+
+GOOGLESHEET_FILE_URL: str = "https://docs.google.com/spreadsheets/d/shard-benchmark"
+# Ответы участника на вопросы IS_ILL, WILL_CERTIFICATE, CERTIFICATE_DATA, SYMPTOMS, LAST_DAY_IN_UNIVERSATY
+ANSWERS: List[str] = ["Да", "Будет", "10.12.2021", "температура, кашель", "09.12.2021"]
+
+
+def run_fake_vk(latency: float, urls: multiprocessing.Queue) -> None:
+    """Процесс FakeVKServer: сообщает свой адрес и работает до завершения процесса."""
+
+    async def serve() -> None:
+        server: FakeVKServer = FakeVKServer(latency=latency)
+        urls.put(await server.start())
+        await asyncio.Event().wait()
+
+    asyncio.run(serve())
+
+
+async def fake_shard_service(
+    index: int,
+    shard_count: int,
+    sheet_queue: SheetRowForwarder,
+    vk_urls: List[str],
+) -> Tuple[PollService, Callable[[], Awaitable[Any]]]:
+    """Фабрика сервиса опроса обработчика: VK API - свой FakeVKServer, состояние в памяти."""
+    logger.remove()
+    session: aiohttp.ClientSession = aiohttp.ClientSession(connector=aiohttp.TCPConnector(limit=0))
+    api_context: FakeAPIContext = FakeAPIContext(vk_urls[index % len(vk_urls)], session)
+    broadcaster: Broadcaster = Broadcaster(api_context, rate=100_000)
+    service: PollService = PollService(
+        api_context,
+        None,
+        state=MemoryStateStore(),
+        sheet_queue=sheet_queue,
+        broadcaster=broadcaster,
+        names=NameResolver(api_context),
+        outbox=Outbox(api_context, workers=32, bucket=broadcaster.bucket),
+        shard=(index, shard_count),
+    )
+    return service, session.close
+
+
+async def measure(shard_count: int, respondents: int, api_latency: float) -> None:
+    """Проводит опрос с shard_count обработчиками и печатает пропускную способность."""
+    context = multiprocessing.get_context("spawn")
+    urls: multiprocessing.Queue = context.Queue()
+    servers: List[multiprocessing.Process] = [
+        context.Process(target=run_fake_vk, args=(api_latency, urls), daemon=True) for _ in range(shard_count)
+    ]
+    for server in servers:
+        server.start()
+    loop = asyncio.get_running_loop()
+    vk_urls: List[str] = [await loop.run_in_executor(None, urls.get) for _ in servers]
+
+    user_ids: List[str] = [str(user_id) for user_id in range(100_000_000, 100_000_000 + respondents)]
+    with tempfile.NamedTemporaryFile("w", suffix=".txt", delete=False, encoding="UTF-8") as roster:
+        roster.write("\n".join(user_ids))
+
+    inserter: FakeGoogleSheetInserter = FakeGoogleSheetInserter(latency=0)
+    service: ShardedPollService = ShardedPollService(
+        GoogleSheetWriteQueue(inserter, batch_size=500, flush_interval=0.5),
+        shard_count,
+        # В списке только числовые id, VK API для коротких имен не нужен
+        RosterLoader(None),
+        factory=fake_shard_service,
+        factory_args=(vk_urls,),
+        drain_timeout=600,
+    )
+    await service.start()
+    _, delivery_report = await service.start_poll(roster.name, GOOGLESHEET_FILE_URL, initiator_id="1")
+
+    started_at: float = time.perf_counter()
+    for text in ANSWERS:
+        for number, user_id in enumerate(user_ids):
+            await service.handle_answer(user_id, text)
+            if number % 1000 == 999:
+                # Пачки уходят обработчикам раз за итерацию эвентлупа
+                await asyncio.sleep(0)
+    await service.close()
+    elapsed: float = time.perf_counter() - started_at
+
+    for server in servers:
+        server.terminate()
+    os.remove(roster.name)
+    messages: int = respondents * len(ANSWERS)
+    print(
+        f"shards {shard_count}: {messages} answers in {elapsed:.2f}s, {messages / elapsed:,.0f} msg/s;"
+        f" broadcast {len(delivery_report.delivered)}/{delivery_report.total},"
+        f" sheet rows {inserter.rows_written}"
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--respondents", type=int, default=20000)
+    parser.add_argument("--shards", default="1,2,4", help="Количество обработчиков через запятую")
+    parser.add_argument("--api-latency", type=float, default=0.005, help="Задержка одного вызова VK API, с")
+    args = parser.parse_args()
+    logger.remove()
+    print(f"CPU cores: {os.cpu_count()}")
+    for shards in map(int, args.shards.split(",")):
+        asyncio.run(measure(shards, args.respondents, args.api_latency))
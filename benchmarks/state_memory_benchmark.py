@@ -0,0 +1,79 @@
+"""Память, занимаемая состоянием респондентов: словари bot.respondents против RespondentRecord.
+
+Запуск из корня репозитория:
+    python benchmarks/state_memory_benchmark.py --students 10000 --days 60
+"""
+import argparse
+import gc
+import os
+import sys
+import tracemalloc
+from datetime import date, timedelta
+from typing import Any, Callable, Dict, List
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from state_store import MemoryStateStore, PollStage, RespondentRecord
+
+
+def poll_dates(days: int) -> List[str]:
+    first_day: date = date(2021, 9, 1)
+    return [(first_day + timedelta(days=day)).strftime("%Y-%m-%d") for day in range(days)]
+
+
+def build_nested_dicts(user_ids: List[str], dates: List[str]) -> Dict[str, Dict]:
+    """Состояние в формате исходного bot.respondents."""
+    respondents: Dict[str, Dict] = {}
+    for poll_date in dates:
+        for user_id in user_ids:
+            respondents.setdefault(user_id, {})[poll_date] = {
+                "poll_stage": PollStage.IN_PROGRESS,
+                "ill": False,
+                "diagnosis": "",
+                "medical_certificate": False,
+                "medical_certificate_data": "",
+                "date_of_last_class_attendance": "",
+            }
+    return respondents
+
+
+def build_state_store(user_ids: List[str], dates: List[str], keep_days: int = 0) -> MemoryStateStore:
+    store: MemoryStateStore = MemoryStateStore()
+    for poll_date in dates:
+        store.save_many(poll_date, ((user_id, RespondentRecord()) for user_id in user_ids))
+        if keep_days:
+            store.evict_before(dates[max(0, dates.index(poll_date) - keep_days + 1)])
+    return store
+
+
+def measure(build: Callable[[], Any]) -> float:
+    """Возвращает объем памяти (МБ), занятый результатом build."""
+    gc.collect()
+    tracemalloc.start()
+    result = build()
+    gc.collect()
+    current, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del result
+    return current / 1024 / 1024
+
+
+def main(students: int, days: int, keep_days: int) -> None:
+    user_ids: List[str] = [str(100_000_000 + index) for index in range(students)]
+    dates: List[str] = poll_dates(days)
+    print(f"{students} students x {days} poll days")
+    print(f"dict per respondent:      {measure(lambda: build_nested_dicts(user_ids, dates)):8.1f} MB")
+    print(f"RespondentRecord:         {measure(lambda: build_state_store(user_ids, dates)):8.1f} MB")
+    print(
+        f"RespondentRecord, {keep_days:>2} days: "
+        f"{measure(lambda: build_state_store(user_ids, dates, keep_days)):8.1f} MB"
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--students", type=int, default=10000)
+    parser.add_argument("--days", type=int, default=60)
+    parser.add_argument("--keep-days", type=int, default=14, help="Срок хранения опросов при вытеснении")
+    args = parser.parse_args()
+    main(args.students, args.days, args.keep_days)
@@ -1,53 +1,58 @@
 import uuid
+import signal
+import asyncio
 import config
 import pollutils
-from datetime import datetime
-from enum import Enum, auto
-from typing import Dict, List, Optional, Union, Any
-from vkwave.bots import SimpleLongPollBot, SimpleBotEvent
+from datetime import datetime, timedelta
+from typing import Awaitable, Callable, Dict, List, Optional, Union, Any
+from vkwave.bots import SimpleLongPollBot, SimpleBotEvent, create_api_session_aiohttp
 from vkwave.bots.core.dispatching.router.router import BaseRouter
-from vkwave.api.methods._error import APIError
+from vkwave.client import AIOHTTPClient
 from loguru import logger
 from googlesheet_inserter import GoogleSheetInserter
+from googlesheet_queue import GoogleSheetWriteQueue
+from broadcaster import Broadcaster
+from state_store import PollStage, create_state_store
+from poll_dispatcher import PollDispatcher, PollReply, QUESTIONS, START_COMMAND_PATTERN
+from poll_service import PollService
+from sharding import ShardedPollService
+from name_resolver import NameResolver
+from callback_server import CallbackServer
+from roster import RosterLoader
+from outbox import Outbox
+from vk_client import create_vk_client
+from poll_report import REPORT_COMMAND_PATTERN
+from metrics import HANDLER_SECONDS, log_summary, start_metrics_server
+from runtime import LoopLagMonitor, StartupTimer, configure_logging, install_blocking_executor, uvloop_available
 
-logger.add(
-    config.settings["LOG_FILE"],
-    format="{time} {level} {message}",
-    level="DEBUG",
-    rotation="1 week",
-    compression="zip",
+# Время запуска считается от старта процесса: этапы отмечаются по ходу запуска,
+# разбивка пишется в лог после первого обработанного события
+startup: StartupTimer = StartupTimer()
+startup.mark("imports")
+configure_logging(
+    config.settings["CONSOLE_LOG_LEVEL"], config.settings["LOG_FILE"], config.settings["LOG_LEVEL"]
 )
+startup.mark("logging")
+
+Answer = Callable[..., Awaitable[Any]]
 
 
 class HealthPollBot(SimpleLongPollBot):
     """Класс для опроса состояния здоровья студентов ВК.
+    Обработчики команд и ответов регистрируются при создании бота, поэтому любой
+    экземпляр (в том числе в benchmarks/load_test.py) обрабатывает события одинаково.
     Attr: 
-        current_date (str): Дата опроса.
+        poll (PollService): Логика опроса: идущие опросы, состояние участников, запись результатов.
     """
     
-    class PollStage(Enum):
-        """Стадии опроса."""
-        
-        WILL_CERTIFICATE = auto()
-        CERTIFICATE_DATA = auto()
-        SYMPTOMS = auto()
-        LAST_DAY_IN_UNIVERSATY = auto()
-        DONE = auto()
-        IN_PROGRESS = auto()
-        IS_ILL = auto()
+    # Стадии опроса
+    PollStage = PollStage
         
     # Словарь с вопросами, где стадии соответствует вопрос
-    question: Dict[PollStage, Union[str, List[Any]]] = {
-        PollStage.WILL_CERTIFICATE: [
-            "Будет ли справка",
-            ["Будет", "Нет, буду лечиться дома"],
-        ],
-        PollStage.CERTIFICATE_DATA: "От какого числа будет справка? Например, 10.11.2021 (только в таком формате)",
-        PollStage.SYMPTOMS: "Опишите ваши симптомы, через символ. Например, температура, кашель, болит горло",
-        PollStage.LAST_DAY_IN_UNIVERSATY: "Какого числа были последний день на занятиях? Например, 10.11.2021 (только в таком формате)",
-        PollStage.DONE: "Спасибо, что прошли опрос. В случае ошибки или возникновения вопросов, пишите https://vk.com/me_lnikov",
-        PollStage.IS_ILL: "Вы болеете?"
-    }
+    question: Dict[PollStage, Union[str, List[Any]]] = QUESTIONS
+
+    # Сколько ждать подключения к Long Poll перед подготовкой клиентов, в секундах
+    LONG_POLL_CONNECT_TIMEOUT: float = 10.0
 
     def __init__(
         self,
@@ -55,8 +60,10 @@ class HealthPollBot(SimpleLongPollBot):
         group_id:str|int,
         router: Optional[BaseRouter] = None,
         uvloop: bool = False,
-        respondents: Dict[str, Dict] = None,
+        client: Optional[AIOHTTPClient] = None,
         inserter:GoogleSheetInserter = None,
+        poll: PollService = None,
+        startup: Optional[StartupTimer] = None,
     ) -> None:
         """Инициализирует класс.
         Args:
@@ -64,259 +71,318 @@ class HealthPollBot(SimpleLongPollBot):
             group_id (str|int): id публичной страницы ВКонтакте от имени которой опрос.
             router (Optional[BaseRouter]): Роутер для маршрутизации бота.
             uvloop (bool): Внешний эвентлуп.
-            respondents (Dict[str, Dict]): Список id участников опроса.
+            client (Optional[AIOHTTPClient]): HTTP клиент VK API, по умолчанию vkwave (api.vk.com).
             inserter (GoogleSheetInserter): Агрегат для вставки данных в Google Sheet.
+            poll (PollService): Логика опроса с настройками из config (см. create_bot), если не
+                задана - с хранилищем состояния в памяти. В многопроцессном режиме -
+                ShardedPollService с тем же интерфейсом.
+            startup (Optional[StartupTimer]): Замер этапов запуска, по умолчанию от создания бота.
         Returns:
         """
-        super().__init__(tokens, group_id=group_id, router=router, uvloop=uvloop)
-        self.current_date: str = ""
-        self.respondents = respondents if respondents else dict()
+        super().__init__(tokens, group_id=group_id, router=router, uvloop=uvloop, client=client)
         self._inserter: GoogleSheetInserter = inserter
+        self.poll: PollService = poll if poll is not None else PollService(self.api_context, inserter)
+        self.loop_monitor: Optional[LoopLagMonitor] = None
+        self.startup: StartupTimer = startup if startup else StartupTimer()
+        self.message_handler(self.regex_filter(START_COMMAND_PATTERN.pattern))(self.start_handler)
+        self.message_handler(self.regex_filter(REPORT_COMMAND_PATTERN.pattern))(self.report_handler)
+        self.message_handler()(self.poll_handler)
 
-    @property
-    def poll_googlesheet_credence_service_file(self) -> str:
-        """Возвращает сервисный файл Google API."""
-        return self._inserter.credence_service_file
-    
-    @poll_googlesheet_credence_service_file.setter
-    def poll_googlesheet_credence_service_file(self, credence_service_file: str) -> None:
-        """Устанавливает сервисный файл Google API."""
-        self._inserter.credence_service_file = credence_service_file
+    async def _start_background_tasks(self) -> None:
+        """Запускает запись результатов опроса, метрики и наблюдение за эвентлупом."""
+        install_blocking_executor(config.settings["BLOCKING_IO_THREADS"])
+        if config.settings["LOOP_LAG_THRESHOLD"]:
+            self.loop_monitor = LoopLagMonitor(threshold=config.settings["LOOP_LAG_THRESHOLD"])
+            await self.loop_monitor.start()
+        await self.poll.start()
+        if config.settings["METRICS_PORT"]:
+            await start_metrics_server(config.settings["METRICS_HOST"], config.settings["METRICS_PORT"])
+        if config.settings["METRICS_LOG_INTERVAL"]:
+            asyncio.create_task(log_summary(config.settings["METRICS_LOG_INTERVAL"]))
+        self.startup.mark("background tasks")
 
-    @property
-    def pollresult_googlesheet_file_url(self) -> str:
-        """Возвращает ссылку на Google документ."""
-        return self._inserter.googlesheet_file_url
-    
-    @pollresult_googlesheet_file_url.setter
-    def pollresult_googlesheet_file_url(self, googlesheet_file_url: str) -> None:
-        """Устанавливает ссылку на Google документ."""
-        self._inserter.googlesheet_file_url = googlesheet_file_url
+    async def _wait_long_poll(self) -> bool:
+        """Ждет, пока Long Poll получит адрес сервера событий (первый запрос к VK выполнен).
+        Returns:
+            bool: True, если Long Poll подключился за LONG_POLL_CONNECT_TIMEOUT секунд.
+        """
+        deadline: float = asyncio.get_running_loop().time() + self.LONG_POLL_CONNECT_TIMEOUT
+        while not self._lp.lp.data.key:
+            if asyncio.get_running_loop().time() >= deadline:
+                return False
+            await asyncio.sleep(0.05)
+        self.startup.mark("long poll connected")
+        return True
 
+    async def _warm_up(self, wait_for_long_poll: bool = True) -> None:
+        """Готовит в фоне соединение с VK API и клиент Google Sheet, чтобы первые ответы
+        студентам и первая запись результатов не ждали соединения, импорта и авторизации.
+        Args:
+            wait_for_long_poll (bool): Начинать после подключения Long Poll, чтобы не задерживать его.
+        Returns:
+        """
+        if wait_for_long_poll:
+            await self._wait_long_poll()
+        loop = asyncio.get_running_loop()
+        warm_ups: List[Awaitable[bool]] = [
+            self.startup.warm_up("vk session", self.api_context.groups.get_by_id(group_id=str(self.group_id))),
+        ]
+        if self._inserter is not None:
+            warm_ups.append(
+                self.startup.warm_up("google sheets client", loop.run_in_executor(None, self._inserter.warm_up))
+            )
+        await asyncio.gather(*warm_ups)
 
-bot: HealthPollBot = HealthPollBot(
-    tokens=config.settings["TOKEN"],
-    group_id=config.settings["VK_GROUP_ID"],
-    inserter=GoogleSheetInserter(),
-)
-bot.poll_googlesheet_credence_service_file = config.settings["CREDS_FILE"]
+    async def run(self, ignore_errors: bool = True) -> None:
+        """Запускает фоновые задачи бота и получение событий через Long Poll."""
+        loop = asyncio.get_running_loop()
+        loop.add_signal_handler(signal.SIGTERM, loop.stop)
+        await self._start_background_tasks()
+        await super().run(ignore_errors)
+        if config.settings["PREWARM"]:
+            asyncio.create_task(self._warm_up())
 
+    async def run_callback(self, handler: Callable[[Dict[str, Any]], Awaitable[None]]) -> None:
+        """Запускает фоновые задачи бота и получение событий через Callback API.
+        Args:
+            handler (Callable[[Dict[str, Any]], Awaitable[None]]): Обработчик события VK.
+        Returns:
+        """
+        stopped: asyncio.Event = asyncio.Event()
+        loop = asyncio.get_running_loop()
+        loop.add_signal_handler(signal.SIGTERM, stopped.set)
+        loop.add_signal_handler(signal.SIGINT, stopped.set)
+        await self._start_background_tasks()
+        server: CallbackServer = CallbackServer(
+            handler,
+            group_id=self.group_id,
+            confirmation_code=config.settings["CALLBACK_CONFIRMATION"],
+            secret=config.settings["CALLBACK_SECRET"],
+            workers=config.settings["CALLBACK_WORKERS"],
+            queue_size=config.settings["CALLBACK_QUEUE_SIZE"],
+        )
+        await server.start(
+            config.settings["CALLBACK_HOST"],
+            config.settings["CALLBACK_PORT"],
+            config.settings["CALLBACK_PATH"],
+        )
+        self.startup.mark("callback server")
+        if config.settings["PREWARM"]:
+            asyncio.create_task(self._warm_up(wait_for_long_poll=False))
+        await stopped.wait()
+        await server.close()
 
-@bot.message_handler(bot.regex_filter(r"(\d{1,2}(\.|\\|\/)\d{1,2}(\.|\\|\/)\d{2,4})"))
-async def date_handler(event: SimpleBotEvent) -> None:
-    """Обрабатывает вопрос про дату последнего посещения занятий."""
-    
-    user_id: str = str(event.object.object.message.from_id)
-    text_msg: str = event.object.object.message.text.strip()
-    print("Сообщение пользователя из обработчика date_handler: ", text_msg)
-    if user_id in bot.respondents:
-        if (
-            bot.respondents[user_id][bot.current_date]["poll_stage"]
-            == HealthPollBot.PollStage.LAST_DAY_IN_UNIVERSATY
-        ):
-            bot.respondents[user_id][bot.current_date][
-                "date_of_last_class_attendance"
-            ] = text_msg
-            if bot.respondents[user_id][bot.current_date]["diagnosis"]:
-                bot.respondents[user_id][bot.current_date][
-                    "poll_stage"
-                ] = HealthPollBot.PollStage.DONE
+    async def shutdown(self) -> None:
+        """Дописывает накопленные результаты опроса и логи перед остановкой бота."""
+        await self.poll.close()
+        if self.loop_monitor is not None:
+            await self.loop_monitor.close()
+        await logger.complete()
 
-                user_vk_profile_data: Dict[
-                    str, Optional[Union[str, int, list]]
-                ] = await bot.api_context.users.get(
-                    user_ids=[user_id], return_raw_response=True
+    async def start_poll(self, text_msg: str, initiator_id: str, answer: Answer) -> None:
+        """Организует начало опроса по команде !start.
+        Args:
+            text_msg (str): Текст команды.
+            initiator_id (str): id пользователя, отправившего команду.
+            answer (Answer): Корутина отправки ответа отправителю команды.
+        Returns:
+        """
+        with HANDLER_SECONDS.time(handler="start"):
+            path_to_file_with_respondents_ids, googlesheet_file_url = START_COMMAND_PATTERN.match(text_msg).groups()
+            try:
+                await self.poll.start_poll(
+                    path_to_file_with_respondents_ids,
+                    googlesheet_file_url,
+                    initiator_id=initiator_id,
                 )
-                full_name: str = pollutils.get_user_lastname_firstname(user_vk_profile_data)
-                bot._inserter.write_information_in_googlesheet(
-                        full_name,
-                        bot.respondents[user_id][bot.current_date],
-                        bot.current_date,
-                    )
-                try:
-                    await event.answer(
-                        message=HealthPollBot.question[HealthPollBot.PollStage.DONE]
-                    )
-                except APIError as send_error:
-                    logger.debug(f"{send_error.message}: Trouble id: {user_id}")
-                    return
-                except Exception as error:
-                    pass
-        elif (
-            bot.respondents[user_id][bot.current_date]["poll_stage"]
-            == HealthPollBot.PollStage.CERTIFICATE_DATA
-        ):
-            bot.respondents[user_id][bot.current_date][
-                "medical_certificate_data"
-            ] = text_msg
+            except EnvironmentError as file_error:
+                logger.debug(file_error)
+                await answer(f"{file_error}")
+        self.startup.finish("first event")
 
-        if (
-            bot.respondents[user_id][bot.current_date]["poll_stage"]
-            != HealthPollBot.PollStage.DONE
-        ):
-            bot.respondents[user_id][bot.current_date][
-                "poll_stage"
-            ] = HealthPollBot.PollStage.SYMPTOMS
+    async def send_report(self, text_msg: str, requester_id: str, answer: Answer) -> None:
+        """Отправляет итоги опросов дня по команде !report [YYYY-MM-DD].
+        Администраторы (ADMIN_IDS) получают итоги всех опросов дня, остальные - только запущенных ими.
+        Args:
+            text_msg (str): Текст команды.
+            requester_id (str): id пользователя, отправившего команду.
+            answer (Answer): Корутина отправки ответа отправителю команды.
+        Returns:
+        """
+        with HANDLER_SECONDS.time(handler="report"):
+            poll_date: str = REPORT_COMMAND_PATTERN.match(text_msg).group(1) or datetime.today().strftime("%Y-%m-%d")
+            is_admin: bool = requester_id in config.settings["ADMIN_IDS"]
             try:
-                await event.answer(
-                    message=HealthPollBot.question[HealthPollBot.PollStage.SYMPTOMS]
-                )
-            except APIError as send_error:
-                logger.debug(f"{send_error.message}: Trouble id: {user_id}")
+                reports: List[str] = await self.poll.report(poll_date, None if is_admin else requester_id)
+            except EnvironmentError as shard_error:
+                # Многопроцессный режим: процесс-обработчик не вернул итоги
+                logger.error(shard_error)
+                await answer(f"{shard_error}")
                 return
+            if not reports:
+                await answer(f"Нет опросов за {poll_date}")
+            for report in reports:
+                await answer(report)
+        self.startup.finish("first event")
 
+    async def answer_poll(self, user_id: str, text: str) -> None:
+        """Обрабатывает ответ респондента на текущий вопрос опроса.
+        Следующий вопрос отправляется через очередь исходящих сообщений и
+        будет доставлен, даже если VK сейчас недоступен или бот перезапустится.
+        Args:
+            user_id (str): id пользователя, приславшего сообщение.
+            text (str): Текст сообщения.
+        Returns:
+        """
+        with HANDLER_SECONDS.time(handler="poll"):
+            reply: Optional[PollReply] = await self.poll.handle_answer(user_id, text)
+            if reply is not None:
+                self.poll.outbox.send(int(user_id), reply.message, reply.keyboard)
+        self.startup.finish("first event")
 
-@bot.message_handler(bot.payload_contains_filter("will_certificate"))
-async def is_certificate_handler(event: SimpleBotEvent):
-    """Обрабатывает вопрос про справку о болезне."""
+    async def start_handler(self, event: SimpleBotEvent) -> None:
+        """Организует начало опроса."""
     
-    user_id: str = str(event.object.object.message.from_id)
-    text_msg: str = event.object.object.message.text.strip()
-    bot_msg: str = ""
-    print("Сообщение пользователя из обработчика is_certificate_handler: ", text_msg)
-    if user_id in bot.respondents:
-        if (
-            text_msg == "Будет"
-            and bot.respondents[user_id][bot.current_date]["poll_stage"]
-            == HealthPollBot.PollStage.WILL_CERTIFICATE
-        ):
-            bot.respondents[user_id][bot.current_date]["medical_certificate"] = True
-            bot.respondents[user_id][bot.current_date][
-                "poll_stage"
-            ] = HealthPollBot.PollStage.CERTIFICATE_DATA
-            bot_msg = HealthPollBot.question[HealthPollBot.PollStage.CERTIFICATE_DATA]
-        elif (
-            text_msg == "Нет, буду лечиться дома"
-            and bot.respondents[user_id][bot.current_date]["poll_stage"]
-            == HealthPollBot.PollStage.WILL_CERTIFICATE
-        ):
-            bot.respondents[user_id][bot.current_date]["medical_certificate"] = False
-            bot.respondents[user_id][bot.current_date][
-                "poll_stage"
-            ] = HealthPollBot.PollStage.SYMPTOMS
-            bot_msg = HealthPollBot.question[HealthPollBot.PollStage.SYMPTOMS]
-        try:
-            await event.answer(message=bot_msg)
-        except APIError as send_error:
-            logger.debug(f"{send_error.message}: Trouble id: {user_id}")
-            return
-    else:
-        pass
+        await self.start_poll(
+            event.object.object.message.text.strip(),
+            str(event.object.object.message.from_id),
+            event.answer,
+        )
 
+    async def report_handler(self, event: SimpleBotEvent) -> None:
+        """Отправляет итоги опросов."""
+    
+        await self.send_report(
+            event.object.object.message.text.strip(),
+            str(event.object.object.message.from_id),
+            event.answer,
+        )
 
-@bot.message_handler(bot.payload_contains_filter("yes_no"))
-async def is_ill_handler(event: SimpleBotEvent):
-    """Обрабатывает вопрос болен ли пользователь."""
+    async def poll_handler(self, event: SimpleBotEvent) -> None:
+        """Обрабатывает ответ респондента на текущий вопрос опроса."""
     
-    user_id: str = str(event.object.object.message.from_id)
-    print('Payload', event.object.object.message.payload)
-    text_msg: str = event.object.object.message.text.strip()
-    bot_msg: str = ""
-    bot_keyboard = None
-    print("Сообщение пользователя из обработчика is_ill_handler: ", text_msg)
-    if user_id in bot.respondents:
-        if (
-            text_msg == "Да"
-            and bot.respondents[user_id][bot.current_date]["poll_stage"]
-            == HealthPollBot.PollStage.IN_PROGRESS
-        ):
-            bot.respondents[user_id][bot.current_date]["ill"] = True
-            bot.respondents[user_id][bot.current_date][
-                "poll_stage"
-            ] = HealthPollBot.PollStage.WILL_CERTIFICATE
+        await self.answer_poll(
+            str(event.object.object.message.from_id),
+            event.object.object.message.text,
+        )
 
-            question, answers = HealthPollBot.question[HealthPollBot.PollStage.WILL_CERTIFICATE]
-            bot_msg = question
-            bot_keyboard = pollutils.get_keybord(answers, payload_name="will_certificate")
-        elif (
-            text_msg == "Нет"
-            and bot.respondents[user_id][bot.current_date]["poll_stage"]
-            == HealthPollBot.PollStage.IN_PROGRESS
-        ):
-            bot.respondents[user_id][bot.current_date]["ill"] = False
-            bot_msg = (
-                f"Ну и хорошо. Не болей! \n{HealthPollBot.question[HealthPollBot.PollStage.DONE]}"
-            )
-        try:
-            await event.answer(message=bot_msg, keyboard=bot_keyboard)
-        except APIError as send_error:
-            logger.debug(f"{send_error.message}: Trouble id: {user_id}")
+    async def callback_handler(self, event: Dict[str, Any]) -> None:
+        """Обрабатывает событие, полученное через Callback API, так же как обработчики Long Poll."""
+        if event.get("type") != "message_new":
             return
-    else:
-        pass
+        vk_message: Dict[str, Any] = event["object"]["message"]
 
+        async def answer(message: str, keyboard: Optional[str] = None) -> Any:
+            return await self.api_context.messages.send(
+                peer_id=vk_message["peer_id"],
+                message=message,
+                keyboard=keyboard,
+                random_id=uuid.uuid4().int & 0x7FFFFFFF,
+            )
+
+        text_msg: str = vk_message.get("text", "").strip()
+        if START_COMMAND_PATTERN.match(text_msg):
+            await self.start_poll(text_msg, str(vk_message["from_id"]), answer)
+        elif REPORT_COMMAND_PATTERN.match(text_msg):
+            await self.send_report(text_msg, str(vk_message["from_id"]), answer)
+        else:
+            await self.answer_poll(str(vk_message["from_id"]), vk_message.get("text", ""))
 
-@bot.message_handler(bot.regex_filter(r"((!|\/)start (.*?) (https://docs.google.com/(.*?)))"))
-async def start_handler(event: SimpleBotEvent) -> None:
-    """Организует начало опроса."""
+    @property
+    def poll_googlesheet_credence_service_file(self) -> str:
+        """Возвращает сервисный файл Google API."""
+        return self._inserter.credence_service_file
     
-    text_msg: str = event.object.object.message.text.strip()
-    path_to_file_with_respondents_ids, bot.pollresult_googlesheet_file_url = text_msg.split(' ')[1:]
-    bot.current_date = datetime.today().strftime("%Y-%m-%d")
-    try:
-        file_with_poll_user_ids: Optional[List[str]] = pollutils.read_lines_from_file(
-            path_to_file_with_respondents_ids
+    @poll_googlesheet_credence_service_file.setter
+    def poll_googlesheet_credence_service_file(self, credence_service_file: str) -> None:
+        """Устанавливает сервисный файл Google API."""
+        self._inserter.credence_service_file = credence_service_file
+
+
+def create_bot() -> HealthPollBot:
+    """Создает бота с очередью записи в Google Sheet и сервисом опроса по настройкам из config.
+    Сервис опроса создается до бота и вызывает VK API через тот же HTTP клиент.
+    Returns:
+        HealthPollBot: Бот, готовый к запуску.
+    """
+    if config.settings["UVLOOP"] and not uvloop_available():
+        logger.warning("UVLOOP is set, but uvloop is not installed: using the default event loop")
+    client: AIOHTTPClient = create_vk_client(config.settings["VK_API_URL"])
+    api_context = create_api_session_aiohttp(config.settings["TOKEN"], client=client).api.get_context()
+    inserter: GoogleSheetInserter = GoogleSheetInserter()
+    inserter.credence_service_file = config.settings["CREDS_FILE"]
+    sheet_queue: GoogleSheetWriteQueue = GoogleSheetWriteQueue(
+        inserter,
+        batch_size=config.settings["SHEET_BATCH_SIZE"],
+        flush_interval=config.settings["SHEET_FLUSH_INTERVAL"],
+        max_size=config.settings["SHEET_QUEUE_SIZE"],
+        max_attempts=config.settings["SHEET_MAX_ATTEMPTS"],
+        retry_delay=config.settings["SHEET_RETRY_DELAY"],
+    )
+    poll: PollService
+    if config.settings["SHARDS"] > 1:
+        # Участники распределяются по процессам sharding.create_shard_service, этот процесс
+        # только получает события VK и пишет результаты в Google Sheet
+        poll = ShardedPollService(
+            sheet_queue,
+            config.settings["SHARDS"],
+            RosterLoader(api_context, cache_file=config.settings["ROSTER_CACHE_FILE"]),
         )
-    except EnvironmentError as file_error:
-        logger.debug(file_error)
-        await event.answer(f"{file_error}")
-        return
+    else:
+        poll = PollService(
+            api_context,
+            inserter,
+            state=create_state_store(
+                config.settings["STATE_BACKEND"],
+                config.settings["STATE_DB_FILE"],
+                keep_from_date=(
+                    datetime.today() - timedelta(days=config.settings["STATE_RETENTION_DAYS"])
+                ).strftime("%Y-%m-%d"),
+            ),
+            sheet_queue=sheet_queue,
+            broadcaster=Broadcaster(
+                api_context,
+                rate=config.settings["BROADCAST_RATE"],
+                concurrency=config.settings["BROADCAST_CONCURRENCY"],
+                chunk_size=config.settings["BROADCAST_CHUNK_SIZE"],
+            ),
+            dispatcher=PollDispatcher(pollutils.get_keybord),
+            names=NameResolver(
+                api_context,
+                ttl=config.settings["NAME_CACHE_TTL"],
+                cache_file=config.settings["NAME_CACHE_FILE"],
+            ),
+            roster=RosterLoader(api_context, cache_file=config.settings["ROSTER_CACHE_FILE"]),
+            outbox=Outbox(
+                api_context,
+                config.settings["OUTBOX_DB_FILE"],
+                workers=config.settings["OUTBOX_WORKERS"],
+                max_attempts=config.settings["OUTBOX_MAX_ATTEMPTS"],
+            ),
+            retention_days=config.settings["STATE_RETENTION_DAYS"],
+            reminder_offsets=config.settings["REMINDER_OFFSETS"],
+            poll_deadline=config.settings["POLL_DEADLINE"],
+            definition_file=config.settings["POLL_DEFINITION_FILE"],
+            definition_reload_interval=config.settings["POLL_DEFINITION_RELOAD_INTERVAL"],
+        )
+    return HealthPollBot(
+        tokens=config.settings["TOKEN"],
+        group_id=config.settings["VK_GROUP_ID"],
+        uvloop=config.settings["UVLOOP"] and uvloop_available(),
+        client=client,
+        inserter=inserter,
+        poll=poll,
+        startup=startup,
+    )
 
-    for poll_user_id in file_with_poll_user_ids:
-        if poll_user_id not in bot.respondents:
-            bot.respondents[str(poll_user_id)] = {
-                bot.current_date: {
-                    "poll_stage": HealthPollBot.PollStage.IN_PROGRESS,
-                    "ill": False,
-                    "diagnosis": "",
-                    "medical_certificate": False,
-                    "medical_certificate_data": "",
-                    "date_of_last_class_attendance": "",
-                }
-            }
-        else:
-            bot.respondents[str(poll_user_id)][bot.current_date] = {
-                "poll_stage": HealthPollBot.PollStage.IN_PROGRESS,
-                "ill": False,
-                "diagnosis": "",
-                "medical_certificate": False,
-                "medical_certificate_data": "",
-                "date_of_last_class_attendance": "",
-            }
-        try:
-            await bot.api_context.messages.send(
-                peer_id=poll_user_id,
-                random_id=uuid.uuid4().int,
-                message=HealthPollBot.question[HealthPollBot.PollStage.IS_ILL],
-                keyboard=pollutils.get_keybord(["Да", "Нет"], payload_name="yes_no")
-            )
-        except APIError as send_error:
-            logger.debug(f"{send_error.message}: Trouble id: {poll_user_id}")
-            continue
 
-@bot.message_handler(bot.regex_filter(r"(^[^!\/](@|#)?[\d\w\s\W]+)|(^(?!\d{1,2}(\.|\\|\/)\d{1,2}(\.|\\|\/)\d{2,4})*$)"))
-async def symptoms_handler(event: SimpleBotEvent) -> None:
-    """Обрабатывает вопрос про симптомы заболевания."""
-    
-    user_id: str = str(event.object.object.message.from_id)
-    text_msg: str = event.object.object.message.text.strip(" @#")
-    print("Сообщение пользователя из обработчика symptoms_handler: ", text_msg)
-    if user_id in bot.respondents:
-        if (
-            bot.respondents[user_id][bot.current_date]["poll_stage"]
-            == HealthPollBot.PollStage.SYMPTOMS
-        ):
-            bot.respondents[user_id][bot.current_date][
-                "poll_stage"
-            ] = HealthPollBot.PollStage.LAST_DAY_IN_UNIVERSATY
-            bot.respondents[user_id][bot.current_date]["diagnosis"] = text_msg
-            try:
-                await event.answer(
-                    message=HealthPollBot.question[HealthPollBot.PollStage.LAST_DAY_IN_UNIVERSATY]
-                )
-            except APIError as send_error:
-                logger.debug(f"{send_error.message}: Trouble id: {user_id}")
-                return
+if __name__ == "__main__":
+    bot: HealthPollBot = create_bot()
+    startup.mark("bot setup")
+    try:
+        if config.settings["BOT_MODE"] == "callback":
+            asyncio.get_event_loop().run_until_complete(bot.run_callback(bot.callback_handler))
         else:
-            pass       
-bot.run_forever()
+            bot.run_forever()
+    finally:
+        asyncio.get_event_loop().run_until_complete(bot.shutdown())
@@ -0,0 +1,204 @@
+import asyncio
+import time
+import uuid
+import aiohttp
+from dataclasses import dataclass, field
+from typing import Dict, Iterable, List, Optional, Union, Any
+from vkwave.api.methods._error import APIError
+from metrics import VK_API_ERRORS, track_vk_call
+
+# Коды ошибок VK API, после которых запрос имеет смысл повторить
+# 6 - слишком много запросов в секунду, 9 - слишком много однотипных действий (flood control)
+RETRYABLE_ERROR_CODES = frozenset({6, 9})
+# Максимальное количество получателей в одном вызове messages.send с peer_ids
+MAX_PEER_IDS_PER_CALL = 100
+
+
+class TokenBucket:
+    """Ограничитель частоты запросов по алгоритму token bucket.
+    Attr:
+        rate (float): Количество токенов, добавляемых в секунду.
+        capacity (float): Максимальное количество накопленных токенов.
+    """
+
+    def __init__(self, rate: float, capacity: Optional[float] = None) -> None:
+        """Инициализирует класс.
+        Args:
+            rate (float): Допустимое количество запросов в секунду.
+            capacity (Optional[float]): Размер "всплеска", по умолчанию равен rate.
+        Returns:
+        """
+        self.rate = rate
+        self.capacity = capacity if capacity else rate
+        self._tokens: float = self.capacity
+        self._updated_at: float = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    def _refill(self) -> None:
+        """Пополняет корзину токенами за прошедшее время."""
+        now: float = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated_at) * self.rate)
+        self._updated_at = now
+
+    async def acquire(self) -> None:
+        """Ожидает, пока в корзине появится токен, и забирает его."""
+        async with self._lock:
+            self._refill()
+            while self._tokens < 1:
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+                self._refill()
+            self._tokens -= 1
+
+
+@dataclass
+class DeliveryReport:
+    """Отчет о рассылке сообщения.
+    Attr:
+        delivered (List[int]): id получателей, которым сообщение доставлено.
+        failed (Dict[int, str]): id получателей, которым доставить не удалось, и текст ошибки.
+        error_codes (Dict[int, int]): Коды ошибок VK API недоставленных сообщений, если известны.
+        elapsed (float): Длительность рассылки в секундах.
+    """
+
+    delivered: List[int] = field(default_factory=list)
+    failed: Dict[int, str] = field(default_factory=dict)
+    error_codes: Dict[int, int] = field(default_factory=dict)
+    elapsed: float = 0.0
+
+    @property
+    def total(self) -> int:
+        """Возвращает общее количество получателей."""
+        return len(self.delivered) + len(self.failed)
+
+
+class Broadcaster:
+    """Класс для пакетной рассылки сообщений с ограничением частоты запросов к VK API."""
+
+    def __init__(
+        self,
+        api_context: Any,
+        rate: float = 20,
+        concurrency: int = 4,
+        chunk_size: int = MAX_PEER_IDS_PER_CALL,
+        max_retries: int = 5,
+        backoff: float = 0.5,
+    ) -> None:
+        """Инициализирует класс.
+        Args:
+            api_context (Any): Контекст VK API (bot.api_context).
+            rate (float): Допустимое количество вызовов messages.send в секунду.
+            concurrency (int): Количество одновременно выполняемых вызовов.
+            chunk_size (int): Количество получателей в одном вызове (не больше 100).
+            max_retries (int): Количество повторов при ошибках 6 и 9.
+            backoff (float): Начальная задержка перед повтором в секундах.
+        Returns:
+        """
+        self.api_context = api_context
+        self.bucket = TokenBucket(rate)
+        self.concurrency = max(1, concurrency)
+        self.chunk_size = min(max(1, chunk_size), MAX_PEER_IDS_PER_CALL)
+        self.max_retries = max_retries
+        self.backoff = backoff
+
+    def _split_into_chunks(self, peer_ids: List[int]) -> List[List[int]]:
+        """Разбивает список получателей на пачки для messages.send."""
+        return [
+            peer_ids[index:index + self.chunk_size]
+            for index in range(0, len(peer_ids), self.chunk_size)
+        ]
+
+    async def _send_chunk(
+        self, chunk: List[int], message: str, keyboard: Optional[str], report: DeliveryReport
+    ) -> None:
+        """Отправляет сообщение пачке получателей, повторяя запрос при ошибках 6 и 9 и ошибках сети.
+        Если повторы не помогли, получатели записываются в failed; при ошибке сети - без кода
+        ошибки, как временная ошибка, которую повторит очередь исходящих сообщений.
+        Args:
+            chunk (List[int]): id получателей.
+            message (str): Текст сообщения.
+            keyboard (Optional[str]): Клавиатура в формате JSON.
+            report (DeliveryReport): Отчет, в который записываются результаты.
+        Returns:
+        """
+        # random_id один на все повторы: VK не продублирует уже доставленное сообщение
+        random_id: int = uuid.uuid4().int & 0x7FFFFFFF
+        for attempt in range(self.max_retries + 1):
+            await self.bucket.acquire()
+            try:
+                with track_vk_call("messages.send"):
+                    response: Dict[str, Any] = await self.api_context.messages.send(
+                        peer_ids=chunk,
+                        random_id=random_id,
+                        message=message,
+                        keyboard=keyboard,
+                        return_raw_response=True,
+                    )
+            except APIError as send_error:
+                if send_error.code in RETRYABLE_ERROR_CODES and attempt < self.max_retries:
+                    await asyncio.sleep(self.backoff * 2 ** attempt)
+                    continue
+                for peer_id in chunk:
+                    report.failed[peer_id] = send_error.message
+                    report.error_codes[peer_id] = send_error.code
+                return
+            except (aiohttp.ClientError, asyncio.TimeoutError) as network_error:
+                if attempt < self.max_retries:
+                    await asyncio.sleep(self.backoff * 2 ** attempt)
+                    continue
+                for peer_id in chunk:
+                    report.failed[peer_id] = repr(network_error)
+                return
+            break
+        self._collect_results(chunk, response, report)
+
+    @staticmethod
+    def _collect_results(
+        chunk: List[int], response: Dict[str, Any], report: DeliveryReport
+    ) -> None:
+        """Разбирает ответ messages.send с peer_ids по каждому получателю."""
+        answered: set = set()
+        for item in response.get("response", []):
+            peer_id: int = int(item["peer_id"])
+            answered.add(peer_id)
+            if "error" in item:
+                error: Dict[str, Union[str, int]] = item["error"]
+                VK_API_ERRORS.inc(method="messages.send", code=error.get("code"))
+                report.failed[peer_id] = f"[{error.get('code')}] {error.get('description', '')}"
+                report.error_codes[peer_id] = error.get("code")
+            else:
+                report.delivered.append(peer_id)
+        for peer_id in chunk:
+            if peer_id not in answered:
+                report.failed[peer_id] = "No delivery status in response"
+
+    async def broadcast(
+        self, peer_ids: Iterable[Union[str, int]], message: str, keyboard: Optional[str] = None
+    ) -> DeliveryReport:
+        """Рассылает сообщение всем получателям.
+        Args:
+            peer_ids (Iterable[Union[str, int]]): id получателей.
+            message (str): Текст сообщения.
+            keyboard (Optional[str]): Клавиатура в формате JSON.
+        Returns:
+            DeliveryReport: отчет о доставке по каждому получателю.
+        """
+        started_at: float = time.monotonic()
+        report: DeliveryReport = DeliveryReport()
+        chunks: List[List[int]] = self._split_into_chunks([int(peer_id) for peer_id in peer_ids])
+        semaphore = asyncio.Semaphore(self.concurrency)
+
+        async def send_with_limit(chunk: List[int]) -> None:
+            async with semaphore:
+                await self._send_chunk(chunk, message, keyboard, report)
+
+        results: List[Any] = await asyncio.gather(
+            *(send_with_limit(chunk) for chunk in chunks), return_exceptions=True
+        )
+        # Непредвиденная ошибка одной пачки не отменяет отчет по остальным
+        for chunk, result in zip(chunks, results):
+            if isinstance(result, Exception):
+                for peer_id in chunk:
+                    if peer_id not in report.failed and peer_id not in report.delivered:
+                        report.failed[peer_id] = repr(result)
+        report.elapsed = time.monotonic() - started_at
+        return report
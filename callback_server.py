@@ -0,0 +1,166 @@
+import asyncio
+import hmac
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+from aiohttp import web
+from loguru import logger
+from metrics import CALLBACK_EVENTS, CALLBACK_QUEUE_DEPTH
+
+EventHandler = Callable[[Dict[str, Any]], Awaitable[None]]
+
+
+class CallbackServer:
+    """Прием событий ВКонтакте через Callback API.
+    На запрос VK сервер отвечает "ok" сразу, а событие передает в один из workers
+    обработчиков. Обработчик выбирается по id пользователя, поэтому события одного
+    пользователя обрабатываются по порядку, а разных пользователей - параллельно.
+    """
+
+    def __init__(
+        self,
+        handler: EventHandler,
+        group_id: str|int,
+        confirmation_code: str,
+        secret: str = "",
+        workers: int = 8,
+        queue_size: int = 1000,
+        remembered_events: int = 10000,
+    ) -> None:
+        """Инициализирует класс.
+        Args:
+            handler (EventHandler): Корутина, обрабатывающая событие (объект из тела запроса VK).
+            group_id (str|int): id сообщества, события которого принимаются.
+            confirmation_code (str): Строка, которую нужно вернуть VK для подтверждения адреса сервера.
+            secret (str): Секретный ключ из настроек Callback API, пустая строка - не проверять.
+            workers (int): Количество параллельных обработчиков.
+            queue_size (int): Размер очереди каждого обработчика. При заполнении VK получает
+                ошибку и повторит событие позже.
+            remembered_events (int): Сколько последних event_id помнить, чтобы не обработать
+                повторно доставленное событие дважды.
+        Returns:
+        """
+        self.handler = handler
+        self.group_id = int(group_id)
+        self.confirmation_code = confirmation_code
+        self.secret = secret
+        self.remembered_events = remembered_events
+        self._queues: List[asyncio.Queue] = [asyncio.Queue(maxsize=queue_size) for _ in range(max(1, workers))]
+        self._workers: List[asyncio.Task] = []
+        self._seen_events: "OrderedDict[str, None]" = OrderedDict()
+        self._runner: Optional[web.AppRunner] = None
+
+    @property
+    def pending(self) -> int:
+        """Возвращает количество событий, ожидающих обработки."""
+        return sum(queue.qsize() for queue in self._queues)
+
+    async def start(self, host: str, port: int, path: str = "/callback") -> None:
+        """Запускает обработчики событий и HTTP сервер.
+        Args:
+            host (str): Адрес, на котором слушает сервер.
+            port (int): Порт сервера.
+            path (str): Путь, указанный в настройках Callback API сообщества.
+        Returns:
+        """
+        self._workers = [asyncio.create_task(self._run(queue)) for queue in self._queues]
+        CALLBACK_QUEUE_DEPTH.collect = lambda: {(): self.pending}
+        app: web.Application = web.Application()
+        app.router.add_post(path, self._callback_handler)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        await web.TCPSite(self._runner, host, port).start()
+        logger.info(f"Callback API server listening on {host}:{port}{path}")
+
+    async def close(self) -> None:
+        """Перестает принимать события и дожидается обработки уже принятых."""
+        if self._runner is not None:
+            await self._runner.cleanup()
+        for queue in self._queues:
+            await queue.join()
+        for worker in self._workers:
+            worker.cancel()
+
+    @staticmethod
+    def _ordering_key(event: Dict[str, Any]) -> int:
+        """Возвращает id пользователя, от которого пришло событие (0, если его нет или он не число)."""
+        event_object: Any = event.get("object")
+        if not isinstance(event_object, dict):
+            return 0
+        message: Any = event_object.get("message")
+        if not isinstance(message, dict):
+            message = event_object
+        try:
+            return int(message.get("from_id") or message.get("user_id") or 0)
+        except (TypeError, ValueError):
+            return 0
+
+    @staticmethod
+    def _is_valid(event: Dict[str, Any]) -> bool:
+        """Проверяет форму события message_new: object.message с числовыми from_id, peer_id и строкой text.
+        События других типов обработчику бота не нужны и принимаются без проверки.
+        """
+        if event.get("type") != "message_new":
+            return True
+        event_object: Any = event.get("object")
+        message: Any = event_object.get("message") if isinstance(event_object, dict) else None
+        return (
+            isinstance(message, dict)
+            and all(type(message.get(key)) is int for key in ("from_id", "peer_id"))
+            and isinstance(message.get("text", ""), str)
+        )
+
+    def _is_duplicate(self, event_id: Optional[str]) -> bool:
+        """Проверяет, что событие уже принималось (VK повторяет события без ответа "ok")."""
+        if not event_id or not isinstance(event_id, str):
+            return False
+        if event_id in self._seen_events:
+            return True
+        self._seen_events[event_id] = None
+        if len(self._seen_events) > self.remembered_events:
+            self._seen_events.popitem(last=False)
+        return False
+
+    async def _callback_handler(self, request: web.Request) -> web.Response:
+        try:
+            event: Dict[str, Any] = await request.json()
+        except ValueError:
+            event = None
+        # Событие VK - JSON объект с числовым group_id, иначе запрос не от VK
+        if not isinstance(event, dict) or type(event.get("group_id")) is not int:
+            CALLBACK_EVENTS.inc(result="bad_request")
+            return web.Response(status=400, text="bad request")
+        if self.secret and not hmac.compare_digest(str(event.get("secret", "")), self.secret):
+            CALLBACK_EVENTS.inc(result="forbidden")
+            return web.Response(status=403, text="forbidden")
+        if event["group_id"] != self.group_id:
+            CALLBACK_EVENTS.inc(result="forbidden")
+            return web.Response(status=403, text="forbidden")
+        if event.get("type") == "confirmation":
+            return web.Response(text=self.confirmation_code)
+        if not self._is_valid(event):
+            CALLBACK_EVENTS.inc(result="bad_request")
+            return web.Response(status=400, text="bad request")
+        if self._is_duplicate(event.get("event_id")):
+            CALLBACK_EVENTS.inc(result="duplicate")
+            return web.Response(text="ok")
+        queue: asyncio.Queue = self._queues[self._ordering_key(event) % len(self._queues)]
+        try:
+            queue.put_nowait(event)
+        except asyncio.QueueFull:
+            # Событие не принято, VK доставит его повторно
+            self._seen_events.pop(event.get("event_id"), None)
+            CALLBACK_EVENTS.inc(result="overloaded")
+            return web.Response(status=503, text="overloaded")
+        CALLBACK_EVENTS.inc(result="accepted")
+        return web.Response(text="ok")
+
+    async def _run(self, queue: asyncio.Queue) -> None:
+        """Обрабатывает события одной очереди строго по порядку."""
+        while True:
+            event: Dict[str, Any] = await queue.get()
+            try:
+                await self.handler(event)
+            except Exception as error:
+                logger.exception(f"{error}: Trouble callback event: {event.get('type')}")
+            finally:
+                queue.task_done()
@@ -6,6 +6,49 @@ load_dotenv()
 settings = {
     'TOKEN': os.getenv('TOKEN'),
     'VK_GROUP_ID': os.getenv('VK_GROUP_ID'),
+    'VK_API_URL': os.getenv('VK_API_URL', ''),
+    'ADMIN_IDS': [admin_id.strip() for admin_id in os.getenv('ADMIN_IDS', '').split(',') if admin_id.strip()],
     'LOG_FILE': os.getenv('LOG_FILE'),
-    'CREDS_FILE': os.getenv('CREDS_FILE')
+    'LOG_LEVEL': os.getenv('LOG_LEVEL', 'DEBUG'),
+    'CONSOLE_LOG_LEVEL': os.getenv('CONSOLE_LOG_LEVEL', 'INFO'),
+    'CREDS_FILE': os.getenv('CREDS_FILE'),
+    'BROADCAST_RATE': float(os.getenv('BROADCAST_RATE', 20)),
+    'BROADCAST_CONCURRENCY': int(os.getenv('BROADCAST_CONCURRENCY', 4)),
+    'BROADCAST_CHUNK_SIZE': int(os.getenv('BROADCAST_CHUNK_SIZE', 100)),
+    'SHEET_BATCH_SIZE': int(os.getenv('SHEET_BATCH_SIZE', 50)),
+    'SHEET_FLUSH_INTERVAL': float(os.getenv('SHEET_FLUSH_INTERVAL', 5)),
+    'SHEET_QUEUE_SIZE': int(os.getenv('SHEET_QUEUE_SIZE', 10000)),
+    'SHEET_MAX_ATTEMPTS': int(os.getenv('SHEET_MAX_ATTEMPTS', 5)),
+    'SHEET_RETRY_DELAY': float(os.getenv('SHEET_RETRY_DELAY', 2)),
+    'STATE_BACKEND': os.getenv('STATE_BACKEND', 'sqlite'),
+    'STATE_DB_FILE': os.getenv('STATE_DB_FILE', 'poll-state.db'),
+    'STATE_RETENTION_DAYS': int(os.getenv('STATE_RETENTION_DAYS', 14)),
+    'NAME_CACHE_TTL': float(os.getenv('NAME_CACHE_TTL', 7 * 24 * 3600)),
+    'NAME_CACHE_FILE': os.getenv('NAME_CACHE_FILE', 'names-cache.json'),
+    'ROSTER_CACHE_FILE': os.getenv('ROSTER_CACHE_FILE', 'roster-cache.json'),
+    'METRICS_HOST': os.getenv('METRICS_HOST', '127.0.0.1'),
+    'METRICS_PORT': int(os.getenv('METRICS_PORT', 0)),
+    'METRICS_LOG_INTERVAL': float(os.getenv('METRICS_LOG_INTERVAL', 300)),
+    'REMINDER_OFFSETS': [
+        float(offset) for offset in os.getenv('REMINDER_OFFSETS', '3600,14400').split(',') if offset.strip()
+    ],
+    'POLL_DEADLINE': float(os.getenv('POLL_DEADLINE', 24 * 3600)),
+    'POLL_DEFINITION_FILE': os.getenv('POLL_DEFINITION_FILE', ''),
+    'POLL_DEFINITION_RELOAD_INTERVAL': float(os.getenv('POLL_DEFINITION_RELOAD_INTERVAL', 5)),
+    'OUTBOX_DB_FILE': os.getenv('OUTBOX_DB_FILE', 'outbox.db'),
+    'OUTBOX_WORKERS': int(os.getenv('OUTBOX_WORKERS', 4)),
+    'OUTBOX_MAX_ATTEMPTS': int(os.getenv('OUTBOX_MAX_ATTEMPTS', 10)),
+    'BOT_MODE': os.getenv('BOT_MODE', 'longpoll'),
+    'SHARDS': int(os.getenv('SHARDS', 1)),
+    'BLOCKING_IO_THREADS': int(os.getenv('BLOCKING_IO_THREADS', 8)),
+    'LOOP_LAG_THRESHOLD': float(os.getenv('LOOP_LAG_THRESHOLD', 0.25)),
+    'UVLOOP': os.getenv('UVLOOP', '0').lower() in ('1', 'true', 'yes'),
+    'PREWARM': os.getenv('PREWARM', '1').lower() in ('1', 'true', 'yes'),
+    'CALLBACK_HOST': os.getenv('CALLBACK_HOST', '0.0.0.0'),
+    'CALLBACK_PORT': int(os.getenv('CALLBACK_PORT', os.getenv('PORT', 8080))),
+    'CALLBACK_PATH': os.getenv('CALLBACK_PATH', '/callback'),
+    'CALLBACK_CONFIRMATION': os.getenv('CALLBACK_CONFIRMATION', ''),
+    'CALLBACK_SECRET': os.getenv('CALLBACK_SECRET', ''),
+    'CALLBACK_WORKERS': int(os.getenv('CALLBACK_WORKERS', 8)),
+    'CALLBACK_QUEUE_SIZE': int(os.getenv('CALLBACK_QUEUE_SIZE', 1000)),
 }
@@ -1,83 +1,227 @@
-import pygsheets
-from typing import Dict, List, Union, Any
+import importlib
+import threading
+from loguru import logger
+from collections import OrderedDict
+from typing import TYPE_CHECKING, Dict, List, Optional, Union, Any
+
+if TYPE_CHECKING:
+    # pygsheets (и googleapiclient) импортируются около 0.3 с, поэтому
+    # загружаются при первой авторизации, а не при запуске бота
+    import pygsheets
+
+
+def column_letter(number: int) -> str:
+    """Возвращает буквенное обозначение столбца Google Sheet по номеру: 1 -> A, 27 -> AA."""
+    letters: str = ""
+    while number > 0:
+        number, remainder = divmod(number - 1, 26)
+        letters = chr(ord("A") + remainder) + letters
+    return letters
+
 
 class GoogleSheetInserter:
-    """Класс для добавления записей в Google Sheet."""
+    """Класс для добавления записей в Google Sheet.
+    Держит один авторизованный клиент, кэш открытых листов по ссылке (LRU)
+    и номер следующей свободной строки для каждого листа.
+    """
     
     def __init__(
-        self, credence_service_file:str = "", googlesheet_file_url:str = ""
+        self,
+        credence_service_file:str = "",
+        googlesheet_file_url:str = "",
+        max_cached_sheets: int = 8,
     ) -> None:
         """Инициализирует класс.
         Args:
             credence_service_file (str): Путь до сервисного файла credence.json (Google Sheet API).
             googlesheet_file_url (str): Ссылка на Google Sheet.
+            max_cached_sheets (int): Количество открытых листов, которые хранятся в кэше.
         Returns:
         """
-        self.credence_service_file = credence_service_file
+        self._lock = threading.RLock()
+        self._googlesheet_client: Optional["pygsheets.client.Client"] = None
+        self._worksheets: "OrderedDict[str, pygsheets.Worksheet]" = OrderedDict()
+        self._next_rows: Dict[str, int] = {}
+        self.max_cached_sheets = max(1, max_cached_sheets)
+        self._credence_service_file = credence_service_file
         self.googlesheet_file_url = googlesheet_file_url
 
+    @property
+    def credence_service_file(self) -> str:
+        """Возвращает путь до сервисного файла Google API."""
+        return self._credence_service_file
+
+    @credence_service_file.setter
+    def credence_service_file(self, credence_service_file: str) -> None:
+        """Устанавливает сервисный файл и сбрасывает авторизованный клиент."""
+        with self._lock:
+            if credence_service_file != self._credence_service_file:
+                self._googlesheet_client = None
+                self._worksheets.clear()
+                self._next_rows.clear()
+            self._credence_service_file = credence_service_file
+
+    def invalidate(self, googlesheet_file_url: str) -> None:
+        """Удаляет из кэша лист и номер следующей строки для ссылки на документ.
+        Вызывается при каждом !start: таблицу могли изменить вручную, и при следующей
+        записи столбец A будет прочитан заново.
+        Args:
+            googlesheet_file_url (str): Ссылка на Google Sheet.
+        Returns:
+        """
+        with self._lock:
+            self._worksheets.pop(googlesheet_file_url, None)
+            self._next_rows.pop(googlesheet_file_url, None)
+
     def _get_googlesheet_by_url(
-        self, googlesheet_client: pygsheets.client.Client
-    ) -> pygsheets.Spreadsheet:
-        """Получает Google.Docs таблицу по ссылке на документ."""
-        sheets: pygsheets.Spreadsheet = googlesheet_client.open_by_url(
-            self.googlesheet_file_url
-        )
+        self, googlesheet_client: "pygsheets.client.Client", googlesheet_file_url: str = ""
+    ) -> "pygsheets.Worksheet":
+        """Получает Google.Docs таблицу по ссылке на документ (из кэша, если она уже открыта)."""
+        googlesheet_file_url = googlesheet_file_url if googlesheet_file_url else self.googlesheet_file_url
+        with self._lock:
+            if googlesheet_file_url in self._worksheets:
+                self._worksheets.move_to_end(googlesheet_file_url)
+                return self._worksheets[googlesheet_file_url]
+        sheets: "pygsheets.Spreadsheet" = googlesheet_client.open_by_url(googlesheet_file_url)
+        with self._lock:
+            self._worksheets[googlesheet_file_url] = sheets.sheet1
+            while len(self._worksheets) > self.max_cached_sheets:
+                evicted_url, _ = self._worksheets.popitem(last=False)
+                self._next_rows.pop(evicted_url, None)
         return sheets.sheet1
 
+    def _get_next_row(self, sheet: "pygsheets.Worksheet", googlesheet_file_url: str) -> int:
+        """Возвращает номер следующей свободной строки.
+        Столбец A читается только при первом обращении к листу, дальше номер ведется локально.
+        """
+        with self._lock:
+            if googlesheet_file_url in self._next_rows:
+                return self._next_rows[googlesheet_file_url]
+        last_filled_row: int = len(
+            list(filter(lambda cell: cell != "", sheet.get_col(1)))
+        )  # column 1 in googlesheet excel = A-column
+        with self._lock:
+            self._next_rows[googlesheet_file_url] = last_filled_row + 1
+        return last_filled_row + 1
+
     def _insert_data_back_googlesheet(
         self,
-        sheet: pygsheets.Spreadsheet,
+        sheet: "pygsheets.Worksheet",
         data: List[List[Union[str, bool]]],
         start_col: str,
         end_col: str,
+        googlesheet_file_url: str = "",
     ) -> bool:
-        """Находит номер последней заполненной строки и вставляет данные после нее.
+        """Вставляет данные (одну или несколько строк) после последней заполненной строки.
         Args:
-            sheet (pygsheets.Spreadsheet): - Объект электронной таблицы Google.Docs.
+            sheet (pygsheets.Worksheet): - Лист электронной таблицы Google.Docs.
             data (List[List[Union[str, bool]]]): - Cловарь с данными, предназначенными для вставки.
             start_col (str): - столбец таблицы, с которого начинается вставка.
             end_col (str): - столбец таблицы, на котором заканчивается вставка.
+            googlesheet_file_url (str): - Ссылка на Google Sheet, по которой ведется номер строки.
         Returns: - True в случае успешной вставки и False в противном случае.
         """
-        last_filled_row: List[str] = len(
-            list(filter(lambda cell: cell != "", sheet.get_col(1)))
-        )  # column 1 in googlesheet excel = A-column
+        googlesheet_file_url = googlesheet_file_url if googlesheet_file_url else self.googlesheet_file_url
+        next_row: int = self._get_next_row(sheet, googlesheet_file_url)
         try:
             sheet.update_values(
-                f"{start_col}{last_filled_row + 1}:{end_col}{last_filled_row + 1}", data
+                f"{start_col}{next_row}:{end_col}{next_row + len(data) - 1}", data
             )
         except:
+            # Лист могли изменить вручную: при следующей записи перечитаем его заново
+            self.invalidate(googlesheet_file_url)
             return False
         else:
+            with self._lock:
+                self._next_rows[googlesheet_file_url] = next_row + len(data)
             return True
 
-    def _get_googlesheet_client(self) ->  pygsheets.client.Client:
-        """Он авторизуется с помощью служебного ключа и возвращает объект клиента Google Docs."""
-        return pygsheets.authorize(
-            service_file=self.credence_service_file
-        )
+    def _get_googlesheet_client(self) -> "pygsheets.client.Client":
+        """Он авторизуется с помощью служебного ключа и возвращает объект клиента Google Docs.
+        Авторизация выполняется один раз, дальше используется тот же клиент.
+        """
+        with self._lock:
+            if self._googlesheet_client is None:
+                import pygsheets
+
+                self._googlesheet_client = pygsheets.authorize(
+                    service_file=self.credence_service_file
+                )
+            return self._googlesheet_client
+
+    def warm_up(self) -> None:
+        """Заранее загружает pygsheets и авторизует клиент, чтобы первая запись
+        результатов не ждала импорта и авторизации. Блокирующая, вызывается в потоке.
+        """
+        if not self.credence_service_file:
+            importlib.import_module("pygsheets")
+            return
+        self._get_googlesheet_client()
 
     def _insert_info_in_googlesheet(
         self,
         data: List[List[Union[str, bool]]],
         start_col: str = "A",
         end_col: str = "E",
+        googlesheet_file_url: str = "",
     ) -> bool:
-        """Вставляет строку данных в таблицу Google.
+        """Вставляет строки данных в таблицу Google.
         Args:
             data (List[List[Union[str, bool]]]):  Cловарь с данными, предназначенными для вставки.
             start_col (str): Cтолбец таблицы, с которого начинается вставка.
             end_col (str): Cтолбец таблицы, с которого заканчивается вставка.
+            googlesheet_file_url (str): Ссылка на Google Sheet, по умолчанию текущая.
         Returns: True в случае успешной вставки и False в противном случае.
         """
-        googlesheet_client: pygsheets.client.Client = self._get_googlesheet_client()
-        wks: pygsheets.Spreadsheet = self._get_googlesheet_by_url(googlesheet_client)
+        googlesheet_client: "pygsheets.client.Client" = self._get_googlesheet_client()
+        wks: "pygsheets.Worksheet" = self._get_googlesheet_by_url(
+            googlesheet_client, googlesheet_file_url
+        )
         is_inserted: bool = self._insert_data_back_googlesheet(
-            wks, data, start_col, end_col
+            wks, data, start_col, end_col, googlesheet_file_url
         )
         return is_inserted
 
+    @staticmethod
+    def build_row(
+        primary_col: str,
+        user_poll_data: Dict[str, Union[str, bool, Any]],
+        current_date: str,
+    ) -> List[Union[str, bool]]:
+        """Формирует строку таблицы (столбцы A-F) из результатов опроса.
+        Args:
+            primary_col (str): Значение, идентифицирующее строку данных.
+            user_poll_data (Dict[str, Union[str, bool, Any]]): Данные для записи.
+            current_date (str): Дата записи.
+        Returns:
+            List[Union[str, bool]]: строка данных.
+        """
+        return [
+            primary_col,
+            user_poll_data["diagnosis"],
+            user_poll_data["medical_certificate_data"],
+            user_poll_data["date_of_last_class_attendance"],
+            user_poll_data["medical_certificate"],
+            current_date,
+        ]
+
+    def insert_rows(
+        self, rows: List[List[Union[str, bool]]], googlesheet_file_url: str = ""
+    ) -> bool:
+        """Записывает пачку строк в электронную таблицу Google одним запросом.
+        Ширина диапазона определяется по самой длинной строке (столбцы задаются описанием опроса).
+        Args:
+            rows (List[List[Union[str, bool]]]): Строки, сформированные build_row или PollDispatcher.build_row.
+            googlesheet_file_url (str): Ссылка на Google Sheet, по умолчанию текущая.
+        Returns: True в случае успешной вставки и False в противном случае.
+        """
+        return self._insert_info_in_googlesheet(
+            rows,
+            start_col="A",
+            end_col=column_letter(max((len(row) for row in rows), default=1)),
+            googlesheet_file_url=googlesheet_file_url,
+        )
+
     def write_information_in_googlesheet(
         self,
         primary_col: str,
@@ -91,20 +235,8 @@ class GoogleSheetInserter:
             current_date (str): Дата записи. 
         Returns:
         """
-        print("Результаты опроса в обработчике date_handler: ", user_poll_data)
-        print("ФИО пользователя, прошедшего опрос:", primary_col)
-        return self._insert_info_in_googlesheet(
-            [
-                [
-                    primary_col,
-                    user_poll_data["diagnosis"],
-                    user_poll_data["medical_certificate_data"],
-                    user_poll_data["date_of_last_class_attendance"],
-                    user_poll_data["medical_certificate"],
-                    current_date,
-                ]
-            ],
-            start_col="A",
-            end_col="F",
+        logger.trace("Poll result of {full_name}: {poll_data}", full_name=primary_col, poll_data=user_poll_data)
+        return self.insert_rows(
+            [self.build_row(primary_col, user_poll_data, current_date)]
         )
         
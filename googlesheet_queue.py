@@ -0,0 +1,157 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional, Tuple, Union
+from loguru import logger
+from googlesheet_inserter import GoogleSheetInserter
+from metrics import SHEET_INSERT_SECONDS, SHEET_ROWS
+
+# Маркер остановки фонового обработчика очереди
+_STOP = object()
+
+
+class GoogleSheetWriteQueue:
+    """Очередь отложенной записи результатов опроса в Google Sheet.
+    Записи копятся в буфере и сбрасываются одной пачкой каждые batch_size записей
+    или flush_interval секунд из отдельного потока, не блокируя эвентлуп.
+    Пачка, которую не удалось записать (квота, ошибка сервера), повторяется с растущей паузой
+    до max_attempts раз и только после этого отбрасывается.
+    """
+
+    def __init__(
+        self,
+        inserter: GoogleSheetInserter,
+        batch_size: int = 50,
+        flush_interval: float = 5.0,
+        max_size: int = 10000,
+        max_attempts: int = 5,
+        retry_delay: float = 2.0,
+    ) -> None:
+        """Инициализирует класс.
+        Args:
+            inserter (GoogleSheetInserter): Агрегат для вставки данных в Google Sheet.
+            batch_size (int): Количество записей, после которого буфер сбрасывается.
+            flush_interval (float): Максимальное время ожидания записи в буфере, в секундах.
+            max_size (int): Максимальный размер очереди, при заполнении put ожидает.
+            max_attempts (int): Сколько раз пытаться записать пачку.
+            retry_delay (float): Пауза перед первым повтором в секундах, дальше удваивается.
+        Returns:
+        """
+        self._inserter = inserter
+        self.batch_size = max(1, batch_size)
+        self.flush_interval = flush_interval
+        self.max_attempts = max(1, max_attempts)
+        self.retry_delay = retry_delay
+        self._queue: asyncio.Queue = asyncio.Queue(maxsize=max_size)
+        # Один поток, чтобы пачки записывались строго по очереди и не гонялись за строку
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="googlesheet")
+        self._worker: Optional[asyncio.Task] = None
+
+    @property
+    def pending(self) -> int:
+        """Возвращает количество записей, ожидающих отправки."""
+        return self._queue.qsize()
+
+    async def start(self) -> None:
+        """Запускает фоновый обработчик очереди."""
+        if self._worker is None:
+            self._worker = asyncio.create_task(self._run())
+
+    async def put(self, googlesheet_file_url: str, row: List[Union[str, bool]]) -> None:
+        """Добавляет строку в очередь на запись.
+        Args:
+            googlesheet_file_url (str): Ссылка на Google Sheet, в которую пишется строка.
+            row (List[Union[str, bool]]): Строка данных.
+        Returns:
+        """
+        await self._queue.put((googlesheet_file_url, row))
+
+    async def invalidate(self, googlesheet_file_url: str) -> None:
+        """Сбрасывает кэш листа и номер следующей строки таблицы (новый !start).
+        Сброс выполняется в потоке записи, поэтому пачки, которые уже пишутся, дописываются
+        по старому номеру строки, а следующие перечитывают столбец A.
+        Args:
+            googlesheet_file_url (str): Ссылка на Google Sheet.
+        Returns:
+        """
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(self._executor, self._inserter.invalidate, googlesheet_file_url)
+
+    async def _collect_batch(self) -> Tuple[List[Tuple[str, List]], bool]:
+        """Собирает пачку записей, пока не наберется batch_size или не истечет flush_interval.
+        Returns:
+            Tuple[List[Tuple[str, List]], bool]: пачка записей и признак остановки.
+        """
+        loop = asyncio.get_running_loop()
+        item = await self._queue.get()
+        if item is _STOP:
+            return [], True
+        batch: List[Tuple[str, List]] = [item]
+        deadline: float = loop.time() + self.flush_interval
+        while len(batch) < self.batch_size:
+            timeout: float = deadline - loop.time()
+            if timeout <= 0:
+                break
+            try:
+                item = await asyncio.wait_for(self._queue.get(), timeout)
+            except asyncio.TimeoutError:
+                break
+            if item is _STOP:
+                return batch, True
+            batch.append(item)
+        return batch, False
+
+    async def _flush(self, batch: List[Tuple[str, List]]) -> None:
+        """Записывает пачку в таблицы, группируя строки по ссылке на документ."""
+        rows_by_url: Dict[str, List[List[Union[str, bool]]]] = {}
+        for googlesheet_file_url, row in batch:
+            rows_by_url.setdefault(googlesheet_file_url, []).append(row)
+        for googlesheet_file_url, rows in rows_by_url.items():
+            is_inserted: bool = await self._insert_with_retries(googlesheet_file_url, rows)
+            SHEET_ROWS.inc(len(rows), result="written" if is_inserted else "failed")
+            if not is_inserted:
+                logger.error(f"Rows were not written to {googlesheet_file_url}: {rows}")
+
+    async def _insert_with_retries(self, googlesheet_file_url: str, rows: List[List[Union[str, bool]]]) -> bool:
+        """Записывает строки одной таблицы, повторяя запись при ошибке с удвоением паузы.
+        Следующие пачки ждут повторов, поэтому строки попадают в таблицу по порядку.
+        Returns:
+            bool: True, если строки записаны.
+        """
+        loop = asyncio.get_running_loop()
+        delay: float = self.retry_delay
+        for attempt in range(1, self.max_attempts + 1):
+            try:
+                with SHEET_INSERT_SECONDS.time():
+                    is_inserted: bool = await loop.run_in_executor(
+                        self._executor, self._inserter.insert_rows, rows, googlesheet_file_url
+                    )
+            except Exception as error:
+                logger.error(f"{error}: Trouble sheet: {googlesheet_file_url}")
+                is_inserted = False
+            if is_inserted:
+                return True
+            if attempt < self.max_attempts:
+                logger.warning(
+                    f"Retry {len(rows)} rows to {googlesheet_file_url} in {delay:.1f}s"
+                    f" (attempt {attempt} of {self.max_attempts})"
+                )
+                SHEET_ROWS.inc(len(rows), result="retried")
+                await asyncio.sleep(delay)
+                delay *= 2
+        return False
+
+    async def _run(self) -> None:
+        """Фоновый обработчик: собирает пачки и сбрасывает их до получения маркера остановки."""
+        stopping: bool = False
+        while not stopping:
+            batch, stopping = await self._collect_batch()
+            if batch:
+                await self._flush(batch)
+
+    async def close(self) -> None:
+        """Сбрасывает все накопленные записи и останавливает обработчик."""
+        if self._worker is not None:
+            await self._queue.put(_STOP)
+            await self._worker
+            self._worker = None
+        self._executor.shutdown(wait=True)
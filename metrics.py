@@ -0,0 +1,284 @@
+import asyncio
+import bisect
+import time
+from abc import ABC, abstractmethod
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterator, List, Optional, Tuple, Any
+from aiohttp import web
+from loguru import logger
+
+LabelValues = Tuple[str, ...]
+
+# Границы корзин гистограмм задержек, в секундах
+DEFAULT_BUCKETS: Tuple[float, ...] = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+
+class Metric(ABC):
+    """Базовый класс метрики с метками в формате Prometheus."""
+
+    kind: str = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Tuple[str, ...] = ()) -> None:
+        """Инициализирует класс.
+        Args:
+            name (str): Имя метрики.
+            documentation (str): Описание метрики (строка HELP).
+            labelnames (Tuple[str, ...]): Имена меток.
+        Returns:
+        """
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+
+    def _label_values(self, labels: Dict[str, Any]) -> LabelValues:
+        return tuple(str(labels[labelname]) for labelname in self.labelnames)
+
+    def _format_labels(self, values: LabelValues, extra: str = "") -> str:
+        pairs: List[str] = [f'{name}="{value}"' for name, value in zip(self.labelnames, values)]
+        if extra:
+            pairs.append(extra)
+        return "{" + ",".join(pairs) + "}" if pairs else ""
+
+    @abstractmethod
+    def samples(self) -> Iterator[Tuple[str, str, float]]:
+        """Перебирает значения метрики: (имя, метки, значение)."""
+
+    def render(self) -> str:
+        """Возвращает метрику в текстовом формате Prometheus."""
+        lines: List[str] = [
+            f"# HELP {self.name} {self.documentation}",
+            f"# TYPE {self.name} {self.kind}",
+        ]
+        lines.extend(f"{name}{labels} {value}" for name, labels, value in self.samples())
+        return "\n".join(lines)
+
+
+class Counter(Metric):
+    """Монотонно растущий счетчик."""
+
+    kind = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames: Tuple[str, ...] = ()) -> None:
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[LabelValues, float] = {}
+
+    def inc(self, amount: float = 1, **labels: Any) -> None:
+        """Увеличивает счетчик."""
+        key: LabelValues = self._label_values(labels)
+        self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels: Any) -> float:
+        """Возвращает значение счетчика."""
+        return self._values.get(self._label_values(labels), 0)
+
+    def samples(self) -> Iterator[Tuple[str, str, float]]:
+        for key, value in sorted(self._values.items()):
+            yield self.name, self._format_labels(key), value
+
+
+class Gauge(Metric):
+    """Значение, которое может расти и уменьшаться, либо вычисляется функцией при чтении."""
+
+    kind = "gauge"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Tuple[str, ...] = (),
+        collect: Optional[Callable[[], Dict[LabelValues, float]]] = None,
+    ) -> None:
+        """Инициализирует класс.
+        Args:
+            collect (Optional[Callable[[], Dict[LabelValues, float]]]): Функция, возвращающая
+                значения метрики по меткам при каждом чтении.
+        Returns:
+        """
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[LabelValues, float] = {}
+        self.collect = collect
+
+    def set(self, value: float, **labels: Any) -> None:
+        """Устанавливает значение."""
+        self._values[self._label_values(labels)] = value
+
+    def samples(self) -> Iterator[Tuple[str, str, float]]:
+        values: Dict[LabelValues, float] = self.collect() if self.collect else self._values
+        for key, value in sorted(values.items()):
+            yield self.name, self._format_labels(key), value
+
+
+class Histogram(Metric):
+    """Распределение значений (задержек) по корзинам."""
+
+    kind = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Tuple[str, ...] = (),
+        buckets: Tuple[float, ...] = DEFAULT_BUCKETS,
+    ) -> None:
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # Для каждого набора меток: счетчики корзин (последняя - +Inf), сумма и количество
+        self._values: Dict[LabelValues, Tuple[List[int], List[float]]] = {}
+
+    def observe(self, value: float, **labels: Any) -> None:
+        """Добавляет наблюдение."""
+        key: LabelValues = self._label_values(labels)
+        if key not in self._values:
+            self._values[key] = ([0] * (len(self.buckets) + 1), [0.0, 0.0])
+        bucket_counts, total = self._values[key]
+        bucket_counts[bisect.bisect_left(self.buckets, value)] += 1
+        total[0] += value
+        total[1] += 1
+
+    @contextmanager
+    def time(self, **labels: Any) -> Iterator[None]:
+        """Измеряет длительность блока with и добавляет ее как наблюдение."""
+        started_at: float = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started_at, **labels)
+
+    def summary(self, **labels: Any) -> Tuple[int, float]:
+        """Возвращает количество наблюдений и среднее значение."""
+        if self._label_values(labels) not in self._values:
+            return 0, 0.0
+        _, (total_sum, count) = self._values[self._label_values(labels)]
+        return int(count), total_sum / count if count else 0.0
+
+    def summaries(self) -> Iterator[Tuple[str, int, float]]:
+        """Перебирает количество наблюдений и среднее значение по наборам меток: (метки, количество, среднее)."""
+        for key, (_, (total_sum, count)) in sorted(self._values.items()):
+            yield self._format_labels(key), int(count), total_sum / count if count else 0.0
+
+    def samples(self) -> Iterator[Tuple[str, str, float]]:
+        for key, (bucket_counts, (total_sum, count)) in sorted(self._values.items()):
+            cumulative: int = 0
+            for bound, bucket_count in zip(self.buckets + (float("inf"),), bucket_counts):
+                cumulative += bucket_count
+                le: str = "+Inf" if bound == float("inf") else repr(bound)
+                yield f"{self.name}_bucket", self._format_labels(key, f'le="{le}"'), cumulative
+            yield f"{self.name}_sum", self._format_labels(key), total_sum
+            yield f"{self.name}_count", self._format_labels(key), count
+
+
+class MetricsRegistry:
+    """Набор метрик бота."""
+
+    def __init__(self) -> None:
+        self._metrics: Dict[str, Metric] = {}
+
+    def register(self, metric: Metric) -> Metric:
+        """Добавляет метрику в набор и возвращает ее."""
+        self._metrics[metric.name] = metric
+        return metric
+
+    def __iter__(self) -> Iterator[Metric]:
+        return iter(list(self._metrics.values()))
+
+    def render(self) -> str:
+        """Возвращает все метрики в текстовом формате Prometheus."""
+        return "\n".join(metric.render() for metric in self) + "\n"
+
+
+registry: MetricsRegistry = MetricsRegistry()
+
+HANDLER_SECONDS: Histogram = registry.register(
+    Histogram("healthpoll_handler_seconds", "Handler processing time.", ("handler",))
+)
+VK_API_SECONDS: Histogram = registry.register(
+    Histogram("healthpoll_vk_api_seconds", "VK API call latency.", ("method",))
+)
+VK_API_ERRORS: Counter = registry.register(
+    Counter("healthpoll_vk_api_errors_total", "VK API errors by error code.", ("method", "code"))
+)
+SHEET_INSERT_SECONDS: Histogram = registry.register(
+    Histogram("healthpoll_sheet_insert_seconds", "Google Sheet batch insert latency.")
+)
+SHEET_ROWS: Counter = registry.register(
+    Counter("healthpoll_sheet_rows_total", "Rows sent to Google Sheet by result.", ("result",))
+)
+SHEET_QUEUE_DEPTH: Gauge = registry.register(
+    Gauge("healthpoll_sheet_queue_depth", "Rows waiting in the Google Sheet write queue.")
+)
+RESPONDENTS: Gauge = registry.register(
+    Gauge("healthpoll_respondents", "Respondents of active polls by poll stage.", ("stage",))
+)
+OUTBOX_MESSAGES: Counter = registry.register(
+    Counter("healthpoll_outbox_messages_total", "Outbox send attempts by result.", ("result",))
+)
+OUTBOX_PENDING: Gauge = registry.register(
+    Gauge("healthpoll_outbox_pending", "Messages waiting in the outbox.")
+)
+CALLBACK_EVENTS: Counter = registry.register(
+    Counter("healthpoll_callback_events_total", "Callback API requests by result.", ("result",))
+)
+CALLBACK_QUEUE_DEPTH: Gauge = registry.register(
+    Gauge("healthpoll_callback_queue_depth", "Callback API events waiting for a worker.")
+)
+LOOP_LAG_SECONDS: Histogram = registry.register(
+    Histogram(
+        "healthpoll_loop_lag_seconds",
+        "Delay of event loop timer callbacks.",
+        buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0),
+    )
+)
+LOOP_STALLS: Counter = registry.register(
+    Counter("healthpoll_loop_stalls_total", "Event loop stalls longer than the threshold.")
+)
+STARTUP_SECONDS: Gauge = registry.register(
+    Gauge("healthpoll_startup_seconds", "Time from process start to the end of a startup phase.", ("phase",))
+)
+
+
+@contextmanager
+def track_vk_call(method: str) -> Iterator[None]:
+    """Измеряет длительность вызова VK API и считает ошибки по кодам."""
+    started_at: float = time.perf_counter()
+    try:
+        yield
+    except Exception as error:
+        VK_API_ERRORS.inc(method=method, code=getattr(error, "code", type(error).__name__))
+        raise
+    finally:
+        VK_API_SECONDS.observe(time.perf_counter() - started_at, method=method)
+
+
+async def start_metrics_server(host: str, port: int) -> web.AppRunner:
+    """Запускает HTTP сервер, отдающий метрики по адресу /metrics.
+    Args:
+        host (str): Адрес, на котором слушает сервер.
+        port (int): Порт сервера.
+    Returns:
+        web.AppRunner: запущенный сервер (для остановки через cleanup()).
+    """
+
+    async def metrics_handler(request: web.Request) -> web.Response:
+        return web.Response(text=registry.render(), content_type="text/plain", charset="utf-8")
+
+    app: web.Application = web.Application()
+    app.router.add_get("/metrics", metrics_handler)
+    runner: web.AppRunner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    await web.TCPSite(runner, host, port).start()
+    return runner
+
+
+async def log_summary(interval: float) -> None:
+    """Периодически пишет в лог краткую сводку метрик."""
+    while True:
+        await asyncio.sleep(interval)
+        parts: List[str] = []
+        for metric in registry:
+            if isinstance(metric, Histogram):
+                for labels, count, mean in metric.summaries():
+                    parts.append(f"{metric.name}{labels} n={count} avg={mean * 1000:.1f}ms")
+            else:
+                for name, labels, value in metric.samples():
+                    parts.append(f"{name}{labels}={value:g}")
+        logger.info("Metrics: " + "; ".join(parts))
@@ -0,0 +1,156 @@
+import asyncio
+import json
+import os
+import threading
+import time
+import aiohttp
+from typing import Dict, Iterable, List, Optional, Tuple, Any
+from vkwave.api.methods._error import APIError
+from loguru import logger
+import pollutils
+from metrics import track_vk_call
+
+# Максимальное количество id в одном вызове users.get
+MAX_USER_IDS_PER_CALL = 1000
+
+
+class NameResolver:
+    """Кэш имен пользователей ВКонтакте ("Фамилия Имя") с пакетной загрузкой через users.get.
+    Имена хранятся ttl секунд, одновременные запросы одного id объединяются в один.
+    """
+
+    def __init__(self, api_context: Any, ttl: float = 7 * 24 * 3600, cache_file: str = "") -> None:
+        """Инициализирует класс и загружает сохраненный кэш.
+        Args:
+            api_context (Any): Контекст VK API (bot.api_context).
+            ttl (float): Время жизни имени в кэше, в секундах.
+            cache_file (str): Файл для сохранения кэша между перезапусками, пустая строка - не сохранять.
+        Returns:
+        """
+        self.api_context = api_context
+        self.ttl = ttl
+        self.cache_file = cache_file
+        self._names: Dict[str, Tuple[str, float]] = {}
+        self._pending: Dict[str, asyncio.Future] = {}
+        self._save_lock = threading.Lock()
+        self._load()
+
+    def _load(self) -> None:
+        """Загружает кэш из файла, пропуская устаревшие имена."""
+        if not self.cache_file or not os.path.exists(self.cache_file):
+            return
+        try:
+            with open(self.cache_file, "r", encoding="UTF-8") as file:
+                cached: Dict[str, List[Any]] = json.load(file)
+        except (OSError, ValueError) as error:
+            logger.debug(f"{error}: Trouble name cache: {self.cache_file}")
+            return
+        now: float = time.time()
+        self._names = {
+            user_id: (name, expires_at)
+            for user_id, (name, expires_at) in cached.items()
+            if expires_at > now
+        }
+
+    def _snapshot(self) -> Dict[str, List[Any]]:
+        """Возвращает актуальные записи кэша в формате файла."""
+        now: float = time.time()
+        return {
+            user_id: [name, expires_at]
+            for user_id, (name, expires_at) in self._names.items()
+            if expires_at > now
+        }
+
+    def _write(self, snapshot: Dict[str, List[Any]]) -> None:
+        with self._save_lock:
+            with open(self.cache_file, "w", encoding="UTF-8") as file:
+                json.dump(snapshot, file, ensure_ascii=False)
+
+    def save(self) -> None:
+        """Сохраняет кэш в файл."""
+        if self.cache_file:
+            self._write(self._snapshot())
+
+    async def save_async(self) -> None:
+        """Сохраняет кэш в файл из пула потоков, не задерживая эвентлуп записью на диск."""
+        if self.cache_file:
+            await asyncio.get_running_loop().run_in_executor(None, self._write, self._snapshot())
+
+    def get_cached(self, user_id: str) -> Optional[str]:
+        """Возвращает имя из кэша или None, если его нет или оно устарело."""
+        cached: Optional[Tuple[str, float]] = self._names.get(user_id)
+        if cached is None or cached[1] <= time.time():
+            return None
+        return cached[0]
+
+    def cached_names(self) -> Dict[str, str]:
+        """Возвращает все актуальные имена из кэша по id пользователей."""
+        now: float = time.time()
+        return {user_id: name for user_id, (name, expires_at) in self._names.items() if expires_at > now}
+
+    async def _fetch(self, user_ids: List[str]) -> None:
+        """Загружает имена пачками по 1000 id и завершает ожидающие их запросы."""
+        loop = asyncio.get_running_loop()
+        for user_id in user_ids:
+            self._pending[user_id] = loop.create_future()
+        try:
+            for index in range(0, len(user_ids), MAX_USER_IDS_PER_CALL):
+                batch: List[str] = user_ids[index:index + MAX_USER_IDS_PER_CALL]
+                try:
+                    with track_vk_call("users.get"):
+                        user_vk_profiles_data: Dict[str, Any] = await self.api_context.users.get(
+                            user_ids=batch, return_raw_response=True
+                        )
+                except APIError as get_error:
+                    logger.debug(f"{get_error.message}: Trouble ids: {batch[0]}..{batch[-1]}")
+                    continue
+                except (aiohttp.ClientError, asyncio.TimeoutError) as network_error:
+                    # Имена не загружены: resolve вернет id, имя загрузится при следующем обращении
+                    logger.warning(f"{network_error!r}: Trouble ids: {batch[0]}..{batch[-1]}")
+                    continue
+                expires_at: float = time.time() + self.ttl
+                for profile in user_vk_profiles_data.get("response", []):
+                    self._names[str(profile["id"])] = (
+                        pollutils.format_lastname_firstname(profile),
+                        expires_at,
+                    )
+        finally:
+            for user_id in user_ids:
+                future: asyncio.Future = self._pending.pop(user_id)
+                if not future.done():
+                    future.set_result(self.get_cached(user_id))
+
+    async def prefetch(self, user_ids: Iterable[str]) -> None:
+        """Загружает имена всех пользователей, которых еще нет в кэше.
+        Args:
+            user_ids (Iterable[str]): id пользователей, например участников опроса.
+        Returns:
+        """
+        now: float = time.time()
+        self._names = {
+            user_id: cached for user_id, cached in self._names.items() if cached[1] > now
+        }
+        missing: List[str] = list(
+            dict.fromkeys(
+                str(user_id)
+                for user_id in user_ids
+                if self.get_cached(str(user_id)) is None and str(user_id) not in self._pending
+            )
+        )
+        if missing:
+            await self._fetch(missing)
+
+    async def resolve(self, user_id: str) -> str:
+        """Возвращает "Фамилия Имя" пользователя.
+        Если имя загрузить не удалось, возвращается id пользователя, чтобы строка результата не потерялась.
+        """
+        user_id = str(user_id)
+        name: Optional[str] = self.get_cached(user_id)
+        if name is not None:
+            return name
+        if user_id in self._pending:
+            name = await asyncio.shield(self._pending[user_id])
+        else:
+            await self._fetch([user_id])
+            name = self.get_cached(user_id)
+        return name if name is not None else user_id
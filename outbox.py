@@ -0,0 +1,301 @@
+import asyncio
+import itertools
+import sqlite3
+import uuid
+from collections import deque
+from dataclasses import dataclass
+from typing import Deque, Dict, Iterable, List, Optional, Union, Any
+import aiohttp
+from vkwave.api.methods._error import APIError
+from loguru import logger
+from broadcaster import DeliveryReport, TokenBucket
+from metrics import OUTBOX_MESSAGES, track_vk_call
+from sqlite_writer import SQLiteWriter
+
+# Коды ошибок VK API, после которых повтор не поможет:
+# 7 - нет прав, 900 - пользователь в черном списке, 901 - нет разрешения на сообщения,
+# 902 - настройки приватности, 911/912/914 - некорректная клавиатура или слишком длинное сообщение
+PERMANENT_ERROR_CODES = frozenset({7, 900, 901, 902, 911, 912, 914})
+
+
+def is_permanent_error(code: Optional[int]) -> bool:
+    """Проверяет, что сообщение с такой ошибкой VK API повторять бессмысленно."""
+    return code in PERMANENT_ERROR_CODES
+
+
+@dataclass(slots=True)
+class OutboxMessage:
+    """Сообщение, ожидающее отправки.
+    Attr:
+        message_id (int): id записи в журнале.
+        peer_id (int): id получателя.
+        random_id (int): random_id для messages.send, один на все попытки отправки.
+        message (str): Текст сообщения.
+        keyboard (Optional[str]): Клавиатура в формате JSON.
+        attempts (int): Количество неудачных попыток отправки.
+    """
+
+    message_id: int
+    peer_id: int
+    random_id: int
+    message: str
+    keyboard: Optional[str] = None
+    attempts: int = 0
+
+
+class Outbox:
+    """Очередь исходящих сообщений с журналом в SQLite.
+    Сообщение записывается в журнал до отправки и удаляется из него после ответа VK,
+    поэтому после перезапуска неотправленные сообщения отправляются снова.
+    Сообщения одному получателю уходят строго по порядку, разным - параллельно.
+    Временные ошибки повторяются с экспоненциальной задержкой, повтор с тем же
+    random_id не продублирует уже доставленное сообщение.
+    Массовую рассылку выполняет Broadcaster: получатели записываются в журнал до нее (hold),
+    а после нее доставленные удаляются из журнала, остальные ставятся в очередь (release).
+    Журнал пишет поток SQLiteWriter пачками, эвентлуп не ждет commit; id записей
+    выдаются в памяти, поэтому send не ждет вставки.
+    """
+
+    def __init__(
+        self,
+        api_context: Any,
+        path: str = ":memory:",
+        workers: int = 4,
+        bucket: Optional[TokenBucket] = None,
+        max_attempts: int = 10,
+        backoff: float = 1.0,
+        max_backoff: float = 300.0,
+    ) -> None:
+        """Инициализирует класс и открывает журнал.
+        Args:
+            api_context (Any): Контекст VK API (bot.api_context).
+            path (str): Путь до файла журнала.
+            workers (int): Количество одновременно отправляющих обработчиков.
+            bucket (Optional[TokenBucket]): Ограничитель частоты вызовов, общий с рассылкой.
+            max_attempts (int): Количество попыток, после которого сообщение считается недоставленным.
+            backoff (float): Задержка перед первым повтором, в секундах.
+            max_backoff (float): Максимальная задержка перед повтором, в секундах.
+        Returns:
+        """
+        self.api_context = api_context
+        self.workers = max(1, workers)
+        self.bucket = bucket if bucket else TokenBucket(20)
+        self.max_attempts = max_attempts
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute("PRAGMA synchronous=NORMAL")
+        self._connection.execute(
+            """CREATE TABLE IF NOT EXISTS outbox (
+                message_id INTEGER PRIMARY KEY AUTOINCREMENT,
+                peer_id INTEGER NOT NULL,
+                random_id INTEGER NOT NULL,
+                message TEXT NOT NULL,
+                keyboard TEXT,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                failed INTEGER NOT NULL DEFAULT 0,
+                last_error TEXT NOT NULL DEFAULT ''
+            )"""
+        )
+        self._connection.commit()
+        (last_message_id,) = self._connection.execute("SELECT COALESCE(MAX(message_id), 0) FROM outbox").fetchone()
+        self._message_ids = itertools.count(last_message_id + 1)
+        self._writer: SQLiteWriter = SQLiteWriter(self._connection, "outbox-writer")
+        # Неотправленные сообщения каждого получателя в порядке добавления
+        self._peers: Dict[int, Deque[OutboxMessage]] = {}
+        # Получатели, первое сообщение которых можно отправлять
+        self._ready: asyncio.Queue = asyncio.Queue()
+        self._idle: asyncio.Event = asyncio.Event()
+        self._idle.set()
+        self._tasks: List[asyncio.Task] = []
+
+    @property
+    def pending(self) -> int:
+        """Возвращает количество сообщений, ожидающих отправки."""
+        return sum(len(messages) for messages in self._peers.values())
+
+    async def start(self) -> None:
+        """Загружает неотправленные сообщения из журнала и запускает обработчики."""
+        if self._tasks:
+            return
+        # Журнал читается, когда поток записи дописал все изменения и не пишет
+        await asyncio.wrap_future(self._writer.sync())
+        # Сообщения, добавленные send до запуска, уже стоят в очереди
+        queued: set = {outbox_message.message_id for messages in self._peers.values() for outbox_message in messages}
+        for message_id, peer_id, random_id, message, keyboard, attempts in self._connection.execute(
+            """SELECT message_id, peer_id, random_id, message, keyboard, attempts
+            FROM outbox WHERE failed = 0 ORDER BY message_id"""
+        ):
+            if message_id in queued:
+                continue
+            self._append(OutboxMessage(message_id, peer_id, random_id, message, keyboard, attempts))
+        if self._peers:
+            logger.info(f"Outbox: {self.pending} messages to {len(self._peers)} peers restored")
+        self._tasks = [asyncio.create_task(self._run()) for _ in range(self.workers)]
+
+    async def close(self) -> None:
+        """Останавливает обработчики. Неотправленные сообщения остаются в журнале."""
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        await asyncio.get_running_loop().run_in_executor(None, self._writer.close)
+
+    async def join(self) -> None:
+        """Ожидает, пока все сообщения будут отправлены или признаны недоставленными."""
+        await self._idle.wait()
+
+    def _append(self, outbox_message: OutboxMessage) -> None:
+        """Добавляет сообщение в очередь получателя."""
+        messages: Optional[Deque[OutboxMessage]] = self._peers.get(outbox_message.peer_id)
+        if messages is None:
+            self._peers[outbox_message.peer_id] = deque([outbox_message])
+            self._ready.put_nowait(outbox_message.peer_id)
+        else:
+            messages.append(outbox_message)
+        self._idle.clear()
+
+    def send(self, peer_id: int, message: str, keyboard: Optional[str] = None) -> int:
+        """Записывает сообщение в журнал и ставит его в очередь на отправку.
+        Args:
+            peer_id (int): id получателя.
+            message (str): Текст сообщения.
+            keyboard (Optional[str]): Клавиатура в формате JSON.
+        Returns:
+            int: id записи в журнале.
+        """
+        outbox_message: OutboxMessage = self._journal(int(peer_id), message, keyboard)
+        self._append(outbox_message)
+        return outbox_message.message_id
+
+    def _journal(self, peer_id: int, message: str, keyboard: Optional[str]) -> OutboxMessage:
+        """Создает запись журнала и ставит ее вставку в очередь записи."""
+        outbox_message: OutboxMessage = OutboxMessage(
+            next(self._message_ids), peer_id, uuid.uuid4().int & 0x7FFFFFFF, message, keyboard
+        )
+        self._writer.execute(
+            "INSERT INTO outbox (message_id, peer_id, random_id, message, keyboard) VALUES (?, ?, ?, ?, ?)",
+            (outbox_message.message_id, peer_id, outbox_message.random_id, message, keyboard),
+        )
+        return outbox_message
+
+    async def hold(
+        self, peer_ids: Iterable[Union[str, int]], message: str, keyboard: Optional[str] = None
+    ) -> Dict[int, OutboxMessage]:
+        """Записывает сообщение всем получателям рассылки в журнал, не ставя его в очередь.
+        Возвращает управление, когда записи на диске: если процесс завершится до release,
+        сообщения отправятся после перезапуска.
+        Args:
+            peer_ids (Iterable[Union[str, int]]): id получателей.
+            message (str): Текст сообщения.
+            keyboard (Optional[str]): Клавиатура в формате JSON.
+        Returns:
+            Dict[int, OutboxMessage]: записи журнала по id получателя (для release).
+        """
+        held: Dict[int, OutboxMessage] = {
+            int(peer_id): self._journal(int(peer_id), message, keyboard) for peer_id in peer_ids
+        }
+        await asyncio.wrap_future(self._writer.sync())
+        return held
+
+    def release(self, held: Dict[int, OutboxMessage], report: DeliveryReport) -> None:
+        """Отмечает результат рассылки записанных через hold сообщений.
+        Доставленные удаляются из журнала, после постоянной ошибки помечаются недоставленными,
+        остальные (временная ошибка или нет в отчете) ставятся в очередь на отправку.
+        Args:
+            held (Dict[int, OutboxMessage]): Записи журнала, которые вернул hold.
+            report (DeliveryReport): Отчет о рассылке.
+        Returns:
+        """
+        delivered: set = set(report.delivered)
+        self._writer.executemany(
+            "DELETE FROM outbox WHERE message_id = ?",
+            ((held[peer_id].message_id,) for peer_id in delivered if peer_id in held),
+        )
+        self._writer.executemany(
+            "UPDATE outbox SET failed = 1, last_error = ? WHERE message_id = ?",
+            (
+                (error, held[peer_id].message_id)
+                for peer_id, error in report.failed.items()
+                if peer_id in held and is_permanent_error(report.error_codes.get(peer_id))
+            ),
+        )
+        for peer_id, outbox_message in held.items():
+            if peer_id not in delivered and not is_permanent_error(report.error_codes.get(peer_id)):
+                self._append(outbox_message)
+
+    def _finish(self, outbox_message: OutboxMessage, error: str = "") -> None:
+        """Убирает сообщение из очереди: удаляет из журнала или помечает недоставленным."""
+        if error:
+            self._writer.execute(
+                "UPDATE outbox SET failed = 1, attempts = ?, last_error = ? WHERE message_id = ?",
+                (outbox_message.attempts, error, outbox_message.message_id),
+            )
+        else:
+            self._writer.execute("DELETE FROM outbox WHERE message_id = ?", (outbox_message.message_id,))
+        messages: Deque[OutboxMessage] = self._peers[outbox_message.peer_id]
+        messages.popleft()
+        if messages:
+            self._ready.put_nowait(outbox_message.peer_id)
+        else:
+            del self._peers[outbox_message.peer_id]
+            if not self._peers:
+                self._idle.set()
+
+    def _retry_later(self, outbox_message: OutboxMessage, error: str, permanent: bool = False) -> None:
+        """Откладывает повтор отправки первого сообщения получателя
+        или признает его недоставленным после постоянной ошибки или max_attempts попыток.
+        """
+        outbox_message.attempts += 1
+        if permanent or outbox_message.attempts >= self.max_attempts:
+            logger.debug(f"{error}: Trouble id: {outbox_message.peer_id}")
+            OUTBOX_MESSAGES.inc(result="failed")
+            self._finish(outbox_message, error)
+            return
+        OUTBOX_MESSAGES.inc(result="retried")
+        self._writer.execute(
+            "UPDATE outbox SET attempts = ?, last_error = ? WHERE message_id = ?",
+            (outbox_message.attempts, error, outbox_message.message_id),
+        )
+        delay: float = min(self.max_backoff, self.backoff * 2 ** (outbox_message.attempts - 1))
+        asyncio.get_running_loop().call_later(delay, self._ready.put_nowait, outbox_message.peer_id)
+
+    async def _deliver(self, outbox_message: OutboxMessage) -> None:
+        """Отправляет первое сообщение получателя и обрабатывает результат."""
+        await self.bucket.acquire()
+        try:
+            with track_vk_call("messages.send"):
+                await self.api_context.messages.send(
+                    peer_id=outbox_message.peer_id,
+                    random_id=outbox_message.random_id,
+                    message=outbox_message.message,
+                    keyboard=outbox_message.keyboard,
+                    return_raw_response=True,
+                )
+        except APIError as send_error:
+            self._retry_later(
+                outbox_message,
+                f"[{send_error.code}] {send_error.message}",
+                permanent=is_permanent_error(send_error.code),
+            )
+            return
+        except (aiohttp.ClientError, asyncio.TimeoutError) as network_error:
+            self._retry_later(outbox_message, repr(network_error))
+            return
+        OUTBOX_MESSAGES.inc(result="sent")
+        self._finish(outbox_message)
+
+    async def _run(self) -> None:
+        """Берет получателя из очереди готовых и отправляет его первое сообщение."""
+        while True:
+            peer_id: int = await self._ready.get()
+            messages: Optional[Deque[OutboxMessage]] = self._peers.get(peer_id)
+            if messages:
+                try:
+                    await self._deliver(messages[0])
+                except asyncio.CancelledError:
+                    raise
+                except Exception as error:
+                    logger.exception(f"{error}: Trouble id: {peer_id}")
+                    self._retry_later(messages[0], repr(error))
@@ -0,0 +1,103 @@
+import asyncio
+import json
+import os
+from typing import Any, Dict, List, Optional, Tuple
+from loguru import logger
+from poll_dispatcher import PollDispatcher
+
+try:
+    import yaml
+except ImportError:
+    yaml = None
+
+
+def load_definition(path: str) -> Dict[str, Any]:
+    """Читает описание опроса из JSON или YAML файла (YAML - если установлен PyYAML).
+    Args:
+        path (str): Путь до файла описания.
+    Returns:
+        Dict[str, Any]: описание опроса в формате DEFAULT_POLL_DEFINITION.
+    Raises:
+        EnvironmentError: если файл не удалось прочитать.
+        ValueError: если файл не разбирается или описание - не словарь.
+    """
+    with open(path, "r", encoding="UTF-8") as file:
+        if path.lower().endswith((".yaml", ".yml")):
+            if yaml is None:
+                raise ValueError(f"{path}: PyYAML is not installed, use a JSON poll definition")
+            try:
+                definition: Any = yaml.safe_load(file)
+            except yaml.YAMLError as error:
+                raise ValueError(f"{path}: {error}") from error
+        else:
+            definition = json.load(file)
+    if not isinstance(definition, dict):
+        raise ValueError(f"{path}: poll definition must be a mapping")
+    return definition
+
+
+class PollDefinitionWatcher:
+    """Перезагрузка описания опроса при изменении файла, без перезапуска бота.
+    Файл проверяется по времени изменения и размеру раз в interval секунд. Новое описание
+    читается в потоке, собирается в граф переходов и заменяет текущий в PollDispatcher;
+    если описание некорректно, бот продолжает работать со старым.
+    """
+
+    def __init__(self, path: str, dispatcher: PollDispatcher, interval: float = 5.0) -> None:
+        """Инициализирует класс.
+        Args:
+            path (str): Путь до файла описания опроса.
+            dispatcher (PollDispatcher): Конечный автомат, граф которого заменяется.
+            interval (float): Период проверки файла, в секундах.
+        Returns:
+        """
+        self.path = path
+        self.dispatcher = dispatcher
+        self.interval = interval
+        self._stat: Optional[Tuple[int, int]] = self._read_stat()
+        self._task: Optional[asyncio.Task] = None
+
+    def _read_stat(self) -> Optional[Tuple[int, int]]:
+        try:
+            stat: os.stat_result = os.stat(self.path)
+        except OSError:
+            return None
+        return stat.st_mtime_ns, stat.st_size
+
+    async def start(self) -> None:
+        """Запускает проверку файла."""
+        if self._task is None and self.interval > 0:
+            self._task = asyncio.create_task(self._run())
+
+    async def close(self) -> None:
+        """Останавливает проверку файла."""
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    async def reload(self) -> bool:
+        """Перечитывает файл и заменяет граф переходов.
+        Returns:
+            bool: True, если граф заменен.
+        """
+        loop = asyncio.get_running_loop()
+        try:
+            definition: Dict[str, Any] = await loop.run_in_executor(None, load_definition, self.path)
+            kept: List[str] = self.dispatcher.load(definition)
+        except (OSError, ValueError) as error:
+            logger.error(f"{error}: Trouble poll definition: {self.path}, keeping the previous one")
+            return False
+        logger.info(f"Poll definition reloaded from {self.path}")
+        if kept:
+            logger.warning(f"Stages {kept} are not in {self.path}, kept for respondents in progress")
+        return True
+
+    async def _run(self) -> None:
+        while True:
+            await asyncio.sleep(self.interval)
+            stat: Optional[Tuple[int, int]] = self._read_stat()
+            if stat is None or stat == self._stat:
+                continue
+            self._stat = stat
+            await self.reload()
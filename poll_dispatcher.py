@@ -0,0 +1,432 @@
+import re
+from dataclasses import dataclass, field, replace
+from typing import Callable, Dict, List, Optional, Sequence, Tuple, Union, Any
+from state_store import DONE_STAGE, PollStage, RespondentRecord
+from poll_report import StatsKey
+
+# Регулярные выражения компилируются один раз при импорте модуля
+DATE_PATTERN: re.Pattern = re.compile(r"\d{1,2}[./\\]\d{1,2}[./\\]\d{2,4}")
+START_COMMAND_PATTERN: re.Pattern = re.compile(r"[!/]start (\S+) (https://docs\.google\.com/\S+)")
+
+# Словарь с вопросами, где стадии соответствует вопрос
+QUESTIONS: Dict[PollStage, Union[str, List[Any]]] = {
+    PollStage.WILL_CERTIFICATE: [
+        "Будет ли справка",
+        ["Будет", "Нет, буду лечиться дома"],
+    ],
+    PollStage.CERTIFICATE_DATA: "От какого числа будет справка? Например, 10.11.2021 (только в таком формате)",
+    PollStage.SYMPTOMS: "Опишите ваши симптомы, через символ. Например, температура, кашель, болит горло",
+    PollStage.LAST_DAY_IN_UNIVERSATY: "Какого числа были последний день на занятиях? Например, 10.11.2021 (только в таком формате)",
+    PollStage.DONE: "Спасибо, что прошли опрос. В случае ошибки или возникновения вопросов, пишите https://vk.com/me_lnikov",
+    PollStage.IS_ILL: "Вы болеете?"
+}
+IS_ILL_ANSWERS: List[str] = ["Да", "Нет"]
+HEALTHY_MESSAGE: str = f"Ну и хорошо. Не болей! \n{QUESTIONS[PollStage.DONE]}"
+REMINDER_PREFIX: str = "Напоминание: пожалуйста, ответьте на вопрос опроса.\n"
+
+# Описание опроса по умолчанию - тот же опрос, что QUESTIONS.
+# Формат описания из файла такой же (см. poll-definition.example.json):
+#   first_stage - стадия, вопрос которой рассылается при запуске опроса;
+#   stages - стадии с любыми именами, кроме DONE (последняя стадия любого опроса): текст вопроса
+#     (question), варианты ответа для клавиатуры (answers) и имя payload (payload), проверка
+#     ответа (validator: choice, date, text или regex с pattern), имя поля, под которым ответ
+#     хранится в состоянии респондента (field), и значения поля по вариантам ответа (values),
+#     следующая стадия (next) - одна для всех ответов или по вариантам ответа; переход может
+#     задать свой текст (message) и, для DONE, отключить запись результата в Google Sheet (write: false);
+#   columns - столбцы строки Google Sheet: name, date или field одной из стадий; по умолчанию
+#     name, поля стадий в порядке описания и date.
+# Новый вопрос - новая стадия с новым field: схема хранилища и код не меняются, итоги опроса
+# считают варианты ответа на вопросы с validator choice.
+DEFAULT_POLL_DEFINITION: Dict[str, Any] = {
+    "first_stage": PollStage.IN_PROGRESS.name,
+    "done_message": QUESTIONS[PollStage.DONE],
+    "reminder_prefix": REMINDER_PREFIX,
+    "stages": {
+        PollStage.IN_PROGRESS.name: {
+            "question": QUESTIONS[PollStage.IS_ILL],
+            "answers": IS_ILL_ANSWERS,
+            "payload": "yes_no",
+            "validator": "choice",
+            "field": "ill",
+            "values": {"Да": True, "Нет": False},
+            "next": {
+                "Да": PollStage.WILL_CERTIFICATE.name,
+                "Нет": {"stage": PollStage.DONE.name, "message": HEALTHY_MESSAGE, "write": False},
+            },
+        },
+        PollStage.WILL_CERTIFICATE.name: {
+            "question": QUESTIONS[PollStage.WILL_CERTIFICATE][0],
+            "answers": QUESTIONS[PollStage.WILL_CERTIFICATE][1],
+            "payload": "will_certificate",
+            "validator": "choice",
+            "field": "medical_certificate",
+            "values": {"Будет": True, "Нет, буду лечиться дома": False},
+            "next": {
+                "Будет": PollStage.CERTIFICATE_DATA.name,
+                "Нет, буду лечиться дома": PollStage.SYMPTOMS.name,
+            },
+        },
+        PollStage.CERTIFICATE_DATA.name: {
+            "question": QUESTIONS[PollStage.CERTIFICATE_DATA],
+            "validator": "date",
+            "field": "medical_certificate_data",
+            "next": PollStage.SYMPTOMS.name,
+        },
+        PollStage.SYMPTOMS.name: {
+            "question": QUESTIONS[PollStage.SYMPTOMS],
+            "validator": "text",
+            "field": "diagnosis",
+            "next": PollStage.LAST_DAY_IN_UNIVERSATY.name,
+        },
+        PollStage.LAST_DAY_IN_UNIVERSATY.name: {
+            "question": QUESTIONS[PollStage.LAST_DAY_IN_UNIVERSATY],
+            "validator": "date",
+            "field": "date_of_last_class_attendance",
+            "next": PollStage.DONE.name,
+        },
+    },
+    # Столбцы A-F таблицы результатов
+    "columns": [
+        "name",
+        "diagnosis",
+        "medical_certificate_data",
+        "date_of_last_class_attendance",
+        "medical_certificate",
+        "date",
+    ],
+}
+# Столбцы строки Google Sheet, которые берутся не из состояния респондента
+ROW_SOURCES: Tuple[str, ...] = ("name", "date")
+
+Validator = Callable[[str], Optional[str]]
+# Следующая стадия и ответ бота
+Transition = Tuple[str, "PollReply"]
+# Вопрос с вариантами ответа для итогов опроса: (стадия, поле, вариант ответа по значению поля)
+Choice = Tuple[str, str, Dict[Any, str]]
+
+
+@dataclass(frozen=True, slots=True)
+class PollReply:
+    """Ответ бота на сообщение респондента.
+    Attr:
+        message (str): Текст ответа.
+        keyboard (Optional[str]): Клавиатура в формате JSON.
+        completed (bool): Респондент только что завершил опрос и его результат нужно записать.
+    """
+
+    message: str
+    keyboard: Optional[str] = None
+    completed: bool = False
+
+
+def validate_date(text: str) -> Optional[str]:
+    """Возвращает дату из сообщения или None, если сообщение не дата."""
+    text = text.strip()
+    return text if DATE_PATTERN.fullmatch(text) else None
+
+
+def validate_free_text(text: str) -> Optional[str]:
+    """Возвращает произвольный текст без служебных символов или None для пустого сообщения."""
+    text = text.strip(" @#")
+    return text if text else None
+
+
+def choice_validator(answers: List[str]) -> Validator:
+    """Создает проверку, что сообщение - один из вариантов ответа."""
+    allowed: frozenset = frozenset(answers)
+
+    def validate_choice(text: str) -> Optional[str]:
+        text = text.strip()
+        return text if text in allowed else None
+
+    return validate_choice
+
+
+@dataclass(frozen=True, slots=True)
+class CompiledStage:
+    """Стадия опроса, подготовленная к обработке ответов.
+    Attr:
+        question (PollReply): Вопрос стадии с готовой клавиатурой.
+        reminder (PollReply): Напоминание с текстом вопроса.
+        validator (Validator): Проверка ответа.
+        record_field (str): Поле, под которым ответ записывается в RespondentRecord.answers,
+            пустая строка - не записывать.
+        values (Dict[str, Any]): Значение поля по варианту ответа, для остальных записывается сам ответ.
+        transitions (Dict[str, Transition]): Переход по варианту ответа.
+        default (Optional[Transition]): Переход для остальных ответов.
+        answers (Tuple[str, ...]): Варианты ответа стадии с validator choice.
+    """
+
+    question: PollReply
+    reminder: PollReply
+    validator: Validator
+    record_field: str = ""
+    values: Dict[str, Any] = field(default_factory=dict)
+    transitions: Dict[str, Transition] = field(default_factory=dict)
+    default: Optional[Transition] = None
+    answers: Tuple[str, ...] = ()
+
+
+@dataclass(frozen=True, slots=True)
+class CompiledPoll:
+    """Граф переходов опроса, собранный из описания.
+    Attr:
+        first_stage (str): Стадия, вопрос которой рассылается при запуске опроса.
+        stages (Dict[str, CompiledStage]): Стадии опроса по имени.
+        columns (Tuple[str, ...]): Столбцы строки Google Sheet.
+        fields (Tuple[str, ...]): Поля ответов всех стадий в порядке описания.
+        choices (Tuple[Choice, ...]): Вопросы с вариантами ответа, которые считаются в итогах опроса.
+    """
+
+    first_stage: str
+    stages: Dict[str, CompiledStage]
+    columns: Tuple[str, ...]
+    fields: Tuple[str, ...] = ()
+    choices: Tuple[Choice, ...] = ()
+
+
+def _compile_validator(name: str, stage: Dict[str, Any]) -> Validator:
+    """Возвращает проверку ответа стадии по ее имени в описании."""
+    if name == "choice":
+        if not stage.get("answers"):
+            raise ValueError("validator choice requires answers")
+        return choice_validator(stage["answers"])
+    if name == "date":
+        return validate_date
+    if name == "text":
+        return validate_free_text
+    if name == "regex":
+        pattern: re.Pattern = re.compile(stage["pattern"])
+
+        def validate_pattern(text: str) -> Optional[str]:
+            text = text.strip()
+            return text if pattern.fullmatch(text) else None
+
+        return validate_pattern
+    raise ValueError(f"unknown validator {name!r}")
+
+
+def _answer_fields(stages: Dict[str, CompiledStage]) -> Tuple[Tuple[str, ...], Tuple[Choice, ...]]:
+    """Возвращает поля ответов стадий и вопросы с вариантами ответа для итогов опроса."""
+    fields: Dict[str, None] = {compiled.record_field: None for compiled in stages.values() if compiled.record_field}
+    choices: Tuple[Choice, ...] = tuple(
+        (name, compiled.record_field, {compiled.values.get(answer, answer): answer for answer in compiled.answers})
+        for name, compiled in stages.items()
+        if compiled.record_field and compiled.answers
+    )
+    return tuple(fields), choices
+
+
+def compile_poll(definition: Dict[str, Any], keyboard_builder: Callable[[Sequence[str], str], str]) -> CompiledPoll:
+    """Проверяет описание опроса и собирает из него граф переходов.
+    Клавиатуры и тексты ответов строятся здесь один раз, при обработке ответа только выбирается переход.
+    Args:
+        definition (Dict[str, Any]): Описание опроса (формат DEFAULT_POLL_DEFINITION).
+        keyboard_builder (Callable[[Sequence[str], str], str]): Функция, строящая клавиатуру
+            по списку ответов и имени payload (pollutils.get_keybord).
+    Returns:
+        CompiledPoll: граф переходов.
+    Raises:
+        ValueError: если описание некорректно.
+    """
+    stages: Dict[str, Dict[str, Any]] = definition.get("stages") or {}
+    if not stages or not isinstance(stages, dict):
+        raise ValueError("poll definition has no stages")
+    reminder_prefix: str = definition.get("reminder_prefix", REMINDER_PREFIX)
+    questions: Dict[str, PollReply] = {}
+    for name, stage in stages.items():
+        if name == DONE_STAGE:
+            raise ValueError(f"{DONE_STAGE} is the final stage and can not have a question")
+        if not isinstance(name, str) or not name:
+            raise ValueError(f"stage name must be a non-empty string, not {name!r}")
+        answers: List[str] = stage.get("answers") or []
+        questions[name] = PollReply(
+            stage["question"],
+            keyboard_builder(answers, stage.get("payload", name.lower())) if answers else None,
+        )
+    done_message: str = definition.get("done_message", QUESTIONS[PollStage.DONE])
+
+    def compile_transition(target: Union[str, Dict[str, Any]]) -> Transition:
+        if isinstance(target, str):
+            target = {"stage": target}
+        stage_name: str = target["stage"]
+        if stage_name == DONE_STAGE:
+            return stage_name, PollReply(
+                target.get("message", done_message), completed=bool(target.get("write", True))
+            )
+        if stage_name not in questions:
+            raise ValueError(f"transition to undefined stage {stage_name!r}")
+        question: PollReply = questions[stage_name]
+        return stage_name, PollReply(target.get("message", question.message), question.keyboard)
+
+    compiled: Dict[str, CompiledStage] = {}
+    for name, stage in stages.items():
+        try:
+            record_field: str = stage.get("field", "")
+            if not isinstance(record_field, str) or record_field in ROW_SOURCES:
+                raise ValueError(f"field {record_field!r} is not a name or clashes with columns {ROW_SOURCES}")
+            next_stage: Union[str, Dict[str, Any]] = stage["next"]
+            is_table: bool = isinstance(next_stage, dict) and "stage" not in next_stage
+            transitions: Dict[str, Transition] = (
+                {answer: compile_transition(target) for answer, target in next_stage.items()}
+                if is_table
+                else {}
+            )
+            if is_table and stage.get("answers") and not set(transitions) <= set(stage["answers"]):
+                raise ValueError(f"next refers to answers not in {stage['answers']}")
+            question = questions[name]
+            validator_name: str = stage.get("validator", "text")
+            compiled[name] = CompiledStage(
+                question=question,
+                reminder=PollReply(reminder_prefix + question.message, question.keyboard),
+                validator=_compile_validator(validator_name, stage),
+                record_field=record_field,
+                values=dict(stage.get("values") or {}),
+                transitions=transitions,
+                default=None if is_table else compile_transition(next_stage),
+                answers=tuple(stage["answers"]) if validator_name == "choice" else (),
+            )
+        except (KeyError, TypeError, ValueError, re.error) as error:
+            raise ValueError(f"stage {name}: {error!r}") from error
+
+    first_stage: str = definition.get("first_stage", PollStage.IN_PROGRESS.name)
+    if first_stage not in compiled:
+        raise ValueError(f"first_stage {first_stage!r} is not defined")
+    try:
+        fields, choices = _answer_fields(compiled)
+    except TypeError as error:
+        raise ValueError(f"values of choice answers must be strings, numbers or booleans: {error!r}") from error
+    # Без columns в строку пишутся имя, ответы в порядке стадий и дата опроса
+    columns: Tuple[str, ...] = tuple(definition.get("columns") or ("name",) + fields + ("date",))
+    for column in columns:
+        if column not in ROW_SOURCES and column not in fields:
+            raise ValueError(f"unknown column {column!r}, expected name, date or one of {list(fields)}")
+    return CompiledPoll(first_stage, compiled, columns, fields, choices)
+
+
+class PollDispatcher:
+    """Конечный автомат опроса.
+    Стадия респондента - ключ в графе переходов, в котором для каждой стадии
+    заранее записаны проверка ответа, поле для ответа и переходы с готовыми ответами бота.
+    Граф собирается из описания опроса и может быть заменен на лету (load): замена -
+    одно присваивание, поэтому ответ всегда обрабатывается целиком старым или новым графом.
+    """
+
+    def __init__(
+        self,
+        keyboard_builder: Callable[[Sequence[str], str], str],
+        definition: Optional[Dict[str, Any]] = None,
+    ) -> None:
+        """Инициализирует класс и строит граф переходов.
+        Args:
+            keyboard_builder (Callable[[Sequence[str], str], str]): Функция, строящая клавиатуру
+                по списку ответов и имени payload (pollutils.get_keybord).
+            definition (Optional[Dict[str, Any]]): Описание опроса, по умолчанию DEFAULT_POLL_DEFINITION.
+        Returns:
+        Raises:
+            ValueError: если описание опроса некорректно.
+        """
+        self.keyboard_builder = keyboard_builder
+        self.graph: CompiledPoll = compile_poll(
+            definition if definition else DEFAULT_POLL_DEFINITION, keyboard_builder
+        )
+
+    def load(self, definition: Dict[str, Any]) -> List[str]:
+        """Собирает граф переходов из нового описания опроса и заменяет им текущий.
+        Стадии, которых нет в новом описании, остаются из текущего графа, чтобы
+        респонденты, которые сейчас на этих стадиях, могли закончить опрос.
+        Args:
+            definition (Dict[str, Any]): Описание опроса.
+        Returns:
+            List[str]: имена стадий, оставшихся из прежнего графа.
+        Raises:
+            ValueError: если описание некорректно, текущий граф при этом не меняется.
+        """
+        graph: CompiledPoll = compile_poll(definition, self.keyboard_builder)
+        kept: Dict[str, CompiledStage] = {
+            stage: compiled for stage, compiled in self.graph.stages.items() if stage not in graph.stages
+        }
+        if kept:
+            stages: Dict[str, CompiledStage] = {**graph.stages, **kept}
+            fields, choices = _answer_fields(stages)
+            graph = replace(graph, stages=stages, fields=fields, choices=choices)
+        self.graph = graph
+        return list(kept)
+
+    @property
+    def first_stage(self) -> str:
+        """Возвращает стадию, на которой респонденты начинают опрос."""
+        return self.graph.first_stage
+
+    @property
+    def first_question(self) -> PollReply:
+        """Возвращает первый вопрос опроса, который рассылается всем респондентам."""
+        graph: CompiledPoll = self.graph
+        return graph.stages[graph.first_stage].question
+
+    @property
+    def questions(self) -> Dict[str, str]:
+        """Возвращает тексты вопросов по имени стадии (заголовки итогов опроса)."""
+        return {name: compiled.question.message for name, compiled in self.graph.stages.items()}
+
+    def current_question(self, stage: str) -> Optional[PollReply]:
+        """Возвращает вопрос стадии опроса или None, если на этой стадии вопросов нет."""
+        compiled: Optional[CompiledStage] = self.graph.stages.get(stage)
+        return compiled.question if compiled else None
+
+    def reminder(self, stage: str) -> Optional[PollReply]:
+        """Возвращает напоминание с вопросом стадии или None, если на этой стадии вопросов нет."""
+        compiled: Optional[CompiledStage] = self.graph.stages.get(stage)
+        return compiled.reminder if compiled else None
+
+    def build_row(self, full_name: str, respondent: RespondentRecord, poll_date: str) -> List[Union[str, bool]]:
+        """Формирует строку Google Sheet по столбцам из описания опроса.
+        Args:
+            full_name (str): Фамилия и имя респондента.
+            respondent (RespondentRecord): Состояние респондента.
+            poll_date (str): Дата опроса.
+        Returns:
+            List[Union[str, bool]]: строка данных.
+        """
+        sources: Dict[str, str] = {"name": full_name, "date": poll_date}
+        return [
+            sources[column] if column in sources else respondent.answers.get(column, "")
+            for column in self.graph.columns
+        ]
+
+    def stats_key(self, respondent: RespondentRecord) -> StatsKey:
+        """Возвращает вклад респондента в счетчики опроса: стадию, признак, что он еще
+        не ответил на первый вопрос, и выбранные варианты ответа на вопросы с вариантами.
+        """
+        graph: CompiledPoll = self.graph
+        answers: Dict[str, Any] = respondent.answers
+        chosen: List[Tuple[str, str]] = []
+        for stage, record_field, labels in graph.choices:
+            if record_field in answers:
+                label: Optional[str] = labels.get(answers[record_field])
+                if label is not None:
+                    chosen.append((stage, label))
+        return respondent.poll_stage, respondent.poll_stage == graph.first_stage, tuple(chosen)
+
+    def dispatch(self, respondent: RespondentRecord, text: str) -> Optional[PollReply]:
+        """Обрабатывает сообщение респондента и переводит его на следующую стадию.
+        Args:
+            respondent (RespondentRecord): Состояние респондента, изменяется на месте.
+            text (str): Текст сообщения.
+        Returns:
+            Optional[PollReply]: ответ бота; None, если респондент уже прошел опрос.
+            Если ответ не подходит к текущему вопросу, вопрос задается повторно.
+        """
+        stage: Optional[CompiledStage] = self.graph.stages.get(respondent.poll_stage)
+        if stage is None:
+            return None
+        answer: Optional[str] = stage.validator(text)
+        if answer is None:
+            return stage.question
+        transition: Optional[Transition] = stage.transitions.get(answer, stage.default)
+        if transition is None:
+            return stage.question
+        if stage.record_field:
+            respondent.answers[stage.record_field] = stage.values.get(answer, answer)
+        respondent.poll_stage, reply = transition
+        return reply
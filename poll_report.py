@@ -0,0 +1,215 @@
+"""Итоги опросов: счетчики, обновляемые при каждом ответе, и выгрузка результатов в CSV.
+
+Выгрузка опросов за день из файла состояния, без Google Sheets API:
+    python poll_report.py 2021-12-19 -o 2021-12-19.csv
+"""
+import argparse
+import csv
+import itertools
+import re
+import sys
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Sequence, TextIO, Tuple
+from state_store import DONE_STAGE, RespondentRecord
+
+REPORT_COMMAND_PATTERN: re.Pattern = re.compile(r"[!/]report(?: (\d{4}-\d{2}-\d{2}))?\s*$")
+# Максимальная длина сообщения VK
+MAX_MESSAGE_LENGTH = 4096
+
+# Вклад респондента в счетчики: (стадия, не ответил на первый вопрос,
+# выбранные варианты ответа как (стадия вопроса, вариант ответа)), см. PollDispatcher.stats_key
+StatsKey = Tuple[str, bool, Tuple[Tuple[str, str], ...]]
+
+
+@dataclass(slots=True)
+class PollStats:
+    """Счетчики опроса. Обновляются при каждом переходе респондента, поэтому
+    итоги опроса доступны без перебора всех респондентов.
+    Attr:
+        total (int): Количество участников.
+        stages (Dict[str, int]): Количество участников на каждой стадии.
+        choices (Dict[Tuple[str, str], int]): Количество выбравших вариант ответа по (стадия вопроса, вариант ответа).
+        silent (Dict[str, None]): Участники, не ответившие ни на один вопрос, в порядке списка.
+    """
+
+    total: int = 0
+    stages: Dict[str, int] = field(default_factory=dict)
+    choices: Dict[Tuple[str, str], int] = field(default_factory=dict)
+    silent: Dict[str, None] = field(default_factory=dict)
+
+    @classmethod
+    def from_records(
+        cls,
+        records: Iterable[Tuple[str, RespondentRecord]],
+        key: Callable[[RespondentRecord], StatsKey],
+    ) -> "PollStats":
+        """Считает счетчики по состоянию респондентов (при запуске или для закрытого опроса).
+        Args:
+            records (Iterable[Tuple[str, RespondentRecord]]): (id пользователя, состояние).
+            key (Callable[[RespondentRecord], StatsKey]): Вклад респондента в счетчики (PollDispatcher.stats_key).
+        Returns:
+            PollStats: счетчики опроса.
+        """
+        stats: PollStats = cls()
+        for user_id, record in records:
+            stats.add(user_id, key(record))
+        return stats
+
+    @staticmethod
+    def _count(counters: Dict, key: Any, sign: int) -> None:
+        count: int = counters.get(key, 0) + sign
+        if count:
+            counters[key] = count
+        else:
+            del counters[key]
+
+    def _apply(self, user_id: str, key: StatsKey, sign: int) -> None:
+        poll_stage, silent, chosen = key
+        self.total += sign
+        self._count(self.stages, poll_stage, sign)
+        if silent:
+            if sign > 0:
+                self.silent[user_id] = None
+            else:
+                self.silent.pop(user_id, None)
+        for choice in chosen:
+            self._count(self.choices, choice, sign)
+
+    def add(self, user_id: str, key: StatsKey) -> None:
+        """Учитывает респондента."""
+        self._apply(user_id, key, 1)
+
+    def move(self, user_id: str, before: StatsKey, after: StatsKey) -> None:
+        """Учитывает изменение состояния респондента после ответа."""
+        if before != after:
+            self._apply(user_id, before, -1)
+            self._apply(user_id, after, 1)
+
+    @property
+    def done(self) -> int:
+        """Возвращает количество участников, прошедших опрос."""
+        return self.stages.get(DONE_STAGE, 0)
+
+    def merge(self, other: "PollStats") -> None:
+        """Добавляет счетчики другого опроса (или другого процесса)."""
+        self.total += other.total
+        for poll_stage, count in other.stages.items():
+            self.stages[poll_stage] = self.stages.get(poll_stage, 0) + count
+        for choice, count in other.choices.items():
+            self.choices[choice] = self.choices.get(choice, 0) + count
+        self.silent.update(other.silent)
+
+
+def format_report(
+    poll_id: str,
+    stats: PollStats,
+    names: Dict[str, str],
+    questions: Optional[Dict[str, str]] = None,
+) -> str:
+    """Возвращает текст итогов опроса.
+    Args:
+        poll_id (str): id опроса.
+        stats (PollStats): Счетчики опроса.
+        names (Dict[str, str]): Имена участников, не ответивших на опрос, по id.
+        questions (Optional[Dict[str, str]]): Тексты вопросов по стадии (PollDispatcher.questions),
+            задают порядок стадий и подписи вариантов ответа.
+    Returns:
+        str: текст сообщения не длиннее MAX_MESSAGE_LENGTH.
+    """
+    questions = questions or {}
+    order: Dict[str, int] = {stage: index for index, stage in enumerate(questions)}
+    order.setdefault(DONE_STAGE, len(order))
+
+    def stage_order(stage: str) -> Tuple[int, str]:
+        return order.get(stage, len(order)), stage
+
+    chosen: Dict[str, List[str]] = {}
+    for (stage, answer), count in stats.choices.items():
+        chosen.setdefault(stage, []).append(f"{answer} - {count}")
+    in_poll: int = stats.total - stats.done - len(stats.silent)
+    text: str = (
+        f"Опрос {poll_id}\n"
+        f"Прошли опрос: {stats.done} из {stats.total}, отвечают сейчас: {in_poll}\n"
+        + "".join(
+            f"{questions.get(stage, stage)}: {', '.join(chosen[stage])}\n"
+            for stage in sorted(chosen, key=stage_order)
+        )
+        + "".join(
+            f"{poll_stage}: {stats.stages[poll_stage]}\n"
+            for poll_stage in sorted(stats.stages, key=stage_order)
+        )
+        + f"Не ответили ({len(stats.silent)}): "
+        + ", ".join(names.get(user_id, user_id) for user_id in stats.silent)
+    )
+    return text if len(text) <= MAX_MESSAGE_LENGTH else text[:MAX_MESSAGE_LENGTH - 3] + "..."
+
+
+def export_csv(
+    rows: Iterable[Tuple[str, str, RespondentRecord]],
+    file: TextIO,
+    names: Dict[str, str],
+    fields: Sequence[str],
+) -> int:
+    """Записывает результаты опросов в CSV, строка за строкой.
+    Args:
+        rows (Iterable[Tuple[str, str, RespondentRecord]]): (id опроса, id пользователя, состояние).
+        file (TextIO): Файл для записи.
+        names (Dict[str, str]): Имена участников по id.
+        fields (Sequence[str]): Поля ответов для столбцов (CompiledPoll.fields).
+    Returns:
+        int: количество записанных строк.
+    """
+    writer = csv.writer(file)
+    writer.writerow(("poll_id", "user_id", "name", "stage") + tuple(fields))
+    written: int = 0
+    for poll_id, user_id, record in rows:
+        writer.writerow(
+            (poll_id, user_id, names.get(user_id, ""), record.poll_stage)
+            + tuple(record.answers.get(name, "") for name in fields)
+        )
+        written += 1
+    return written
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    import config
+    from name_resolver import NameResolver
+    from poll_definition import load_definition
+    from poll_dispatcher import PollDispatcher
+    from state_store import SQLiteStateStore
+
+    parser = argparse.ArgumentParser(description="Выгрузка результатов опросов за день в CSV")
+    parser.add_argument("poll_date", help="Дата опроса, YYYY-MM-DD")
+    parser.add_argument("-o", "--output", default="", help="Файл CSV, по умолчанию stdout")
+    args = parser.parse_args(argv)
+
+    from sharding import shard_path
+
+    def shard_files(path: str) -> List[str]:
+        """В многопроцессном режиме у каждого процесса-обработчика свой файл состояния и кэш имен."""
+        if config.settings["SHARDS"] <= 1:
+            return [path]
+        return [shard_path(path, index) for index in range(config.settings["SHARDS"])]
+
+    # Столбцы ответов - поля текущего описания опроса
+    definition_file: str = config.settings["POLL_DEFINITION_FILE"]
+    dispatcher: PollDispatcher = PollDispatcher(
+        lambda answers, payload: "", load_definition(definition_file) if definition_file else None
+    )
+    cached_names: Dict[str, str] = {}
+    for name_cache_file in shard_files(config.settings["NAME_CACHE_FILE"]):
+        cached_names.update(NameResolver(None, cache_file=name_cache_file).cached_names())
+    rows: Iterator[Tuple[str, str, RespondentRecord]] = itertools.chain.from_iterable(
+        SQLiteStateStore.iter_poll_date(state_db_file, args.poll_date)
+        for state_db_file in shard_files(config.settings["STATE_DB_FILE"])
+    )
+    if args.output:
+        with open(args.output, "w", encoding="UTF-8", newline="") as file:
+            written: int = export_csv(rows, file, cached_names, dispatcher.graph.fields)
+    else:
+        written = export_csv(rows, sys.stdout, cached_names, dispatcher.graph.fields)
+    print(f"{written} rows", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,334 @@
+import asyncio
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Sequence, Tuple, Any
+from loguru import logger
+import pollutils
+from googlesheet_inserter import GoogleSheetInserter
+from googlesheet_queue import GoogleSheetWriteQueue
+from broadcaster import Broadcaster, DeliveryReport
+from state_store import BaseStateStore, MemoryStateStore, RespondentRecord
+from poll_dispatcher import PollDispatcher, PollReply
+from poll_definition import PollDefinitionWatcher, load_definition
+from poll_session import PollSession, SessionRegistry, make_poll_id
+from name_resolver import NameResolver
+from roster import Roster, RosterLoader
+from outbox import Outbox, OutboxMessage
+from reminders import ReminderScheduler
+from poll_report import PollStats, StatsKey, format_report
+from metrics import OUTBOX_PENDING, RESPONDENTS, SHEET_QUEUE_DEPTH
+
+# Счетчики и имена не ответивших участников по id опроса
+PollStatsByPoll = Dict[str, Tuple[PollStats, Dict[str, str]]]
+
+
+def shard_of(user_id: str, shard_count: int) -> int:
+    """Возвращает номер процесса, которому принадлежит состояние пользователя."""
+    return int(user_id) % shard_count
+
+
+async def load_user_ids(roster_loader: RosterLoader, path_to_file_with_respondents_ids: str) -> List[str]:
+    """Читает список участников опроса и пишет в лог пропущенные записи.
+    Args:
+        roster_loader (RosterLoader): Загрузка списков участников опроса.
+        path_to_file_with_respondents_ids (str): Путь до файла со списком id участников.
+    Returns:
+        List[str]: id участников.
+    Raises:
+        EnvironmentError: если файл со списком участников не удалось прочитать.
+    """
+    roster: Roster = await roster_loader.load(path_to_file_with_respondents_ids)
+    if roster.invalid or roster.unresolved:
+        logger.warning(
+            f"Roster {path_to_file_with_respondents_ids}: skipped {len(roster.invalid)} invalid lines"
+            f" and {len(roster.unresolved)} unknown screen names"
+        )
+        logger.debug(f"Invalid: {roster.invalid[:20]}; unknown: {roster.unresolved[:20]}")
+    return roster.user_ids
+
+
+class PollService:
+    """Логика опроса, не зависящая от способа получения событий ВКонтакте.
+    Бот (Long Poll или Callback API) только передает сюда текст сообщений
+    и отправляет ответы, поэтому эту же логику можно нагрузить без VK.
+    """
+
+    def __init__(
+        self,
+        api_context: Any,
+        inserter: GoogleSheetInserter,
+        state: BaseStateStore = None,
+        sheet_queue: GoogleSheetWriteQueue = None,
+        broadcaster: Broadcaster = None,
+        dispatcher: PollDispatcher = None,
+        names: NameResolver = None,
+        roster: RosterLoader = None,
+        outbox: Outbox = None,
+        retention_days: int = 14,
+        reminder_offsets: Sequence[float] = (),
+        poll_deadline: float = 0,
+        shard: Tuple[int, int] = (0, 1),
+        definition_file: str = "",
+        definition_reload_interval: float = 5.0,
+    ) -> None:
+        """Инициализирует класс.
+        Args:
+            api_context (Any): Контекст VK API (bot.api_context).
+            inserter (GoogleSheetInserter): Агрегат для вставки данных в Google Sheet.
+            state (BaseStateStore): Хранилище состояния участников опроса.
+            sheet_queue (GoogleSheetWriteQueue): Очередь отложенной записи в Google Sheet.
+            broadcaster (Broadcaster): Агрегат для пакетной рассылки сообщений.
+            dispatcher (PollDispatcher): Конечный автомат опроса.
+            names (NameResolver): Кэш имен участников опроса.
+            roster (RosterLoader): Загрузка списков участников опроса.
+            outbox (Outbox): Очередь исходящих сообщений с повторами.
+            retention_days (int): Сколько дней хранить состояние прошедших опросов.
+            reminder_offsets (Sequence[float]): Через сколько секунд после последнего ответа
+                напоминать участнику об опросе.
+            poll_deadline (float): Через сколько секунд после начала закрывать опрос, 0 - не закрывать.
+            shard (Tuple[int, int]): Номер процесса и количество процессов. Процессу-обработчику
+                основной процесс передает только участников, для которых shard_of возвращает его номер.
+            definition_file (str): Файл описания опроса (JSON или YAML), пустая строка - опрос по умолчанию.
+            definition_reload_interval (float): Период проверки изменения файла описания, в секундах,
+                0 - не перезагружать.
+        Returns:
+        Raises:
+            ValueError: если описание опроса некорректно.
+        """
+        self.state: BaseStateStore = state if state else MemoryStateStore()
+        self.dispatcher: PollDispatcher = (
+            dispatcher if dispatcher else PollDispatcher(pollutils.get_keybord)
+        )
+        self.definition_watcher: Optional[PollDefinitionWatcher] = None
+        if definition_file:
+            self.dispatcher.load(load_definition(definition_file))
+            self.definition_watcher = PollDefinitionWatcher(
+                definition_file, self.dispatcher, interval=definition_reload_interval
+            )
+        # Опросы, прерванные перезапуском процесса, восстанавливаются из хранилища
+        self.sessions: SessionRegistry = SessionRegistry(self.state, self.dispatcher.stats_key)
+        self.sheet_queue: GoogleSheetWriteQueue = (
+            sheet_queue if sheet_queue else GoogleSheetWriteQueue(inserter)
+        )
+        self.broadcaster: Broadcaster = broadcaster if broadcaster else Broadcaster(api_context)
+        self.names: NameResolver = names if names else NameResolver(api_context)
+        self.roster: RosterLoader = roster if roster else RosterLoader(api_context)
+        self.outbox: Outbox = outbox if outbox else Outbox(api_context, bucket=self.broadcaster.bucket)
+        self.retention_days = retention_days
+        self.shard_index, self.shard_count = shard
+        self.reminders: ReminderScheduler = ReminderScheduler(
+            self.sessions,
+            self.state,
+            self.dispatcher,
+            self.broadcaster,
+            self.outbox,
+            self.names,
+            offsets=reminder_offsets,
+            deadline=poll_deadline,
+            closed_title=(
+                "Опрос закрыт по сроку."
+                if self.shard_count == 1
+                else f"Опрос закрыт по сроку (часть {self.shard_index + 1} из {self.shard_count})."
+            ),
+        )
+
+    async def start(self) -> None:
+        """Запускает фоновую запись результатов опроса и отправку сообщений."""
+        await self.sheet_queue.start()
+        await self.outbox.start()
+        await self.reminders.start()
+        if self.definition_watcher is not None:
+            await self.definition_watcher.start()
+        SHEET_QUEUE_DEPTH.collect = lambda: {(): self.sheet_queue.pending}
+        OUTBOX_PENDING.collect = lambda: {(): self.outbox.pending}
+        RESPONDENTS.collect = self.count_respondents_by_stage
+
+    async def close(self) -> None:
+        """Дописывает накопленные результаты опроса и сохраняет состояние."""
+        if self.definition_watcher is not None:
+            await self.definition_watcher.close()
+        await self.reminders.close()
+        await self.sheet_queue.close()
+        await self.outbox.close()
+        # Поток записи состояния дописывает очередь изменений
+        await asyncio.get_running_loop().run_in_executor(None, self.state.close)
+        self.names.save()
+
+    async def start_poll(
+        self,
+        path_to_file_with_respondents_ids: str,
+        googlesheet_file_url: str,
+        initiator_id: str = "",
+    ) -> Tuple[PollSession, DeliveryReport]:
+        """Запускает опрос группы и рассылает первый вопрос.
+        Args:
+            path_to_file_with_respondents_ids (str): Путь до файла со списком id участников.
+            googlesheet_file_url (str): Ссылка на Google Sheet для результатов.
+            initiator_id (str): id пользователя, запустившего опрос.
+        Returns:
+            Tuple[PollSession, DeliveryReport]: опрос и отчет о рассылке первого вопроса.
+        Raises:
+            EnvironmentError: если файл со списком участников не удалось прочитать.
+        """
+        file_with_poll_user_ids: List[str] = await load_user_ids(self.roster, path_to_file_with_respondents_ids)
+        return await self.start_poll_for(
+            make_poll_id(datetime.today().strftime("%Y-%m-%d"), path_to_file_with_respondents_ids),
+            googlesheet_file_url,
+            file_with_poll_user_ids,
+            initiator_id=initiator_id,
+        )
+
+    async def start_poll_for(
+        self,
+        poll_id: str,
+        googlesheet_file_url: str,
+        file_with_poll_user_ids: List[str],
+        initiator_id: str = "",
+    ) -> Tuple[PollSession, DeliveryReport]:
+        """Запускает опрос по готовому списку участников и рассылает первый вопрос.
+        Args:
+            poll_id (str): id опроса (make_poll_id).
+            googlesheet_file_url (str): Ссылка на Google Sheet для результатов.
+            file_with_poll_user_ids (List[str]): id участников опроса.
+            initiator_id (str): id пользователя, запустившего опрос.
+        Returns:
+            Tuple[PollSession, DeliveryReport]: опрос и отчет о рассылке первого вопроса.
+        """
+        self.sessions.evict_before(
+            (datetime.today() - timedelta(days=self.retention_days)).strftime("%Y-%m-%d")
+        )
+        session: PollSession = self.sessions.start(
+            poll_id,
+            googlesheet_file_url,
+            file_with_poll_user_ids,
+            self.dispatcher.first_stage,
+            initiator_id=initiator_id,
+        )
+        self.reminders.poll_started(session, file_with_poll_user_ids)
+        await self.sheet_queue.invalidate(googlesheet_file_url)
+
+        # Имена загружаются параллельно с рассылкой, к первому завершенному опросу они уже в кэше
+        names_prefetch: asyncio.Task = asyncio.create_task(self.names.prefetch(file_with_poll_user_ids))
+        first_question: PollReply = self.dispatcher.first_question
+        # Весь список записывается в журнал до рассылки: после падения процесса посреди рассылки
+        # первый вопрос получат и те, до кого она не дошла
+        held: Dict[int, OutboxMessage] = await self.outbox.hold(
+            file_with_poll_user_ids, first_question.message, first_question.keyboard
+        )
+        try:
+            delivery_report: DeliveryReport = await self.broadcaster.broadcast(
+                file_with_poll_user_ids,
+                message=first_question.message,
+                keyboard=first_question.keyboard,
+            )
+        except Exception:
+            self.outbox.release(held, DeliveryReport())
+            raise
+        # Временные ошибки (VK недоступен, лимиты) повторяются через очередь исходящих сообщений
+        self.outbox.release(held, delivery_report)
+        await names_prefetch
+        await self.names.save_async()
+        for poll_user_id, send_error in delivery_report.failed.items():
+            logger.debug(f"{send_error}: Trouble id: {poll_user_id}")
+        logger.info(
+            f"Poll {session.poll_id}: delivered {len(delivery_report.delivered)}"
+            f" of {delivery_report.total} in {delivery_report.elapsed:.2f}s"
+        )
+        return session, delivery_report
+
+    async def handle_answer(self, user_id: str, text: str) -> Optional[PollReply]:
+        """Обрабатывает ответ респондента на текущий вопрос опроса.
+        Ответ бота возвращается, отправлять его нужно через outbox.
+        Args:
+            user_id (str): id пользователя, приславшего сообщение.
+            text (str): Текст сообщения.
+        Returns:
+            Optional[PollReply]: ответ, который нужно отправить пользователю,
+                или None, если пользователь не участвует в опросе.
+        """
+        found: Optional[Tuple[PollSession, RespondentRecord]] = self.sessions.find(user_id)
+        if found is None:
+            return None
+        session, respondent = found
+        before: StatsKey = self.dispatcher.stats_key(respondent)
+        previous_stage: str = respondent.poll_stage
+        previous_answers: Dict[str, Any] = dict(respondent.answers)
+        logger.trace(
+            "Message from {user_id} at {stage}: {text}",
+            user_id=user_id,
+            stage=respondent.poll_stage,
+            text=text,
+        )
+        reply: Optional[PollReply] = self.dispatcher.dispatch(respondent, text)
+        if reply is None:
+            return None
+        if reply.completed:
+            # Строка ставится в очередь до сохранения стадии DONE: если запись прервется,
+            # участник останется на последнем вопросе и сможет ответить еще раз
+            try:
+                full_name: str = await self.names.resolve(user_id)
+                await self.sheet_queue.put(
+                    session.googlesheet_file_url,
+                    self.dispatcher.build_row(full_name, respondent, session.poll_date),
+                )
+            except BaseException:
+                # Хранилище в памяти возвращает ту же запись, которую изменил dispatch
+                respondent.poll_stage = previous_stage
+                respondent.answers = previous_answers
+                raise
+        self.state.save(user_id, session.poll_id, respondent)
+        session.stats.move(user_id, before, self.dispatcher.stats_key(respondent))
+        self.reminders.touch(session.poll_id, user_id, respondent.poll_stage)
+        return reply
+
+    def count_respondents_by_stage(self) -> Dict[Tuple[str, ...], float]:
+        """Возвращает количество участников идущих опросов на каждой стадии."""
+        counts: Dict[Tuple[str, ...], float] = {}
+        for session in self.sessions:
+            for poll_stage, count in session.stats.stages.items():
+                key: Tuple[str, ...] = (poll_stage,)
+                counts[key] = counts.get(key, 0) + count
+        return counts
+
+    def poll_stats(self, poll_id: str) -> PollStats:
+        """Возвращает счетчики опроса. Для закрытого опроса они считаются по хранилищу состояния."""
+        session: Optional[PollSession] = self.sessions.get(poll_id)
+        if session is not None:
+            return session.stats
+        return PollStats.from_records(self.state.items(poll_id), self.dispatcher.stats_key)
+
+    def collect_stats(self, poll_date: str, initiator_id: Optional[str] = None) -> PollStatsByPoll:
+        """Возвращает счетчики опросов дня и имена не ответивших участников.
+        Args:
+            poll_date (str): Дата опросов (YYYY-MM-DD).
+            initiator_id (Optional[str]): Только идущие опросы, запущенные этим пользователем;
+                None - все опросы дня, включая закрытые.
+        Returns:
+            PollStatsByPoll: счетчики и имена по id опроса.
+        """
+        collected: PollStatsByPoll = {}
+        for poll_id in self.state.poll_ids():
+            if not poll_id.startswith(f"{poll_date}/"):
+                continue
+            session: Optional[PollSession] = self.sessions.get(poll_id)
+            if initiator_id is not None and (session is None or session.initiator_id != initiator_id):
+                continue
+            stats: PollStats = self.poll_stats(poll_id)
+            names: Dict[str, str] = {
+                user_id: self.names.get_cached(user_id) or user_id for user_id in stats.silent
+            }
+            collected[poll_id] = (stats, names)
+        return collected
+
+    async def report(self, poll_date: str, initiator_id: Optional[str] = None) -> List[str]:
+        """Возвращает итоги опросов дня, по сообщению на опрос.
+        Args:
+            poll_date (str): Дата опросов (YYYY-MM-DD).
+            initiator_id (Optional[str]): Только идущие опросы, запущенные этим пользователем;
+                None - все опросы дня, включая закрытые.
+        Returns:
+            List[str]: тексты итогов.
+        """
+        return [
+            format_report(poll_id, stats, names, self.dispatcher.questions)
+            for poll_id, (stats, names) in self.collect_stats(poll_date, initiator_id).items()
+        ]
@@ -0,0 +1,166 @@
+import hashlib
+import os
+from dataclasses import dataclass, field
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+from state_store import BaseStateStore, DONE_STAGE, RespondentRecord
+from poll_report import PollStats, StatsKey
+
+
+@dataclass(slots=True)
+class PollSession:
+    """Опрос одной группы, запущенный командой !start.
+    Attr:
+        poll_id (str): id опроса вида "YYYY-MM-DD/<имя файла со списком id>-<хэш пути к файлу>".
+        googlesheet_file_url (str): Ссылка на Google Sheet для результатов.
+        initiator_id (str): id пользователя, запустившего опрос.
+        stats (PollStats): Счетчики опроса, обновляются при каждом ответе.
+    """
+
+    poll_id: str
+    googlesheet_file_url: str
+    initiator_id: str = ""
+    stats: PollStats = field(default_factory=PollStats)
+
+    @property
+    def poll_date(self) -> str:
+        """Возвращает дату опроса (YYYY-MM-DD)."""
+        return self.poll_id[:10]
+
+
+def make_poll_id(poll_date: str, path_to_file_with_respondents_ids: str) -> str:
+    """Возвращает id опроса по дате и файлу со списком участников.
+    Повторный !start того же файла в тот же день перезапускает его опрос. Файлы с одинаковым
+    именем в разных каталогах (a/ids.txt и b/ids.txt) - разные группы: к имени добавляется
+    хэш полного пути.
+    """
+    path: str = os.path.normcase(os.path.normpath(os.path.abspath(path_to_file_with_respondents_ids)))
+    group_name: str = os.path.splitext(os.path.basename(path))[0]
+    path_hash: str = hashlib.sha1(path.encode("UTF-8")).hexdigest()[:8]
+    return f"{poll_date}/{group_name}-{path_hash}"
+
+
+class SessionRegistry:
+    """Реестр одновременно идущих опросов с индексом "id пользователя -> опросы".
+    Сообщение респондента направляется в его опрос без перебора всех опросов.
+    """
+
+    def __init__(self, state: BaseStateStore, stats_key: Callable[[RespondentRecord], StatsKey]) -> None:
+        """Инициализирует класс и восстанавливает опросы из хранилища состояния.
+        Args:
+            state (BaseStateStore): Хранилище состояния участников опроса.
+            stats_key (Callable[[RespondentRecord], StatsKey]): Вклад респондента в счетчики опроса
+                (PollDispatcher.stats_key).
+        Returns:
+        """
+        self._state = state
+        self._stats_key = stats_key
+        self._sessions: Dict[str, PollSession] = {}
+        self._user_index: Dict[str, List[str]] = {}
+        for poll_id, googlesheet_file_url, initiator_id in state.sessions():
+            records: List[Tuple[str, RespondentRecord]] = list(state.items(poll_id))
+            self._register(
+                PollSession(poll_id, googlesheet_file_url, initiator_id, PollStats.from_records(records, stats_key)),
+                (user_id for user_id, _ in records),
+            )
+
+    def __len__(self) -> int:
+        return len(self._sessions)
+
+    def __iter__(self):
+        return iter(list(self._sessions.values()))
+
+    def get(self, poll_id: str) -> Optional[PollSession]:
+        """Возвращает опрос по id."""
+        return self._sessions.get(poll_id)
+
+    def _register(self, session: PollSession, user_ids: Iterable[str]) -> None:
+        """Добавляет опрос в реестр и его участников в индекс."""
+        self._sessions[session.poll_id] = session
+        for user_id in user_ids:
+            poll_ids: List[str] = self._user_index.setdefault(user_id, [])
+            if session.poll_id not in poll_ids:
+                poll_ids.append(session.poll_id)
+
+    def start(
+        self,
+        poll_id: str,
+        googlesheet_file_url: str,
+        user_ids: List[str],
+        first_stage: str,
+        initiator_id: str = "",
+    ) -> PollSession:
+        """Создает опрос и сохраняет начальное состояние его участников.
+        Повторный !start того же опроса начинает его заново: прежние участники и их ответы
+        удаляются, поэтому исключенные из списка пользователи больше не получают вопросов.
+        Args:
+            poll_id (str): id опроса (make_poll_id).
+            googlesheet_file_url (str): Ссылка на Google Sheet для результатов.
+            user_ids (List[str]): id участников опроса.
+            first_stage (str): Стадия, на которой участники начинают опрос.
+            initiator_id (str): id пользователя, запустившего опрос.
+        Returns:
+            PollSession: созданный опрос.
+        """
+        records: List[Tuple[str, RespondentRecord]] = [
+            (user_id, RespondentRecord(first_stage)) for user_id in user_ids
+        ]
+        session: PollSession = PollSession(
+            poll_id, googlesheet_file_url, initiator_id, PollStats.from_records(records, self._stats_key)
+        )
+        self._forget(poll_id)
+        self._state.delete_poll(poll_id)
+        self._state.save_session(poll_id, googlesheet_file_url, initiator_id)
+        self._state.save_many(poll_id, records)
+        self._register(session, user_ids)
+        return session
+
+    def _forget(self, poll_id: str) -> None:
+        """Удаляет участников опроса из индекса."""
+        for user_id, _ in self._state.items(poll_id):
+            poll_ids: Optional[List[str]] = self._user_index.get(user_id)
+            if poll_ids and poll_id in poll_ids:
+                poll_ids.remove(poll_id)
+                if not poll_ids:
+                    del self._user_index[user_id]
+
+    def close(self, poll_id: str) -> None:
+        """Закрывает опрос: сообщения его участников больше не направляются в этот опрос."""
+        if self._sessions.pop(poll_id, None) is None:
+            return
+        self._state.delete_session(poll_id)
+        self._forget(poll_id)
+
+    def find(self, user_id: str) -> Optional[Tuple[PollSession, RespondentRecord]]:
+        """Находит опрос, на вопрос которого сейчас отвечает пользователь.
+        Если пользователь участвует в нескольких опросах, выбирается самый ранний незавершенный.
+        Returns:
+            Optional[Tuple[PollSession, RespondentRecord]]: опрос и состояние респондента или None.
+        """
+        poll_ids: Optional[List[str]] = self._user_index.get(user_id)
+        if not poll_ids:
+            return None
+        found: Optional[Tuple[PollSession, RespondentRecord]] = None
+        for poll_id in poll_ids:
+            respondent: Optional[RespondentRecord] = self._state.get(user_id, poll_id)
+            if respondent is None:
+                continue
+            found = (self._sessions[poll_id], respondent)
+            if not respondent.done:
+                break
+        return found
+
+    def evict_before(self, poll_date: str) -> int:
+        """Удаляет опросы, проведенные раньше poll_date, из реестра и хранилища."""
+        expired: set = {poll_id for poll_id in self._sessions if poll_id < poll_date}
+        for poll_id in expired:
+            del self._sessions[poll_id]
+        if expired:
+            for user_id in list(self._user_index):
+                poll_ids: List[str] = [
+                    poll_id for poll_id in self._user_index[user_id] if poll_id not in expired
+                ]
+                if poll_ids:
+                    self._user_index[user_id] = poll_ids
+                else:
+                    del self._user_index[user_id]
+        return self._state.evict_before(poll_date)
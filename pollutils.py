@@ -1,14 +1,17 @@
-from typing import List, Optional
+from functools import lru_cache
+from typing import Sequence, Tuple
 from vkwave.bots.utils.keyboards.keyboard import Keyboard
 
 
-def get_keybord(answers:List[str], payload_name:str) -> Keyboard:
-    """Возвращает виртуальную клавиатуру со списком ответов.
+@lru_cache(maxsize=256)
+def build_keyboard(answers:Tuple[str, ...], payload_name:str) -> str:
+    """Строит клавиатуру и сериализует ее в JSON. Результат запоминается по ответам и имени payload,
+    поэтому каждая клавиатура строится один раз на процесс, сколько бы опросов ни запускалось.
     Args:
-        answers (List[str]): Список ответов на вопрос.
+        answers (Tuple[str, ...]): Варианты ответа на вопрос.
         payload_name (str): Имя payload для определения вопроса.
     Returns:
-        Keyboard: клавиатура где каждая кнопка - вариант ответа на вопрос.
+        str: клавиатура в формате JSON, готовая для messages.send.
     """
     keyboard: Keyboard = Keyboard(inline=True)
     for index, answer in enumerate(answers, 1):
@@ -18,30 +21,22 @@ def get_keybord(answers:List[str], payload_name:str) -> Keyboard:
     return keyboard.get_keyboard()
 
 
-def read_lines_from_file(path:str) -> List[str]:
-    """Возвращает список строк из файла.
+def get_keybord(answers:Sequence[str], payload_name:str) -> str:
+    """Возвращает виртуальную клавиатуру со списком ответов.
     Args:
-        path (str): Путь до файла.
+        answers (Sequence[str]): Список ответов на вопрос.
+        payload_name (str): Имя payload для определения вопроса.
     Returns:
-        List[str]: список строк из файла.
+        str: клавиатура в формате JSON, где каждая кнопка - вариант ответа на вопрос.
     """
-    content: Optional[List[str]] = None
-    with open(path, "r", encoding='UTF-8') as file:
-        content = file.readlines()
-    content = [line.strip() for line in content]
-    return content
+    return build_keyboard(tuple(answers), payload_name)
 
 
-def get_user_lastname_firstname(user_data:dict) -> str:
-    """Возвращает фамилию и имя пользователя.
+def format_lastname_firstname(profile:dict) -> str:
+    """Возвращает фамилию и имя из профиля пользователя.
     Args:
-        user_data (dict): Словарь с данными о пользователе.
+        profile (dict): Профиль пользователя из ответа users.get.
     Returns:
-        List[str]: список строк из файла.
+        str: строка вида "Фамилия Имя".
     """
-    full_vk_profile_name: str = (
-        user_data["response"][0]["last_name"]
-        + " "
-        + user_data["response"][0]["first_name"]
-    )
-    return full_vk_profile_name
+    return profile["last_name"] + " " + profile["first_name"]
@@ -0,0 +1,205 @@
+import asyncio
+import heapq
+import time
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+from loguru import logger
+from broadcaster import Broadcaster
+from name_resolver import NameResolver
+from outbox import Outbox
+from poll_dispatcher import PollDispatcher, PollReply
+from poll_session import PollSession, SessionRegistry
+from poll_report import format_report
+from state_store import BaseStateStore, DONE_STAGE, RespondentRecord
+
+# Запись очереди таймеров: (время срабатывания, порядковый номер, id опроса, id пользователя,
+# версия, номер напоминания). Для закрытия опроса id пользователя - пустая строка.
+Timer = Tuple[float, int, str, str, int, int]
+
+
+class ReminderScheduler:
+    """Напоминания участникам, не закончившим опрос, и закрытие опросов по сроку.
+    Все таймеры хранятся в одной куче и обслуживаются одной задачей. Таймер не удаляется
+    из кучи при ответе участника: у пары (опрос, участник) увеличивается версия,
+    и устаревшие записи просто пропускаются, когда доходит их время.
+    """
+
+    def __init__(
+        self,
+        sessions: SessionRegistry,
+        state: BaseStateStore,
+        dispatcher: PollDispatcher,
+        broadcaster: Broadcaster,
+        outbox: Outbox,
+        names: NameResolver,
+        offsets: Sequence[float] = (),
+        deadline: float = 0,
+        closed_title: str = "Опрос закрыт по сроку.",
+    ) -> None:
+        """Инициализирует класс.
+        Args:
+            sessions (SessionRegistry): Идущие опросы.
+            state (BaseStateStore): Хранилище состояния участников опроса.
+            dispatcher (PollDispatcher): Конечный автомат опроса (готовые напоминания с текстом вопроса).
+            broadcaster (Broadcaster): Пакетная рассылка напоминаний.
+            outbox (Outbox): Очередь исходящих сообщений (итоги опроса организатору).
+            names (NameResolver): Кэш имен участников для итогов опроса.
+            offsets (Sequence[float]): Через сколько секунд после последнего ответа участника
+                отправляются напоминания, например (3600, 14400).
+            deadline (float): Через сколько секунд после начала опрос закрывается, 0 - не закрывать.
+            closed_title (str): Первая строка итогов, которые получает организатор закрытого опроса.
+        Returns:
+        """
+        self.sessions = sessions
+        self.state = state
+        self.dispatcher = dispatcher
+        self.broadcaster = broadcaster
+        self.outbox = outbox
+        self.names = names
+        self.offsets: Tuple[float, ...] = tuple(sorted(offsets))
+        self.deadline = deadline
+        self.closed_title = closed_title
+        self._timers: List[Timer] = []
+        self._versions: Dict[Tuple[str, str], int] = {}
+        self._sequence: int = 0
+        self._wakeup: asyncio.Event = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+
+    def __len__(self) -> int:
+        return len(self._timers)
+
+    async def start(self) -> None:
+        """Планирует напоминания для опросов, восстановленных после перезапуска, и запускает таймеры.
+        Время последнего ответа участников до перезапуска неизвестно, поэтому
+        напоминания отсчитываются от момента запуска, а срок закрытия - от начала дня опроса.
+        """
+        now: float = time.time()
+        for session in self.sessions:
+            if self.deadline:
+                started_at: float = datetime.strptime(session.poll_date, "%Y-%m-%d").timestamp()
+                self._schedule(max(now, started_at + self.deadline), session.poll_id, "", 0)
+            self._schedule_reminders(
+                session.poll_id,
+                (user_id for user_id, respondent in self.state.items(session.poll_id)
+                 if not respondent.done),
+                now,
+            )
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def close(self) -> None:
+        """Останавливает таймеры."""
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    def _schedule(self, due: float, poll_id: str, user_id: str, reminder: int) -> None:
+        """Добавляет таймер, делая недействительными прежние таймеры той же пары (опрос, участник)."""
+        key: Tuple[str, str] = (poll_id, user_id)
+        version: int = self._versions.get(key, 0) + 1
+        self._versions[key] = version
+        self._sequence += 1
+        if not self._timers or due < self._timers[0][0]:
+            self._wakeup.set()
+        heapq.heappush(self._timers, (due, self._sequence, poll_id, user_id, version, reminder))
+
+    def _schedule_reminders(self, poll_id: str, user_ids: Iterable[str], last_activity: float) -> None:
+        """Планирует первое напоминание участникам опроса."""
+        if not self.offsets:
+            return
+        for user_id in user_ids:
+            self._schedule(last_activity + self.offsets[0], poll_id, user_id, 0)
+
+    def poll_started(self, session: PollSession, user_ids: Iterable[str]) -> None:
+        """Планирует напоминания участникам и закрытие только что начатого опроса."""
+        now: float = time.time()
+        if self.deadline:
+            self._schedule(now + self.deadline, session.poll_id, "", 0)
+        self._schedule_reminders(session.poll_id, user_ids, now)
+
+    def touch(self, poll_id: str, user_id: str, stage: str) -> None:
+        """Отмечает ответ участника: напоминания отсчитываются заново, после конца опроса - отменяются."""
+        key: Tuple[str, str] = (poll_id, user_id)
+        if stage == DONE_STAGE:
+            if key in self._versions:
+                del self._versions[key]
+            return
+        self._schedule_reminders(poll_id, (user_id,), time.time())
+
+    def _is_current(self, timer: Timer) -> bool:
+        _, _, poll_id, user_id, version, _ = timer
+        return self._versions.get((poll_id, user_id)) == version
+
+    async def _run(self) -> None:
+        """Ожидает ближайший таймер и обрабатывает все наступившие."""
+        while True:
+            self._wakeup.clear()
+            if not self._timers:
+                await self._wakeup.wait()
+                continue
+            delay: float = self._timers[0][0] - time.time()
+            if delay > 0:
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), delay)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            due_timers: List[Timer] = []
+            now: float = time.time()
+            while self._timers and self._timers[0][0] <= now:
+                timer: Timer = heapq.heappop(self._timers)
+                if self._is_current(timer):
+                    due_timers.append(timer)
+            try:
+                await self._fire(due_timers)
+            except Exception as error:
+                logger.exception(f"{error}: Trouble reminders")
+
+    async def _fire(self, due_timers: List[Timer]) -> None:
+        """Отправляет наступившие напоминания пачками по вопросу и закрывает опросы по сроку."""
+        reminders: Dict[Tuple[str, str], List[str]] = {}
+        for _, _, poll_id, user_id, _, reminder in due_timers:
+            if not user_id:
+                await self.close_poll(poll_id)
+                continue
+            session: Optional[PollSession] = self.sessions.get(poll_id)
+            respondent: Optional[RespondentRecord] = self.state.get(user_id, poll_id)
+            if session is None or respondent is None or respondent.done:
+                self._versions.pop((poll_id, user_id), None)
+                continue
+            reminders.setdefault((poll_id, respondent.poll_stage), []).append(user_id)
+            if reminder + 1 < len(self.offsets):
+                # Следующее напоминание отсчитывается от того же последнего ответа
+                last_activity: float = time.time() - self.offsets[reminder]
+                self._schedule(last_activity + self.offsets[reminder + 1], poll_id, user_id, reminder + 1)
+            else:
+                self._versions.pop((poll_id, user_id), None)
+
+        for (poll_id, stage), user_ids in reminders.items():
+            reminder_reply: Optional[PollReply] = self.dispatcher.reminder(stage)
+            if reminder_reply is None:
+                continue
+            report = await self.broadcaster.broadcast(
+                user_ids, message=reminder_reply.message, keyboard=reminder_reply.keyboard
+            )
+            logger.info(
+                f"Poll {poll_id}: reminded {len(report.delivered)} of {report.total} at {stage}"
+            )
+
+    async def close_poll(self, poll_id: str) -> None:
+        """Закрывает опрос: ответы больше не принимаются, организатор получает итоги."""
+        session: Optional[PollSession] = self.sessions.get(poll_id)
+        if session is None:
+            return
+        text: str = f"{self.closed_title}\n" + format_report(
+            poll_id,
+            session.stats,
+            {user_id: self.names.get_cached(user_id) or user_id for user_id in session.stats.silent},
+            self.dispatcher.questions,
+        )
+        self.sessions.close(poll_id)
+        self._versions = {key: version for key, version in self._versions.items() if key[0] != poll_id}
+        logger.info(text)
+        if session.initiator_id:
+            self.outbox.send(int(session.initiator_id), text)
@@ -0,0 +1,230 @@
+import asyncio
+import csv
+import hashlib
+import json
+import os
+import re
+import threading
+import aiohttp
+from dataclasses import dataclass, field, asdict
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple, Any
+from vkwave.api.methods._error import APIError
+from loguru import logger
+from metrics import track_vk_call
+
+# Максимальное количество id в одном вызове users.get
+MAX_USER_IDS_PER_CALL = 1000
+# Ссылка на страницу ВКонтакте перед id или коротким именем
+VK_URL_PREFIX: re.Pattern = re.compile(r"^(?:https?://)?(?:m\.)?vk\.com/", re.IGNORECASE)
+NUMERIC_ID: re.Pattern = re.compile(r"(?:id)?(\d+)", re.IGNORECASE)
+SCREEN_NAME: re.Pattern = re.compile(r"[a-z0-9_.]{2,32}", re.IGNORECASE)
+# Заголовки колонки с id или ссылкой в CSV файле
+CSV_ID_COLUMNS = frozenset({"id", "user_id", "vk_id", "vk", "link", "screen_name", "ссылка", "вк"})
+
+
+def normalize_user_ref(value: str) -> Optional[str]:
+    """Приводит запись списка участников к id или короткому имени.
+    Args:
+        value (str): Запись вида 123, id123, @name, name, https://vk.com/id123, vk.com/name.
+    Returns:
+        Optional[str]: id ("123"), короткое имя в нижнем регистре ("name")
+            или None, если запись не похожа ни на то, ни на другое.
+    """
+    if value.isdigit():
+        # Самый частый случай - числовой id, без регулярных выражений
+        return str(int(value)) if int(value) > 0 else None
+    value = VK_URL_PREFIX.sub("", value.strip().strip("\"'\ufeff")).strip("/@ ")
+    numeric: Optional[re.Match] = NUMERIC_ID.fullmatch(value)
+    if numeric:
+        user_id: int = int(numeric.group(1))
+        return str(user_id) if user_id > 0 else None
+    if SCREEN_NAME.fullmatch(value) and not value.isdigit():
+        return value.lower()
+    return None
+
+
+@dataclass(slots=True)
+class Roster:
+    """Разобранный список участников опроса.
+    Attr:
+        user_ids (List[str]): id участников без повторов в порядке файла.
+        invalid (List[str]): Строки файла, не похожие на id или короткое имя.
+        unresolved (List[str]): Короткие имена, для которых ВКонтакте не вернул id.
+    """
+
+    user_ids: List[str] = field(default_factory=list)
+    invalid: List[str] = field(default_factory=list)
+    unresolved: List[str] = field(default_factory=list)
+
+
+class RosterLoader:
+    """Загрузка списков участников опроса из txt (по записи в строке) или csv файлов.
+    Файл читается построчно, записи проверяются и дедуплицируются, короткие имена
+    превращаются в id пачками через users.get. Результат кэшируется по хэшу содержимого,
+    а хэш - по времени изменения и размеру файла, поэтому ежедневный опрос той же группы
+    не перечитывает файл и не обращается к API.
+    """
+
+    def __init__(self, api_context: Any, cache_file: str = "") -> None:
+        """Инициализирует класс и загружает сохраненный кэш.
+        Args:
+            api_context (Any): Контекст VK API (bot.api_context).
+            cache_file (str): Файл для сохранения кэша между перезапусками, пустая строка - не сохранять.
+        Returns:
+        """
+        self.api_context = api_context
+        self.cache_file = cache_file
+        # путь -> (время изменения, размер, хэш содержимого)
+        self._stats: Dict[str, Tuple[int, int, str]] = {}
+        # хэш содержимого -> разобранный список
+        self._rosters: Dict[str, Roster] = {}
+        self._save_lock = threading.Lock()
+        self._load()
+
+    def _load(self) -> None:
+        """Загружает кэш из файла."""
+        if not self.cache_file or not os.path.exists(self.cache_file):
+            return
+        try:
+            with open(self.cache_file, "r", encoding="UTF-8") as file:
+                cached: Dict[str, Any] = json.load(file)
+            self._stats = {path: tuple(stat) for path, stat in cached["stats"].items()}
+            self._rosters = {digest: Roster(**roster) for digest, roster in cached["rosters"].items()}
+        except (OSError, ValueError, KeyError, TypeError) as error:
+            logger.debug(f"{error}: Trouble roster cache: {self.cache_file}")
+
+    def _snapshot(self) -> Dict[str, Any]:
+        """Возвращает кэш в формате файла. Хранятся только списки, на которые ссылается хотя бы один файл."""
+        used: set = {digest for _, _, digest in self._stats.values()}
+        return {
+            "stats": dict(self._stats),
+            "rosters": {digest: asdict(roster) for digest, roster in self._rosters.items() if digest in used},
+        }
+
+    def _write(self, snapshot: Dict[str, Any]) -> None:
+        with self._save_lock:
+            with open(self.cache_file, "w", encoding="UTF-8") as file:
+                json.dump(snapshot, file, ensure_ascii=False)
+
+    def save(self) -> None:
+        """Сохраняет кэш в файл."""
+        if self.cache_file:
+            self._write(self._snapshot())
+
+    async def save_async(self) -> None:
+        """Сохраняет кэш в файл из пула потоков, не задерживая эвентлуп записью на диск."""
+        if self.cache_file:
+            await asyncio.get_running_loop().run_in_executor(None, self._write, self._snapshot())
+
+    @staticmethod
+    def _iter_values(path: str, lines: Iterable[str]) -> Iterator[str]:
+        """Перебирает записи файла: строки txt или значения колонки с id в csv."""
+        if not path.lower().endswith(".csv"):
+            yield from lines
+            return
+        rows: Iterator[List[str]] = csv.reader(lines)
+        header: Optional[List[str]] = next(rows, None)
+        if header is None:
+            return
+        names: List[str] = [cell.strip().strip("\ufeff").lower() for cell in header]
+        column: int = next((index for index, name in enumerate(names) if name in CSV_ID_COLUMNS), -1)
+        if column < 0:
+            # Заголовка нет, id в первой колонке
+            column = 0
+            yield header[0] if header else ""
+        for row in rows:
+            if len(row) > column:
+                yield row[column]
+
+    @classmethod
+    def _parse(cls, path: str) -> Tuple[str, List[str], List[str]]:
+        """Читает файл построчно, считая хэш содержимого.
+        Returns:
+            Tuple[str, List[str], List[str]]: хэш, записи без повторов, некорректные строки.
+        """
+        digest = hashlib.sha256()
+        refs: Dict[str, None] = {}
+        invalid: List[str] = []
+
+        def lines() -> Iterator[str]:
+            with open(path, "rb") as file:
+                for raw_line in file:
+                    digest.update(raw_line)
+                    yield raw_line.decode("UTF-8", errors="replace")
+
+        for value in cls._iter_values(path, lines()):
+            value = value.strip()
+            if not value or value.startswith("#"):
+                continue
+            ref: Optional[str] = normalize_user_ref(value)
+            if ref is None:
+                invalid.append(value)
+            else:
+                refs[ref] = None
+        return digest.hexdigest(), list(refs), invalid
+
+    async def _resolve_screen_names(self, screen_names: List[str]) -> Tuple[Dict[str, str], bool]:
+        """Возвращает id пользователей по коротким именам, запрашивая их пачками по 1000.
+        Returns:
+            Tuple[Dict[str, str], bool]: id по коротким именам и признак, что все пачки загружены.
+        """
+        resolved: Dict[str, str] = {}
+        complete: bool = True
+        for index in range(0, len(screen_names), MAX_USER_IDS_PER_CALL):
+            batch: List[str] = screen_names[index:index + MAX_USER_IDS_PER_CALL]
+            try:
+                with track_vk_call("users.get"):
+                    response: Dict[str, Any] = await self.api_context.users.get(
+                        user_ids=batch, fields="screen_name", return_raw_response=True
+                    )
+            except APIError as get_error:
+                logger.debug(f"{get_error.message}: Trouble screen names: {batch[0]}..{batch[-1]}")
+                complete = False
+                continue
+            except (aiohttp.ClientError, asyncio.TimeoutError) as network_error:
+                logger.warning(f"{network_error!r}: Trouble screen names: {batch[0]}..{batch[-1]}")
+                complete = False
+                continue
+            for profile in response.get("response", []):
+                resolved[str(profile.get("screen_name", "")).lower()] = str(profile["id"])
+        return resolved, complete
+
+    async def load(self, path: str) -> Roster:
+        """Возвращает список участников опроса из файла.
+        Args:
+            path (str): Путь до файла со списком участников.
+        Returns:
+            Roster: id участников, некорректные строки и неизвестные короткие имена.
+        Raises:
+            EnvironmentError: если файл не удалось прочитать.
+        """
+        stat: os.stat_result = os.stat(path)
+        key: str = os.path.abspath(path)
+        cached: Optional[Tuple[int, int, str]] = self._stats.get(key)
+        if cached and cached[:2] == (stat.st_mtime_ns, stat.st_size) and cached[2] in self._rosters:
+            return self._rosters[cached[2]]
+
+        loop = asyncio.get_running_loop()
+        digest, refs, invalid = await loop.run_in_executor(None, self._parse, path)
+        self._stats[key] = (stat.st_mtime_ns, stat.st_size, digest)
+        if digest in self._rosters:
+            await self.save_async()
+            return self._rosters[digest]
+
+        screen_names: List[str] = [ref for ref in refs if not ref.isdigit()]
+        resolved, complete = await self._resolve_screen_names(screen_names) if screen_names else ({}, True)
+        user_ids: Dict[str, None] = {}
+        unresolved: List[str] = []
+        for ref in refs:
+            if ref.isdigit():
+                user_ids[ref] = None
+            elif ref in resolved:
+                user_ids[resolved[ref]] = None
+            else:
+                unresolved.append(ref)
+        roster: Roster = Roster(list(user_ids), invalid, unresolved)
+        # Список с именами, не загруженными из-за ошибки API, не кэшируется, чтобы повторить попытку
+        if complete:
+            self._rosters[digest] = roster
+            await self.save_async()
+        return roster
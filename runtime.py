@@ -0,0 +1,224 @@
+"""Среда выполнения процесса бота: блокирующие операции и запись логов вне эвентлупа,
+наблюдение за задержками эвентлупа, необязательный uvloop, замер времени запуска.
+"""
+import asyncio
+import importlib.util
+import os
+import sys
+import threading
+import time
+import traceback
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Awaitable, Deque, List, Optional, Tuple
+from loguru import logger
+from metrics import LOOP_LAG_SECONDS, LOOP_STALLS, STARTUP_SECONDS
+
+
+def configure_logging(console_level: str, log_file: Optional[str] = None, file_level: str = "DEBUG") -> None:
+    """Настраивает loguru. Записи передаются в отдельный поток (enqueue=True), поэтому
+    запись в файл и сжатие при ротации не задерживают эвентлуп.
+    Args:
+        console_level (str): Уровень логов в stderr.
+        log_file (Optional[str]): Файл логов, None или пустая строка - не писать в файл.
+        file_level (str): Уровень логов в файле.
+    Returns:
+    """
+    logger.remove()
+    logger.add(sys.stderr, level=console_level, enqueue=True)
+    if log_file:
+        logger.add(
+            log_file,
+            format="{time} {level} {message}",
+            level=file_level,
+            rotation="1 week",
+            compression="zip",
+            enqueue=True,
+        )
+
+
+def install_blocking_executor(max_workers: int, loop: Optional[asyncio.AbstractEventLoop] = None) -> ThreadPoolExecutor:
+    """Устанавливает пул потоков для блокирующих операций (чтение файлов, сохранение кэшей)
+    как пул эвентлупа по умолчанию: его использует loop.run_in_executor(None, ...).
+    Args:
+        max_workers (int): Количество потоков.
+        loop (Optional[asyncio.AbstractEventLoop]): Эвентлуп, по умолчанию текущий.
+    Returns:
+        ThreadPoolExecutor: установленный пул.
+    """
+    executor: ThreadPoolExecutor = ThreadPoolExecutor(
+        max_workers=max(1, max_workers), thread_name_prefix="blocking-io"
+    )
+    (loop or asyncio.get_running_loop()).set_default_executor(executor)
+    return executor
+
+
+def uvloop_available() -> bool:
+    """Проверяет, что uvloop установлен (он не обязателен и не входит в requirements.txt)."""
+    return importlib.util.find_spec("uvloop") is not None
+
+
+class LoopLagMonitor:
+    """Наблюдение за задержками эвентлупа.
+    Эвентлуп раз в interval секунд отмечается таймером, задержка срабатывания таймера
+    записывается в метрику. Отдельный поток проверяет отметку: если эвентлуп не отвечает
+    дольше threshold, в лог пишется стек потока эвентлупа - код, который его блокирует.
+    """
+
+    def __init__(self, threshold: float = 0.1, interval: float = 0.05, stack_limit: int = 30) -> None:
+        """Инициализирует класс.
+        Args:
+            threshold (float): Задержка эвентлупа в секундах, после которой она считается зависанием.
+            interval (float): Период отметок эвентлупа, в секундах.
+            stack_limit (int): Сколько последних кадров стека писать в лог.
+        Returns:
+        """
+        self.threshold = threshold
+        self.interval = interval
+        self.stack_limit = stack_limit
+        self.max_lag: float = 0.0
+        # Последние зависания: (длительность на момент обнаружения, стек)
+        self.stalls: Deque[Tuple[float, str]] = deque(maxlen=20)
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._loop_thread_id: int = 0
+        self._heartbeat: float = 0.0
+        self._expected: float = 0.0
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._stopped: threading.Event = threading.Event()
+        self._watchdog: Optional[threading.Thread] = None
+
+    async def start(self) -> None:
+        """Запускает отметки эвентлупа и поток наблюдения."""
+        if self._watchdog is not None:
+            return
+        self._loop = asyncio.get_running_loop()
+        self._loop_thread_id = threading.get_ident()
+        self._heartbeat = time.monotonic()
+        self._expected = self._heartbeat + self.interval
+        self._timer = self._loop.call_later(self.interval, self._tick)
+        self._stopped.clear()
+        self._watchdog = threading.Thread(target=self._watch, name="loop-lag-watchdog", daemon=True)
+        self._watchdog.start()
+
+    async def close(self) -> None:
+        """Останавливает наблюдение."""
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        self._stopped.set()
+        if self._watchdog is not None:
+            self._watchdog.join()
+            self._watchdog = None
+
+    def _tick(self) -> None:
+        """Отметка эвентлупа: задержка таймера относительно запланированного времени."""
+        now: float = time.monotonic()
+        lag: float = max(0.0, now - self._expected)
+        LOOP_LAG_SECONDS.observe(lag)
+        self.max_lag = max(self.max_lag, lag)
+        if lag > self.threshold:
+            logger.warning(f"Event loop was blocked for {lag:.3f}s")
+        self._heartbeat = now
+        self._expected = now + self.interval
+        self._timer = self._loop.call_later(self.interval, self._tick)
+
+    def _watch(self) -> None:
+        """Поток наблюдения: при зависании один раз пишет стек потока эвентлупа."""
+        reported_heartbeat: float = 0.0
+        while not self._stopped.wait(self.interval):
+            heartbeat: float = self._heartbeat
+            blocked_for: float = time.monotonic() - heartbeat - self.interval
+            if blocked_for <= self.threshold or heartbeat == reported_heartbeat:
+                continue
+            reported_heartbeat = heartbeat
+            frame = sys._current_frames().get(self._loop_thread_id)
+            if frame is None:
+                continue
+            stack: str = "".join(traceback.format_stack(frame, limit=self.stack_limit))
+            self.stalls.append((blocked_for, stack))
+            LOOP_STALLS.inc()
+            logger.warning(f"Event loop blocked for more than {blocked_for:.3f}s:\n{stack}")
+
+
+def process_age() -> float:
+    """Возвращает время в секундах с запуска процесса, включая запуск интерпретатора.
+    Читается из /proc (Linux); если /proc недоступен - 0.0, отсчет идет с вызова функции.
+    """
+    try:
+        with open("/proc/self/stat", "r") as stat_file:
+            # Имя процесса в скобках может содержать пробелы, поля считаются после него
+            fields: List[str] = stat_file.read().rsplit(")", 1)[1].split()
+        with open("/proc/uptime", "r") as uptime_file:
+            uptime: float = float(uptime_file.read().split()[0])
+        started_at: float = int(fields[19]) / os.sysconf("SC_CLK_TCK")
+    except (OSError, IndexError, ValueError):
+        return 0.0
+    return max(0.0, uptime - started_at)
+
+
+class StartupTimer:
+    """Замер этапов запуска бота: время от запуска процесса до конца каждого этапа.
+    Этапы отмечаются по порядку, разбивка пишется в лог, когда обработано первое событие.
+    """
+
+    def __init__(self) -> None:
+        """Инициализирует класс. Отсчет ведется от запуска процесса (см. process_age)."""
+        self.started_at: float = time.monotonic() - process_age()
+        self.phases: List[Tuple[str, float]] = []
+        self.finished: bool = False
+
+    def elapsed(self) -> float:
+        """Возвращает время с запуска процесса, в секундах."""
+        return time.monotonic() - self.started_at
+
+    def mark(self, phase: str) -> None:
+        """Отмечает конец этапа запуска. Повторная отметка этапа не учитывается.
+        Args:
+            phase (str): Название этапа.
+        Returns:
+        """
+        if any(name == phase for name, _ in self.phases):
+            return
+        elapsed: float = self.elapsed()
+        self.phases.append((phase, elapsed))
+        STARTUP_SECONDS.set(elapsed, phase=phase)
+
+    def finish(self, phase: str) -> None:
+        """Отмечает последний этап и один раз пишет в лог разбивку времени запуска.
+        Args:
+            phase (str): Название этапа, обычно "first event".
+        Returns:
+        """
+        if self.finished:
+            return
+        self.finished = True
+        self.mark(phase)
+        logger.info(f"Startup breakdown:\n{self.breakdown()}")
+
+    def breakdown(self) -> str:
+        """Возвращает таблицу этапов: длительность этапа и время с запуска процесса."""
+        lines: List[str] = []
+        previous: float = 0.0
+        for phase, elapsed in self.phases:
+            lines.append(f"  {phase:<28} +{(elapsed - previous) * 1000:8.1f} ms  {elapsed * 1000:8.1f} ms")
+            previous = elapsed
+        return "\n".join(lines)
+
+    async def warm_up(self, name: str, awaitable: Awaitable[Any]) -> bool:
+        """Выполняет подготовку ресурса в фоне (авторизация, первое соединение) и пишет ее длительность.
+        Ошибка подготовки не останавливает бота: ресурс будет подготовлен при первом обращении.
+        Args:
+            name (str): Название ресурса.
+            awaitable (Awaitable[Any]): Подготовка ресурса.
+        Returns:
+            bool: True, если ресурс подготовлен.
+        """
+        started_at: float = time.monotonic()
+        try:
+            await awaitable
+        except Exception as error:
+            logger.warning(f"{error}: Trouble warm up {name}, it will be initialized on first use")
+            return False
+        logger.debug(f"Warmed up {name} in {(time.monotonic() - started_at) * 1000:.1f} ms")
+        STARTUP_SECONDS.set(self.elapsed(), phase=f"{name} warm-up")
+        return True
@@ -0,0 +1,466 @@
+"""Многопроцессный режим: опрос обслуживают несколько процессов, каждый - свою часть участников.
+
+Основной процесс получает события VK и по from_id передает сообщения процессу-обработчику
+(shard_of), которому принадлежит состояние этого участника. Команды уходят пачками
+через multiprocessing.Queue, по очереди на процесс, поэтому сообщения одного участника
+обрабатываются строго по порядку. Ответы участникам обработчики отправляют сами.
+Google Sheet пишет только основной процесс: GoogleSheetInserter ведет номер следующей
+строки в памяти, и несколько процессов затирали бы строки друг друга.
+Список участников при !start тоже читает основной процесс (один раз на все процессы)
+и передает каждому обработчику только его участников.
+"""
+import asyncio
+import itertools
+import multiprocessing
+import os
+import threading
+from datetime import datetime, timedelta
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple, Union
+from loguru import logger
+from broadcaster import DeliveryReport
+from googlesheet_queue import GoogleSheetWriteQueue
+from poll_report import PollStats, format_report
+from poll_service import PollService, PollStatsByPoll, load_user_ids, shard_of
+from poll_session import make_poll_id
+from roster import RosterLoader
+from metrics import SHEET_QUEUE_DEPTH
+from runtime import LoopLagMonitor, configure_logging, install_blocking_executor
+
+# Команда обработчику: ("message", user_id, text), ("start", request_id, poll_id, url, user_ids, initiator_id),
+# ("report", request_id, poll_date, initiator_id) или ("stop",).
+# Ответ на start и report: (вид, request_id, номер процесса, текст ошибки или "", результат);
+# результат report - счетчики опросов и тексты вопросов процесса (PollDispatcher.questions)
+Command = Tuple[Any, ...]
+# Фабрика сервиса опроса процесса-обработчика: (номер процесса, количество процессов,
+# очередь строк Google Sheet, *shard_factory_args) -> (сервис, корутина закрытия клиента VK API)
+ShardFactory = Callable[..., Awaitable[Tuple[PollService, Callable[[], Awaitable[Any]]]]]
+
+
+class ShardError(EnvironmentError):
+    """Команда не выполнена процессом-обработчиком: ошибка в процессе, процесс не ответил
+    за отведенное время или завершился.
+    """
+
+
+def shard_path(path: str, index: int) -> str:
+    """Возвращает путь до файла процесса-обработчика: outbox.db -> outbox.shard0.db."""
+    if not path or path == ":memory:":
+        return path
+    root, extension = os.path.splitext(path)
+    return f"{root}.shard{index}{extension}"
+
+
+class SheetRowForwarder:
+    """Очередь записи в Google Sheet процесса-обработчика: строки передаются основному процессу."""
+
+    def __init__(self, results: multiprocessing.Queue) -> None:
+        self._results = results
+
+    @property
+    def pending(self) -> int:
+        return 0
+
+    async def start(self) -> None:
+        pass
+
+    async def put(self, googlesheet_file_url: str, row: List[Union[str, bool]]) -> None:
+        self._results.put(("row", googlesheet_file_url, row))
+
+    async def invalidate(self, googlesheet_file_url: str) -> None:
+        # Номер строки таблицы ведет основной процесс, он и сбрасывает его при !start
+        pass
+
+    async def close(self) -> None:
+        pass
+
+
+async def create_shard_service(
+    index: int,
+    shard_count: int,
+    sheet_queue: SheetRowForwarder,
+) -> Tuple[PollService, Callable[[], Awaitable[Any]]]:
+    """Создает сервис опроса процесса-обработчика с настройками из config.
+    У каждого процесса свои файлы состояния, журнала сообщений и кэшей,
+    а лимит частоты вызовов VK API делится между процессами поровну.
+    """
+    import config
+    from vkwave.bots import create_api_session_aiohttp
+    from vk_client import create_vk_client
+    from broadcaster import Broadcaster
+    from name_resolver import NameResolver
+    from outbox import Outbox
+    from poll_dispatcher import PollDispatcher
+    from state_store import create_state_store
+    import pollutils
+
+    configure_logging(
+        config.settings["CONSOLE_LOG_LEVEL"],
+        shard_path(config.settings["LOG_FILE"] or "", index),
+        config.settings["LOG_LEVEL"],
+    )
+    install_blocking_executor(config.settings["BLOCKING_IO_THREADS"])
+    loop_monitor: LoopLagMonitor = LoopLagMonitor(threshold=config.settings["LOOP_LAG_THRESHOLD"])
+    if config.settings["LOOP_LAG_THRESHOLD"]:
+        await loop_monitor.start()
+    api_session = create_api_session_aiohttp(
+        config.settings["TOKEN"], client=create_vk_client(config.settings["VK_API_URL"])
+    )
+    api_context = api_session.api.get_context()
+    broadcaster: Broadcaster = Broadcaster(
+        api_context,
+        rate=config.settings["BROADCAST_RATE"] / shard_count,
+        concurrency=config.settings["BROADCAST_CONCURRENCY"],
+        chunk_size=config.settings["BROADCAST_CHUNK_SIZE"],
+    )
+    service: PollService = PollService(
+        api_context,
+        None,
+        state=create_state_store(
+            config.settings["STATE_BACKEND"],
+            shard_path(config.settings["STATE_DB_FILE"], index),
+            keep_from_date=(
+                datetime.today() - timedelta(days=config.settings["STATE_RETENTION_DAYS"])
+            ).strftime("%Y-%m-%d"),
+        ),
+        sheet_queue=sheet_queue,
+        broadcaster=broadcaster,
+        dispatcher=PollDispatcher(pollutils.get_keybord),
+        names=NameResolver(
+            api_context,
+            ttl=config.settings["NAME_CACHE_TTL"],
+            cache_file=shard_path(config.settings["NAME_CACHE_FILE"], index),
+        ),
+        outbox=Outbox(
+            api_context,
+            shard_path(config.settings["OUTBOX_DB_FILE"], index),
+            workers=config.settings["OUTBOX_WORKERS"],
+            bucket=broadcaster.bucket,
+            max_attempts=config.settings["OUTBOX_MAX_ATTEMPTS"],
+        ),
+        retention_days=config.settings["STATE_RETENTION_DAYS"],
+        reminder_offsets=config.settings["REMINDER_OFFSETS"],
+        poll_deadline=config.settings["POLL_DEADLINE"],
+        shard=(index, shard_count),
+        definition_file=config.settings["POLL_DEFINITION_FILE"],
+        definition_reload_interval=config.settings["POLL_DEFINITION_RELOAD_INTERVAL"],
+    )
+
+    async def close() -> None:
+        await api_session.close()
+        await loop_monitor.close()
+        await logger.complete()
+
+    return service, close
+
+
+def _shard_main(
+    index: int,
+    shard_count: int,
+    commands: multiprocessing.Queue,
+    results: multiprocessing.Queue,
+    factory: ShardFactory,
+    factory_args: Tuple[Any, ...],
+    drain_timeout: float,
+) -> None:
+    """Точка входа процесса-обработчика."""
+    asyncio.run(_serve_shard(index, shard_count, commands, results, factory, factory_args, drain_timeout))
+
+
+async def _serve_shard(
+    index: int,
+    shard_count: int,
+    commands: multiprocessing.Queue,
+    results: multiprocessing.Queue,
+    factory: ShardFactory,
+    factory_args: Tuple[Any, ...],
+    drain_timeout: float,
+) -> None:
+    """Обрабатывает пачки команд основного процесса до команды stop."""
+    service, close_api = await factory(index, shard_count, SheetRowForwarder(results), *factory_args)
+    await service.start()
+    loop = asyncio.get_running_loop()
+    starting: List[asyncio.Task] = []
+
+    async def start_poll(request_id: int, poll_id: str, url: str, user_ids: List[str], initiator_id: str) -> None:
+        # Основной процесс ждет ответа каждого процесса, поэтому ответ отправляется при любой ошибке
+        try:
+            _, delivery_report = await service.start_poll_for(poll_id, url, user_ids, initiator_id=initiator_id)
+        except Exception as error:
+            logger.exception(f"{error}: Trouble shard {index} start poll: {poll_id}")
+            results.put(("started", request_id, index, f"{error!r}", None))
+            return
+        results.put(("started", request_id, index, "", delivery_report))
+
+    stopping: bool = False
+    while not stopping:
+        batch: List[Command] = await loop.run_in_executor(None, commands.get)
+        for command in batch:
+            kind: str = command[0]
+            try:
+                if kind == "message":
+                    _, user_id, text = command
+                    reply = await service.handle_answer(user_id, text)
+                    if reply is not None:
+                        service.outbox.send(int(user_id), reply.message, reply.keyboard)
+                elif kind == "start":
+                    # Рассылка первого вопроса не задерживает ответы участников других опросов
+                    starting.append(asyncio.create_task(start_poll(*command[1:])))
+                elif kind == "report":
+                    _, request_id, poll_date, initiator_id = command
+                    try:
+                        collected: PollStatsByPoll = service.collect_stats(poll_date, initiator_id)
+                    except Exception as error:
+                        logger.exception(f"{error}: Trouble shard {index} report: {poll_date}")
+                        results.put(("report", request_id, index, f"{error!r}", None))
+                    else:
+                        results.put(("report", request_id, index, "", (collected, service.dispatcher.questions)))
+                elif kind == "stop":
+                    stopping = True
+            except Exception as error:
+                logger.exception(f"{error}: Trouble shard {index} command: {kind}")
+
+    await asyncio.gather(*starting, return_exceptions=True)
+    try:
+        await asyncio.wait_for(service.outbox.join(), drain_timeout)
+    except asyncio.TimeoutError:
+        logger.warning(f"Shard {index}: {service.outbox.pending} messages left in outbox")
+    await service.close()
+    await close_api()
+
+
+class ShardedPollService:
+    """Основной процесс многопроцессного режима с интерфейсом PollService для бота.
+    Сообщения участников передаются процессам-обработчикам, команда !start - всем процессам,
+    итоги опросов собираются со всех процессов и складываются.
+    """
+
+    def __init__(
+        self,
+        sheet_queue: GoogleSheetWriteQueue,
+        shard_count: int,
+        roster: RosterLoader,
+        factory: ShardFactory = create_shard_service,
+        factory_args: Tuple[Any, ...] = (),
+        drain_timeout: float = 10.0,
+        command_timeout: float = 600.0,
+    ) -> None:
+        """Инициализирует класс.
+        Args:
+            sheet_queue (GoogleSheetWriteQueue): Очередь записи в Google Sheet, единственная на все процессы.
+            shard_count (int): Количество процессов-обработчиков.
+            roster (RosterLoader): Загрузка списков участников опроса (в основном процессе).
+            factory (ShardFactory): Функция уровня модуля, создающая сервис опроса в процессе-обработчике.
+            factory_args (Tuple[Any, ...]): Дополнительные аргументы фабрики (должны сериализоваться pickle).
+            drain_timeout (float): Сколько секунд при остановке ждать отправки исходящих сообщений.
+            command_timeout (float): Сколько секунд ждать ответа процессов на !start и !report.
+        Returns:
+        """
+        self.sheet_queue = sheet_queue
+        self.shard_count = max(1, shard_count)
+        self.roster = roster
+        self.factory = factory
+        self.factory_args = factory_args
+        self.drain_timeout = drain_timeout
+        self.command_timeout = command_timeout
+        # spawn: обработчики не наследуют эвентлуп и открытые соединения основного процесса
+        self._context = multiprocessing.get_context("spawn")
+        self._commands: List[multiprocessing.Queue] = []
+        self._results: multiprocessing.Queue = self._context.Queue()
+        self._processes: List[multiprocessing.Process] = []
+        self._pending: List[List[Command]] = [[] for _ in range(self.shard_count)]
+        self._flush_scheduled: bool = False
+        self._requests: Dict[int, Tuple[asyncio.Future, Dict[int, Tuple[str, Any]]]] = {}
+        self._request_ids = itertools.count(1)
+        self._reader: Optional[threading.Thread] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+    async def start(self) -> None:
+        """Запускает процессы-обработчики и запись результатов опроса."""
+        self._loop = asyncio.get_running_loop()
+        await self.sheet_queue.start()
+        SHEET_QUEUE_DEPTH.collect = lambda: {(): self.sheet_queue.pending}
+        for index in range(self.shard_count):
+            commands: multiprocessing.Queue = self._context.Queue()
+            process: multiprocessing.Process = self._context.Process(
+                target=_shard_main,
+                args=(
+                    index,
+                    self.shard_count,
+                    commands,
+                    self._results,
+                    self.factory,
+                    self.factory_args,
+                    self.drain_timeout,
+                ),
+                name=f"poll-shard-{index}",
+            )
+            process.start()
+            self._commands.append(commands)
+            self._processes.append(process)
+        self._reader = threading.Thread(target=self._read_results, name="poll-shard-results", daemon=True)
+        self._reader.start()
+        logger.info(f"Started {self.shard_count} poll shards")
+
+    async def close(self) -> None:
+        """Останавливает процессы-обработчики и дописывает результаты опроса."""
+        self._flush()
+        for commands in self._commands:
+            commands.put([("stop",)])
+        loop = asyncio.get_running_loop()
+        for process in self._processes:
+            await loop.run_in_executor(None, process.join)
+        if self._reader is not None:
+            self._results.put(None)
+            await loop.run_in_executor(None, self._reader.join)
+            # Строки, переданные из потока чтения, попадают в очередь записи до ее закрытия
+            await asyncio.sleep(0)
+        await self.sheet_queue.close()
+
+    def _read_results(self) -> None:
+        """Поток чтения ответов процессов-обработчиков."""
+        while True:
+            result: Optional[Tuple[Any, ...]] = self._results.get()
+            if result is None:
+                return
+            self._loop.call_soon_threadsafe(self._on_result, result)
+
+    def _on_result(self, result: Tuple[Any, ...]) -> None:
+        """Передает строку в очередь записи или ответ процесса ожидающему запросу."""
+        if result[0] == "row":
+            _, googlesheet_file_url, row = result
+            asyncio.ensure_future(self.sheet_queue.put(googlesheet_file_url, row))
+            return
+        _, request_id, shard, error, payload = result
+        if request_id not in self._requests:
+            # Ответ пришел после истечения command_timeout
+            return
+        future, answers = self._requests[request_id]
+        answers[shard] = (error, payload)
+        if len(answers) == self.shard_count and not future.done():
+            future.set_result(None)
+
+    def _send(self, shard: int, command: Command) -> None:
+        """Добавляет команду в пачку процесса. Пачки отправляются один раз за итерацию эвентлупа."""
+        self._pending[shard].append(command)
+        if not self._flush_scheduled:
+            self._flush_scheduled = True
+            asyncio.get_running_loop().call_soon(self._flush)
+
+    def _flush(self) -> None:
+        self._flush_scheduled = False
+        for shard, batch in enumerate(self._pending):
+            if batch:
+                self._commands[shard].put(batch)
+                self._pending[shard] = []
+
+    async def _ask_all(self, *command: Any, shard_arguments: Optional[List[Tuple[Any, ...]]] = None) -> List[Any]:
+        """Отправляет команду всем процессам и ожидает ответов всех процессов.
+        Args:
+            command (Any): Вид команды и аргументы, общие для всех процессов.
+            shard_arguments (Optional[List[Tuple[Any, ...]]]): Аргументы каждого процесса по порядку
+                номеров, добавляются после общих.
+        Returns:
+            List[Any]: результаты процессов по порядку номеров.
+        Raises:
+            ShardError: если процесс ответил ошибкой, не ответил за command_timeout секунд или завершился.
+        """
+        loop = asyncio.get_running_loop()
+        request_id: int = next(self._request_ids)
+        future: asyncio.Future = loop.create_future()
+        answers: Dict[int, Tuple[str, Any]] = {}
+        self._requests[request_id] = (future, answers)
+        for shard in range(self.shard_count):
+            self._send(
+                shard, (command[0], request_id) + command[1:] + (shard_arguments[shard] if shard_arguments else ())
+            )
+        deadline: float = loop.time() + self.command_timeout
+        try:
+            while not future.done():
+                waiting: List[int] = [shard for shard in range(self.shard_count) if shard not in answers]
+                dead: List[int] = [shard for shard in waiting if not self._processes[shard].is_alive()]
+                if dead:
+                    raise ShardError(f"Poll shards {dead} are not running")
+                if loop.time() >= deadline:
+                    raise ShardError(f"Poll shards {waiting} did not answer {command[0]} in {self.command_timeout}s")
+                # Процессы проверяются раз в секунду: завершившийся процесс не ответит никогда
+                await asyncio.wait({future}, timeout=min(1.0, max(0.0, deadline - loop.time())))
+        finally:
+            del self._requests[request_id]
+        errors: List[str] = [error for error, _ in answers.values() if error]
+        if errors:
+            raise ShardError("; ".join(dict.fromkeys(errors)))
+        return [answers[shard][1] for shard in range(self.shard_count)]
+
+    async def start_poll(
+        self,
+        path_to_file_with_respondents_ids: str,
+        googlesheet_file_url: str,
+        initiator_id: str = "",
+    ) -> Tuple[None, DeliveryReport]:
+        """Запускает опрос во всех процессах: список участников читается здесь, каждый процесс
+        получает и опрашивает свою часть участников.
+        Args:
+            path_to_file_with_respondents_ids (str): Путь до файла со списком id участников.
+            googlesheet_file_url (str): Ссылка на Google Sheet для результатов.
+            initiator_id (str): id пользователя, запустившего опрос.
+        Returns:
+            Tuple[None, DeliveryReport]: сессии опроса остаются в процессах-обработчиках,
+                отчеты о рассылке процессов объединяются.
+        Raises:
+            EnvironmentError: если файл со списком участников не удалось прочитать.
+            ShardError: если процесс не запустил опрос (ShardError - подкласс EnvironmentError).
+        """
+        user_ids: List[str] = await load_user_ids(self.roster, path_to_file_with_respondents_ids)
+        shard_user_ids: List[List[str]] = [[] for _ in range(self.shard_count)]
+        for user_id in user_ids:
+            shard_user_ids[shard_of(user_id, self.shard_count)].append(user_id)
+        await self.sheet_queue.invalidate(googlesheet_file_url)
+        # id опроса выбирается здесь, чтобы у всех процессов была одна дата, даже около полуночи
+        shard_reports: List[DeliveryReport] = await self._ask_all(
+            "start",
+            make_poll_id(datetime.today().strftime("%Y-%m-%d"), path_to_file_with_respondents_ids),
+            googlesheet_file_url,
+            shard_arguments=[(shard_user_ids[shard], initiator_id) for shard in range(self.shard_count)],
+        )
+        delivery_report: DeliveryReport = DeliveryReport()
+        for shard_report in shard_reports:
+            delivery_report.delivered.extend(shard_report.delivered)
+            delivery_report.failed.update(shard_report.failed)
+            delivery_report.error_codes.update(shard_report.error_codes)
+            delivery_report.elapsed = max(delivery_report.elapsed, shard_report.elapsed)
+        logger.info(
+            f"Poll {path_to_file_with_respondents_ids}: delivered {len(delivery_report.delivered)}"
+            f" of {delivery_report.total} by {self.shard_count} shards"
+        )
+        return None, delivery_report
+
+    async def handle_answer(self, user_id: str, text: str) -> None:
+        """Передает ответ респондента процессу, которому принадлежит его состояние.
+        Ответ участнику отправляет сам процесс-обработчик, поэтому возвращается None.
+        """
+        self._send(shard_of(user_id, self.shard_count), ("message", user_id, text))
+
+    async def report(self, poll_date: str, initiator_id: Optional[str] = None) -> List[str]:
+        """Возвращает итоги опросов дня, сложенные по всем процессам.
+        Args:
+            poll_date (str): Дата опросов (YYYY-MM-DD).
+            initiator_id (Optional[str]): Только идущие опросы, запущенные этим пользователем;
+                None - все опросы дня, включая закрытые.
+        Returns:
+            List[str]: тексты итогов.
+        Raises:
+            ShardError: если процесс не вернул итоги.
+        """
+        merged: PollStatsByPoll = {}
+        questions: Dict[str, str] = {}
+        for collected, shard_questions in await self._ask_all("report", poll_date, initiator_id):
+            questions.update(shard_questions)
+            for poll_id, (stats, names) in collected.items():
+                if poll_id not in merged:
+                    merged[poll_id] = (PollStats(), {})
+                merged[poll_id][0].merge(stats)
+                merged[poll_id][1].update(names)
+        return [
+            format_report(poll_id, stats, names, questions)
+            for poll_id, (stats, names) in sorted(merged.items())
+        ]
@@ -0,0 +1,90 @@
+import queue
+import sqlite3
+import threading
+from concurrent.futures import Future
+from typing import Any, Iterable, List, Optional, Tuple, Union
+from loguru import logger
+
+# Запись очереди: (SQL, параметры, executemany), Future для sync() или None для остановки
+WriterItem = Optional[Union[Tuple[str, Any, bool], Future]]
+
+
+class SQLiteWriter:
+    """Поток записи в SQLite. Изменения ставятся в очередь без ожидания диска, поток
+    забирает все накопившиеся изменения и записывает их одной транзакцией, поэтому
+    эвентлуп не ждет commit, а под нагрузкой на диск уходит одна транзакция на пачку.
+    Изменения записываются строго в порядке добавления.
+    """
+
+    def __init__(self, connection: sqlite3.Connection, name: str = "sqlite-writer", max_batch: int = 1000) -> None:
+        """Инициализирует класс и запускает поток записи.
+        Args:
+            connection (sqlite3.Connection): Соединение, открытое с check_same_thread=False.
+                После запуска писать в него можно только через этот класс.
+            name (str): Имя потока (для логов и стеков).
+            max_batch (int): Максимальное количество изменений в одной транзакции.
+        Returns:
+        """
+        self._connection = connection
+        self.max_batch = max(1, max_batch)
+        self._queue: "queue.SimpleQueue[WriterItem]" = queue.SimpleQueue()
+        self._thread: threading.Thread = threading.Thread(target=self._run, name=name, daemon=True)
+        self._thread.start()
+
+    def execute(self, sql: str, parameters: Tuple[Any, ...] = ()) -> None:
+        """Ставит изменение в очередь записи."""
+        self._queue.put((sql, parameters, False))
+
+    def executemany(self, sql: str, parameters: Iterable[Tuple[Any, ...]]) -> None:
+        """Ставит в очередь записи одно изменение для каждого набора параметров."""
+        self._queue.put((sql, list(parameters), True))
+
+    def sync(self) -> Future:
+        """Возвращает Future, который завершится, когда все поставленные до вызова изменения будут записаны."""
+        future: Future = Future()
+        self._queue.put(future)
+        return future
+
+    def close(self) -> None:
+        """Дописывает очередь, останавливает поток и закрывает соединение."""
+        if self._thread.is_alive():
+            self._queue.put(None)
+            self._thread.join()
+
+    def _next_batch(self) -> List[WriterItem]:
+        """Ожидает первое изменение и забирает все, что накопилось за ним."""
+        batch: List[WriterItem] = [self._queue.get()]
+        while len(batch) < self.max_batch:
+            try:
+                batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self) -> None:
+        stopping: bool = False
+        while not stopping:
+            batch: List[WriterItem] = self._next_batch()
+            synced: List[Future] = []
+            try:
+                with self._connection:
+                    for item in batch:
+                        if item is None:
+                            stopping = True
+                        elif isinstance(item, Future):
+                            synced.append(item)
+                        else:
+                            sql, parameters, many = item
+                            # Ошибка одного изменения не отменяет остальные изменения пачки
+                            try:
+                                if many:
+                                    self._connection.executemany(sql, parameters)
+                                else:
+                                    self._connection.execute(sql, parameters)
+                            except sqlite3.Error as error:
+                                logger.exception(f"{error}: Trouble sqlite write: {sql}")
+            except sqlite3.Error as error:
+                logger.exception(f"{error}: Trouble sqlite commit")
+            for future in synced:
+                future.set_result(None)
+        self._connection.close()
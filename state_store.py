@@ -0,0 +1,353 @@
+import json
+import sqlite3
+from abc import ABC, abstractmethod
+from dataclasses import dataclass, field
+from enum import IntEnum
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple, Any
+from sqlite_writer import SQLiteWriter
+
+
+class PollStage(IntEnum):
+    """Стадии опроса по умолчанию (DEFAULT_POLL_DEFINITION). Стадии опроса из файла описания
+    называются как угодно, в состоянии респондента хранится имя стадии. Числа - формат
+    файла состояния до перехода на имена стадий, нужны только для его преобразования.
+    """
+
+    WILL_CERTIFICATE = 1
+    CERTIFICATE_DATA = 2
+    SYMPTOMS = 3
+    LAST_DAY_IN_UNIVERSATY = 4
+    DONE = 5
+    IN_PROGRESS = 6
+    IS_ILL = 7
+
+
+# Последняя стадия любого опроса: респондент ответил на все вопросы
+DONE_STAGE: str = PollStage.DONE.name
+
+
+@dataclass(slots=True)
+class RespondentRecord:
+    """Состояние одного респондента в одном опросе.
+    Attr:
+        poll_stage (str): Имя стадии опроса, на вопрос которой отвечает респондент
+            (по умолчанию - первая стадия опроса по умолчанию).
+        answers (Dict[str, Any]): Ответы респондента по полям из описания опроса (field стадии).
+    """
+
+    poll_stage: str = PollStage.IN_PROGRESS.name
+    answers: Dict[str, Any] = field(default_factory=dict)
+
+    @property
+    def done(self) -> bool:
+        """Проверяет, что респондент прошел опрос."""
+        return self.poll_stage == DONE_STAGE
+
+
+# Поля состояния респондента до перехода на ответы по полям из описания опроса
+LEGACY_FIELDS: Tuple[str, ...] = (
+    "ill",
+    "diagnosis",
+    "medical_certificate",
+    "medical_certificate_data",
+    "date_of_last_class_attendance",
+)
+
+
+def upgrade_legacy_row(poll_stage: int, values: Tuple[Any, ...]) -> RespondentRecord:
+    """Возвращает состояние респондента по строке файла состояния прежнего формата.
+    Args:
+        poll_stage (int): Номер стадии PollStage.
+        values (Tuple[Any, ...]): Значения полей LEGACY_FIELDS.
+    Returns:
+        RespondentRecord: состояние с ответами, которые респондент успел дать.
+    """
+    stage: PollStage = PollStage(poll_stage)
+    answers: Dict[str, Any] = dict(zip(LEGACY_FIELDS, values))
+    answers["ill"] = bool(answers["ill"])
+    answers["medical_certificate"] = bool(answers["medical_certificate"])
+    # Значение по умолчанию прежнего формата не отличить от ответа: False - ответ,
+    # только если респондент уже прошел вопрос, пустые строки - не ответы
+    answered: Dict[str, Any] = {name: value for name, value in answers.items() if value}
+    if stage not in (PollStage.IN_PROGRESS, PollStage.IS_ILL):
+        answered.setdefault("ill", False)
+        if answers["ill"] and stage != PollStage.WILL_CERTIFICATE:
+            answered.setdefault("medical_certificate", False)
+    return RespondentRecord(stage.name, answered)
+
+
+class BaseStateStore(ABC):
+    """Хранилище состояния респондентов, ключ - пара (id пользователя, id опроса).
+    id опроса начинается с даты опроса в формате YYYY-MM-DD, поэтому опросы
+    можно вытеснять по дате простым сравнением строк.
+    """
+
+    @abstractmethod
+    def get(self, user_id: str, poll_id: str) -> Optional[RespondentRecord]:
+        """Возвращает состояние респондента в опросе или None, если он в опросе не участвует."""
+
+    @abstractmethod
+    def save(self, user_id: str, poll_id: str, record: RespondentRecord) -> None:
+        """Сохраняет состояние респондента в опросе."""
+
+    def save_many(self, poll_id: str, records: Iterable[Tuple[str, RespondentRecord]]) -> None:
+        """Сохраняет состояния нескольких респондентов опроса."""
+        for user_id, record in records:
+            self.save(user_id, poll_id, record)
+
+    @abstractmethod
+    def evict_before(self, poll_date: str) -> int:
+        """Удаляет (архивирует) опросы, проведенные раньше poll_date (YYYY-MM-DD).
+        Returns:
+            int: количество удаленных записей.
+        """
+
+    @abstractmethod
+    def delete_poll(self, poll_id: str) -> int:
+        """Удаляет состояние всех респондентов опроса (перезапуск опроса командой !start).
+        Returns:
+            int: количество удаленных записей.
+        """
+
+    @abstractmethod
+    def poll_ids(self) -> List[str]:
+        """Возвращает id опросов, состояние которых хранится (кроме архива)."""
+
+    @abstractmethod
+    def items(self, poll_id: str) -> Iterator[Tuple[str, RespondentRecord]]:
+        """Перебирает респондентов опроса и их состояния."""
+
+    @abstractmethod
+    def save_session(self, poll_id: str, googlesheet_file_url: str, initiator_id: str) -> None:
+        """Сохраняет параметры опроса: ссылку на таблицу с результатами и id организатора."""
+
+    @abstractmethod
+    def sessions(self) -> List[Tuple[str, str, str]]:
+        """Возвращает сохраненные опросы: (id опроса, ссылка на таблицу, id организатора)."""
+
+    @abstractmethod
+    def delete_session(self, poll_id: str) -> None:
+        """Удаляет параметры закрытого опроса. Состояние респондентов остается до вытеснения."""
+
+    def close(self) -> None:
+        """Освобождает ресурсы хранилища."""
+
+
+class MemoryStateStore(BaseStateStore):
+    """Хранилище состояния в памяти процесса. Теряется при перезапуске."""
+
+    def __init__(self) -> None:
+        """Инициализирует класс."""
+        self._polls: Dict[str, Dict[str, RespondentRecord]] = {}
+        self._sessions: Dict[str, Tuple[str, str]] = {}
+
+    def get(self, user_id: str, poll_id: str) -> Optional[RespondentRecord]:
+        poll: Optional[Dict[str, RespondentRecord]] = self._polls.get(poll_id)
+        return poll.get(user_id) if poll is not None else None
+
+    def save(self, user_id: str, poll_id: str, record: RespondentRecord) -> None:
+        self._polls.setdefault(poll_id, {})[user_id] = record
+
+    def evict_before(self, poll_date: str) -> int:
+        # id опросов начинаются с даты YYYY-MM-DD и сравниваются как строки
+        for expired_id in [poll_id for poll_id in self._sessions if poll_id < poll_date]:
+            del self._sessions[expired_id]
+        expired = [poll_id for poll_id in self._polls if poll_id < poll_date]
+        return sum(len(self._polls.pop(poll_id)) for poll_id in expired)
+
+    def delete_poll(self, poll_id: str) -> int:
+        return len(self._polls.pop(poll_id, {}))
+
+    def poll_ids(self) -> List[str]:
+        return sorted(self._polls)
+
+    def items(self, poll_id: str) -> Iterator[Tuple[str, RespondentRecord]]:
+        return iter(list(self._polls.get(poll_id, {}).items()))
+
+    def save_session(self, poll_id: str, googlesheet_file_url: str, initiator_id: str) -> None:
+        self._sessions[poll_id] = (googlesheet_file_url, initiator_id)
+
+    def sessions(self) -> List[Tuple[str, str, str]]:
+        return [
+            (poll_id, googlesheet_file_url, initiator_id)
+            for poll_id, (googlesheet_file_url, initiator_id) in sorted(self._sessions.items())
+        ]
+
+    def delete_session(self, poll_id: str) -> None:
+        self._sessions.pop(poll_id, None)
+
+
+class SQLiteStateStore(MemoryStateStore):
+    """Хранилище состояния в SQLite (режим WAL) с кэшем в памяти.
+    Чтение идет из памяти, изменения записывает на диск поток SQLiteWriter пачками,
+    не задерживая эвентлуп. При запуске незавершенные опросы восстанавливаются
+    из файла. Старые опросы переносятся в таблицу archive.
+    """
+
+    _COLUMNS: str = "user_id, poll_id, poll_stage, answers"
+    _PLACEHOLDERS: str = "?, ?, ?, ?"
+
+    def __init__(self, path: str, keep_from_date: str = "") -> None:
+        """Инициализирует класс и восстанавливает состояние из файла.
+        Args:
+            path (str): Путь до файла базы данных.
+            keep_from_date (str): Опросы раньше этой даты (YYYY-MM-DD) сразу уходят в архив.
+        Returns:
+        """
+        super().__init__()
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute("PRAGMA synchronous=NORMAL")
+        for table in ("respondents", "archive"):
+            self._create_table(table)
+        self._connection.execute(
+            """CREATE TABLE IF NOT EXISTS sessions (
+                poll_id TEXT PRIMARY KEY,
+                googlesheet_file_url TEXT NOT NULL,
+                initiator_id TEXT NOT NULL
+            )"""
+        )
+        self._connection.commit()
+        self._writer: SQLiteWriter = SQLiteWriter(self._connection, "poll-state-writer")
+        if keep_from_date:
+            self.evict_before(keep_from_date)
+            self._writer.sync().result()
+        self._recover()
+
+    def _create_table(self, table: str) -> None:
+        """Создает таблицу состояния респондентов. Ответы хранятся в JSON, поэтому новые вопросы
+        в описании опроса не меняют схему. Таблица прежнего формата (столбец на поле) преобразуется.
+        """
+        columns: List[str] = [column for _, column, *_ in self._connection.execute(f"PRAGMA table_info({table})")]
+        legacy: bool = bool(columns) and "answers" not in columns
+        if legacy:
+            # Преобразование - одна транзакция: прерванное на середине не теряет состояние
+            self._connection.execute("BEGIN")
+            self._connection.execute(f"ALTER TABLE {table} RENAME TO {table}_legacy")
+        self._connection.execute(
+            f"""CREATE TABLE IF NOT EXISTS {table} (
+                user_id TEXT NOT NULL,
+                poll_id TEXT NOT NULL,
+                poll_stage TEXT NOT NULL,
+                answers TEXT NOT NULL,
+                PRIMARY KEY (poll_id, user_id)
+            ) WITHOUT ROWID"""
+        )
+        if legacy:
+            self._connection.executemany(
+                f"INSERT INTO {table} ({self._COLUMNS}) VALUES ({self._PLACEHOLDERS})",
+                (
+                    self._as_row(user_id, poll_id, upgrade_legacy_row(poll_stage, tuple(values)))
+                    for user_id, poll_id, poll_stage, *values in self._connection.execute(
+                        f"SELECT user_id, poll_id, poll_stage, {', '.join(LEGACY_FIELDS)} FROM {table}_legacy"
+                    ).fetchall()
+                ),
+            )
+            self._connection.execute(f"DROP TABLE {table}_legacy")
+            self._connection.commit()
+
+    @staticmethod
+    def _as_record(row: Tuple[Any, ...]) -> RespondentRecord:
+        """Возвращает состояние респондента по строке таблицы без user_id и poll_id."""
+        poll_stage, answers = row
+        return RespondentRecord(poll_stage, json.loads(answers))
+
+    @classmethod
+    def iter_poll_date(cls, path: str, poll_date: str) -> Iterator[Tuple[str, str, RespondentRecord]]:
+        """Перебирает респондентов всех опросов дня, включая архив, не загружая их в память.
+        Args:
+            path (str): Путь до файла базы данных.
+            poll_date (str): Дата опросов (YYYY-MM-DD).
+        Returns:
+            Iterator[Tuple[str, str, RespondentRecord]]: (id опроса, id пользователя, состояние).
+        """
+        connection = sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+        try:
+            # id опросов дня лежат в диапазоне ["YYYY-MM-DD/", "YYYY-MM-DD0"), поиск идет по первичному ключу
+            for table in ("archive", "respondents"):
+                for poll_id, user_id, *row in connection.execute(
+                    f"SELECT poll_id, user_id, poll_stage, answers FROM {table}"
+                    " WHERE poll_id >= ? AND poll_id < ? ORDER BY poll_id, user_id",
+                    (f"{poll_date}/", f"{poll_date}0"),
+                ):
+                    yield poll_id, user_id, cls._as_record(row)
+        finally:
+            connection.close()
+
+    def _recover(self) -> None:
+        """Загружает в память состояние всех неархивированных опросов."""
+        for poll_id, googlesheet_file_url, initiator_id in self._connection.execute(
+            "SELECT poll_id, googlesheet_file_url, initiator_id FROM sessions"
+        ):
+            super().save_session(poll_id, googlesheet_file_url, initiator_id)
+        for user_id, poll_id, *row in self._connection.execute(
+            f"SELECT {self._COLUMNS} FROM respondents"
+        ):
+            super().save(user_id, poll_id, self._as_record(row))
+
+    @staticmethod
+    def _as_row(user_id: str, poll_id: str, record: RespondentRecord) -> Tuple[Any, ...]:
+        """Возвращает строку таблицы respondents для состояния респондента."""
+        return user_id, poll_id, record.poll_stage, json.dumps(record.answers, ensure_ascii=False)
+
+    def save(self, user_id: str, poll_id: str, record: RespondentRecord) -> None:
+        super().save(user_id, poll_id, record)
+        self._writer.execute(
+            f"INSERT OR REPLACE INTO respondents ({self._COLUMNS}) VALUES ({self._PLACEHOLDERS})",
+            self._as_row(user_id, poll_id, record),
+        )
+
+    def save_many(self, poll_id: str, records: Iterable[Tuple[str, RespondentRecord]]) -> None:
+        records = list(records)
+        for user_id, record in records:
+            super().save(user_id, poll_id, record)
+        self._writer.executemany(
+            f"INSERT OR REPLACE INTO respondents ({self._COLUMNS}) VALUES ({self._PLACEHOLDERS})",
+            (self._as_row(user_id, poll_id, record) for user_id, record in records),
+        )
+
+    def evict_before(self, poll_date: str) -> int:
+        # В памяти те же опросы, что и в таблице respondents, поэтому количество берется из памяти
+        evicted: int = super().evict_before(poll_date)
+        self._writer.execute(
+            f"INSERT OR REPLACE INTO archive SELECT {self._COLUMNS} FROM respondents WHERE poll_id < ?",
+            (poll_date,),
+        )
+        self._writer.execute("DELETE FROM respondents WHERE poll_id < ?", (poll_date,))
+        self._writer.execute("DELETE FROM sessions WHERE poll_id < ?", (poll_date,))
+        return evicted
+
+    def delete_poll(self, poll_id: str) -> int:
+        self._writer.execute("DELETE FROM respondents WHERE poll_id = ?", (poll_id,))
+        return super().delete_poll(poll_id)
+
+    def save_session(self, poll_id: str, googlesheet_file_url: str, initiator_id: str) -> None:
+        super().save_session(poll_id, googlesheet_file_url, initiator_id)
+        self._writer.execute(
+            "INSERT OR REPLACE INTO sessions (poll_id, googlesheet_file_url, initiator_id) VALUES (?, ?, ?)",
+            (poll_id, googlesheet_file_url, initiator_id),
+        )
+
+    def delete_session(self, poll_id: str) -> None:
+        super().delete_session(poll_id)
+        self._writer.execute("DELETE FROM sessions WHERE poll_id = ?", (poll_id,))
+
+    def close(self) -> None:
+        """Дописывает очередь изменений и закрывает файл."""
+        self._writer.close()
+
+
+def create_state_store(backend: str, path: str = "", keep_from_date: str = "") -> BaseStateStore:
+    """Создает хранилище состояния по имени бэкенда.
+    Args:
+        backend (str): "memory" или "sqlite".
+        path (str): Путь до файла базы данных (для sqlite).
+        keep_from_date (str): Опросы раньше этой даты не восстанавливаются (для sqlite).
+    Returns:
+        BaseStateStore: хранилище состояния.
+    """
+    if backend == "sqlite":
+        return SQLiteStateStore(path, keep_from_date)
+    if backend == "memory":
+        return MemoryStateStore()
+    raise ValueError(f"Unknown state backend: {backend}")
@@ -0,0 +1,98 @@
+import asyncio
+from typing import Any, Dict, List, Tuple
+
+import aiohttp
+import pytest
+
+from callback_server import CallbackServer
+
+GROUP_ID: int = 42
+MESSAGE_EVENT: Dict[str, Any] = {
+    "type": "message_new",
+    "group_id": GROUP_ID,
+    "event_id": "1",
+    "object": {"message": {"from_id": 1, "peer_id": 1, "text": "Да"}},
+}
+
+
+async def post(body: Any, raw: bool = False) -> Tuple[int, str, List[Dict[str, Any]]]:
+    """Отправляет тело запроса серверу Callback API и возвращает статус, ответ и принятые события."""
+    received: List[Dict[str, Any]] = []
+
+    async def handler(event: Dict[str, Any]) -> None:
+        received.append(event)
+
+    server: CallbackServer = CallbackServer(handler, group_id=GROUP_ID, confirmation_code="code")
+    await server.start("127.0.0.1", 0)
+    port: int = server._runner.addresses[0][1]
+    try:
+        async with aiohttp.ClientSession() as session:
+            request = session.post(f"http://127.0.0.1:{port}/callback", **({"data": body} if raw else {"json": body}))
+            async with request as response:
+                status, text = response.status, await response.text()
+    finally:
+        await server.close()
+    return status, text, received
+
+
+@pytest.mark.parametrize(
+    "body, raw",
+    [
+        ("{not json", True),
+        ([MESSAGE_EVENT], False),
+        ("message_new", False),
+        (None, False),
+        ({**MESSAGE_EVENT, "group_id": "42"}, False),
+        ({**MESSAGE_EVENT, "group_id": None}, False),
+        ({**MESSAGE_EVENT, "group_id": True}, False),
+        ({key: value for key, value in MESSAGE_EVENT.items() if key != "group_id"}, False),
+    ],
+)
+def test_malformed_body_is_bad_request(body: Any, raw: bool) -> None:
+    status, _, received = asyncio.run(post(body, raw))
+
+    assert status == 400
+    assert received == []
+
+
+def test_other_group_is_forbidden() -> None:
+    status, _, received = asyncio.run(post({**MESSAGE_EVENT, "group_id": GROUP_ID + 1}))
+
+    assert status == 403
+    assert received == []
+
+
+UNEXPECTED_OBJECTS: List[Any] = [
+    [],
+    "text",
+    {"message": "text"},
+    {"message": {"from_id": "abc"}},
+    {"message": {"from_id": [1]}},
+    {"message": {"from_id": 1, "text": "Да"}},
+    {"message": {"from_id": 1, "peer_id": True, "text": "Да"}},
+    {"message": {"from_id": 1, "peer_id": 1, "text": None}},
+]
+
+
+@pytest.mark.parametrize("event_object", UNEXPECTED_OBJECTS)
+def test_message_with_unexpected_object_is_bad_request(event_object: Any) -> None:
+    status, _, received = asyncio.run(post({**MESSAGE_EVENT, "object": event_object}))
+
+    assert status == 400
+    assert received == []
+
+
+@pytest.mark.parametrize("event_object", UNEXPECTED_OBJECTS)
+def test_other_event_with_unexpected_object_is_accepted(event_object: Any) -> None:
+    status, text, received = asyncio.run(post({**MESSAGE_EVENT, "type": "message_reply", "object": event_object}))
+
+    assert (status, text) == (200, "ok")
+    assert [event["object"] for event in received] == [event_object]
+
+
+def test_confirmation_and_message() -> None:
+    assert asyncio.run(post({"type": "confirmation", "group_id": GROUP_ID}))[:2] == (200, "code")
+    status, text, received = asyncio.run(post(MESSAGE_EVENT))
+
+    assert (status, text) == (200, "ok")
+    assert received == [MESSAGE_EVENT]
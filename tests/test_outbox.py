@@ -0,0 +1,68 @@
+import asyncio
+import sqlite3
+from typing import Any, Dict, List
+
+from broadcaster import DeliveryReport
+from outbox import Outbox, OutboxMessage
+
+
+class FakeMessages:
+    """messages.send, запоминающий получателей."""
+
+    def __init__(self) -> None:
+        self.sent: List[int] = []
+
+    async def send(self, peer_id: int, **params: Any) -> Dict[str, Any]:
+        self.sent.append(peer_id)
+        return {"response": 1}
+
+
+class FakeApi:
+    def __init__(self) -> None:
+        self.messages = FakeMessages()
+
+
+def journal(path: str) -> List[tuple]:
+    connection: sqlite3.Connection = sqlite3.connect(path)
+    try:
+        return list(connection.execute("SELECT peer_id, failed FROM outbox ORDER BY peer_id"))
+    finally:
+        connection.close()
+
+
+def test_held_broadcast_is_sent_after_restart(tmp_path) -> None:
+    path: str = str(tmp_path / "outbox.db")
+    # Процесс упал посреди рассылки: release не вызван
+    asyncio.run(Outbox(FakeApi(), path).hold([1, 2, 3], "Вы болеете?"))
+
+    async def restart() -> List[int]:
+        api: FakeApi = FakeApi()
+        outbox: Outbox = Outbox(api, path)
+        await outbox.start()
+        await outbox.join()
+        await outbox.close()
+        return api.messages.sent
+
+    assert sorted(asyncio.run(restart())) == [1, 2, 3]
+    assert journal(path) == []
+
+
+def test_release_marks_delivered_and_queues_the_rest(tmp_path) -> None:
+    path: str = str(tmp_path / "outbox.db")
+    api: FakeApi = FakeApi()
+
+    async def broadcast() -> None:
+        outbox: Outbox = Outbox(api, path)
+        await outbox.start()
+        held: Dict[int, OutboxMessage] = await outbox.hold([1, 2, 3, 4], "Вы болеете?")
+        report: DeliveryReport = DeliveryReport(
+            delivered=[1], failed={2: "[901] denied", 3: "timeout"}, error_codes={2: 901}
+        )
+        outbox.release(held, report)
+        await outbox.join()
+        await outbox.close()
+
+    asyncio.run(broadcast())
+
+    assert sorted(api.messages.sent) == [3, 4]
+    assert journal(path) == [(2, 1)]
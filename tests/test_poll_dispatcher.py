@@ -0,0 +1,276 @@
+import copy
+import random
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import pytest
+
+from googlesheet_inserter import GoogleSheetInserter
+from poll_dispatcher import (
+    DEFAULT_POLL_DEFINITION,
+    HEALTHY_MESSAGE,
+    IS_ILL_ANSWERS,
+    QUESTIONS,
+    PollDispatcher,
+    PollReply,
+    compile_poll,
+    validate_date,
+    validate_free_text,
+)
+from poll_report import PollStats, format_report
+from state_store import PollStage, RespondentRecord
+
+CERTIFICATE_QUESTION, CERTIFICATE_ANSWERS = QUESTIONS[PollStage.WILL_CERTIFICATE]
+# Сообщения, из которых собираются случайные последовательности ответов:
+# варианты ответа, даты, произвольный текст и ответы, которые не подходят ни к одному вопросу
+MESSAGES: List[str] = [
+    "Да",
+    "Нет",
+    " Да ",
+    "да",
+    "Будет",
+    "Нет, буду лечиться дома",
+    "10.12.2021",
+    "1/2/21",
+    "10.12",
+    "температура, кашель",
+    "@#",
+    "",
+    "   ",
+    "!report",
+]
+
+
+def build_keyboard(answers: Sequence[str], payload: str) -> str:
+    """Клавиатура для проверки: payload и варианты ответа в одной строке."""
+    return f"{payload}:{'|'.join(answers)}"
+
+
+def reference_dispatch(respondent: RespondentRecord, text: str) -> Optional[PollReply]:
+    """Обработка ответа цепочкой if/elif, как до графа переходов."""
+    is_ill_question: PollReply = PollReply(QUESTIONS[PollStage.IS_ILL], build_keyboard(IS_ILL_ANSWERS, "yes_no"))
+    certificate_question: PollReply = PollReply(
+        CERTIFICATE_QUESTION, build_keyboard(CERTIFICATE_ANSWERS, "will_certificate")
+    )
+    stage: str = respondent.poll_stage
+    if stage == PollStage.IN_PROGRESS.name:
+        answer: str = text.strip()
+        if answer == "Да":
+            respondent.answers["ill"] = True
+            respondent.poll_stage = PollStage.WILL_CERTIFICATE.name
+            return certificate_question
+        elif answer == "Нет":
+            respondent.answers["ill"] = False
+            respondent.poll_stage = PollStage.DONE.name
+            return PollReply(HEALTHY_MESSAGE)
+        return is_ill_question
+    elif stage == PollStage.WILL_CERTIFICATE.name:
+        answer = text.strip()
+        if answer == "Будет":
+            respondent.answers["medical_certificate"] = True
+            respondent.poll_stage = PollStage.CERTIFICATE_DATA.name
+            return PollReply(QUESTIONS[PollStage.CERTIFICATE_DATA])
+        elif answer == "Нет, буду лечиться дома":
+            respondent.answers["medical_certificate"] = False
+            respondent.poll_stage = PollStage.SYMPTOMS.name
+            return PollReply(QUESTIONS[PollStage.SYMPTOMS])
+        return certificate_question
+    elif stage == PollStage.CERTIFICATE_DATA.name:
+        if validate_date(text) is None:
+            return PollReply(QUESTIONS[PollStage.CERTIFICATE_DATA])
+        respondent.answers["medical_certificate_data"] = validate_date(text)
+        respondent.poll_stage = PollStage.SYMPTOMS.name
+        return PollReply(QUESTIONS[PollStage.SYMPTOMS])
+    elif stage == PollStage.SYMPTOMS.name:
+        if validate_free_text(text) is None:
+            return PollReply(QUESTIONS[PollStage.SYMPTOMS])
+        respondent.answers["diagnosis"] = validate_free_text(text)
+        respondent.poll_stage = PollStage.LAST_DAY_IN_UNIVERSATY.name
+        return PollReply(QUESTIONS[PollStage.LAST_DAY_IN_UNIVERSATY])
+    elif stage == PollStage.LAST_DAY_IN_UNIVERSATY.name:
+        if validate_date(text) is None:
+            return PollReply(QUESTIONS[PollStage.LAST_DAY_IN_UNIVERSATY])
+        respondent.answers["date_of_last_class_attendance"] = validate_date(text)
+        respondent.poll_stage = PollStage.DONE.name
+        return PollReply(QUESTIONS[PollStage.DONE], completed=True)
+    return None
+
+
+def definition(**changes: Any) -> Dict[str, Any]:
+    """Возвращает копию описания опроса по умолчанию с измененными ключами верхнего уровня."""
+    changed: Dict[str, Any] = copy.deepcopy(DEFAULT_POLL_DEFINITION)
+    changed.update(changes)
+    return changed
+
+
+def with_stage(name: str, **changes: Any) -> Dict[str, Any]:
+    """Возвращает копию описания опроса по умолчанию с измененной стадией."""
+    changed: Dict[str, Any] = copy.deepcopy(DEFAULT_POLL_DEFINITION)
+    changed["stages"][name].update(changes)
+    return changed
+
+
+@pytest.mark.parametrize("seed", range(20))
+def test_dispatch_matches_reference(seed: int) -> None:
+    rng: random.Random = random.Random(seed)
+    dispatcher: PollDispatcher = PollDispatcher(build_keyboard)
+    for _ in range(50):
+        respondent: RespondentRecord = RespondentRecord()
+        expected: RespondentRecord = RespondentRecord()
+        for text in rng.choices(MESSAGES, k=rng.randint(1, 12)):
+            assert dispatcher.dispatch(respondent, text) == reference_dispatch(expected, text)
+            assert respondent == expected
+
+
+def test_first_question_and_reminder() -> None:
+    dispatcher: PollDispatcher = PollDispatcher(build_keyboard)
+    assert dispatcher.first_question == PollReply(
+        QUESTIONS[PollStage.IS_ILL], build_keyboard(IS_ILL_ANSWERS, "yes_no")
+    )
+    assert dispatcher.reminder(PollStage.SYMPTOMS.name).message.endswith(QUESTIONS[PollStage.SYMPTOMS])
+    assert dispatcher.current_question(PollStage.DONE.name) is None
+
+
+@pytest.mark.parametrize(
+    "invalid_definition",
+    [
+        definition(stages={}),
+        definition(first_stage="SYMPTOMS_TYPO"),
+        definition(first_stage="IS_ILL"),
+        definition(columns=["name", "temperature"]),
+        definition(columns=["name", "poll_stage"]),
+        with_stage("SYMPTOMS", validator="number"),
+        with_stage("SYMPTOMS", validator="regex", pattern="("),
+        with_stage("SYMPTOMS", field="name"),
+        with_stage("SYMPTOMS", field=["diagnosis"]),
+        with_stage("SYMPTOMS", next="IS_ILL"),
+        with_stage("SYMPTOMS", next="UNKNOWN"),
+        with_stage("IN_PROGRESS", next={"Да": "WILL_CERTIFICATE", "Может быть": "DONE"}),
+        with_stage("CERTIFICATE_DATA", validator="choice"),
+        {"stages": {"DONE": {"question": "?", "next": "DONE"}}},
+        {"stages": {"IN_PROGRESS": {"question": "?"}}},
+        {"stages": ["IN_PROGRESS"]},
+    ],
+)
+def test_compile_poll_rejects_invalid_definition(invalid_definition: Dict[str, Any]) -> None:
+    with pytest.raises(ValueError):
+        compile_poll(invalid_definition, build_keyboard)
+
+
+def test_load_keeps_stages_missing_from_new_definition() -> None:
+    dispatcher: PollDispatcher = PollDispatcher(build_keyboard)
+    in_progress: RespondentRecord = RespondentRecord(PollStage.SYMPTOMS.name)
+    short_poll: Dict[str, Any] = {
+        "stages": {
+            "IN_PROGRESS": {
+                "question": "Вы здоровы?",
+                "answers": ["Да"],
+                "validator": "choice",
+                "next": {"Да": {"stage": "DONE", "message": "Спасибо"}},
+            },
+        },
+    }
+
+    kept: List[str] = dispatcher.load(short_poll)
+
+    assert sorted(kept) == sorted(["WILL_CERTIFICATE", "CERTIFICATE_DATA", "SYMPTOMS", "LAST_DAY_IN_UNIVERSATY"])
+    assert dispatcher.first_question == PollReply("Вы здоровы?", build_keyboard(["Да"], "in_progress"))
+    assert dispatcher.dispatch(RespondentRecord(), "Да") == PollReply("Спасибо", completed=True)
+    # Респондент, начавший старый опрос, заканчивает его по старому графу
+    assert dispatcher.dispatch(in_progress, "кашель") == PollReply(QUESTIONS[PollStage.LAST_DAY_IN_UNIVERSATY])
+    assert dispatcher.dispatch(in_progress, "09.12.2021") == PollReply(QUESTIONS[PollStage.DONE], completed=True)
+
+
+def test_load_invalid_definition_keeps_current_graph() -> None:
+    dispatcher: PollDispatcher = PollDispatcher(build_keyboard)
+    graph = dispatcher.graph
+
+    with pytest.raises(ValueError):
+        dispatcher.load(with_stage("SYMPTOMS", next="UNKNOWN"))
+
+    assert dispatcher.graph is graph
+
+
+def test_build_row_matches_googlesheet_inserter() -> None:
+    dispatcher: PollDispatcher = PollDispatcher(build_keyboard)
+    answers: Dict[str, Any] = {
+        "ill": True,
+        "diagnosis": "температура, кашель",
+        "medical_certificate": True,
+        "medical_certificate_data": "10.12.2021",
+        "date_of_last_class_attendance": "09.12.2021",
+    }
+    respondent: RespondentRecord = RespondentRecord(PollStage.DONE.name, answers)
+
+    row: List[Any] = dispatcher.build_row("Иванов Иван", respondent, "2021-12-10")
+
+    assert row == GoogleSheetInserter.build_row("Иванов Иван", answers, "2021-12-10")
+    assert row == ["Иванов Иван", "температура, кашель", "10.12.2021", "09.12.2021", True, "2021-12-10"]
+
+
+def test_build_row_uses_columns_from_definition() -> None:
+    dispatcher: PollDispatcher = PollDispatcher(build_keyboard, definition(columns=["date", "name", "ill"]))
+    respondent: RespondentRecord = RespondentRecord(answers={"ill": True})
+
+    assert dispatcher.build_row("Иванов Иван", respondent, "2021-12-10") == ["2021-12-10", "Иванов Иван", True]
+
+
+TEMPERATURE_POLL: Dict[str, Any] = {
+    "first_stage": "TEMPERATURE",
+    "stages": {
+        "TEMPERATURE": {
+            "question": "Какая у вас температура?",
+            "validator": "regex",
+            "pattern": r"3\d[.,]\d",
+            "field": "temperature",
+            "next": "VACCINATED",
+        },
+        "VACCINATED": {
+            "question": "Вы привиты?",
+            "answers": ["Да", "Нет"],
+            "payload": "yes_no",
+            "validator": "choice",
+            "field": "vaccinated",
+            "values": {"Да": True, "Нет": False},
+            "next": "DONE",
+        },
+    },
+    "columns": ["name", "temperature", "vaccinated", "date"],
+}
+
+
+def test_definition_declares_stages_and_fields() -> None:
+    dispatcher: PollDispatcher = PollDispatcher(build_keyboard, TEMPERATURE_POLL)
+    respondent: RespondentRecord = RespondentRecord(dispatcher.first_stage)
+
+    assert dispatcher.first_stage == "TEMPERATURE"
+    assert dispatcher.graph.fields == ("temperature", "vaccinated")
+    assert dispatcher.dispatch(respondent, "36.6") == PollReply("Вы привиты?", build_keyboard(["Да", "Нет"], "yes_no"))
+    assert dispatcher.stats_key(respondent) == ("VACCINATED", False, ())
+    assert dispatcher.dispatch(respondent, "Нет").completed
+    assert respondent == RespondentRecord("DONE", {"temperature": "36.6", "vaccinated": False})
+    assert dispatcher.stats_key(respondent) == ("DONE", False, (("VACCINATED", "Нет"),))
+    assert dispatcher.build_row("Иванов Иван", respondent, "2021-12-10") == [
+        "Иванов Иван", "36.6", False, "2021-12-10"
+    ]
+
+
+def test_report_counts_choices_from_definition() -> None:
+    dispatcher: PollDispatcher = PollDispatcher(build_keyboard, TEMPERATURE_POLL)
+    records: List[Tuple[str, RespondentRecord]] = [
+        ("1", RespondentRecord("TEMPERATURE")),
+        ("2", RespondentRecord("VACCINATED", {"temperature": "36.6"})),
+        ("3", RespondentRecord("DONE", {"temperature": "36.6", "vaccinated": True})),
+        ("4", RespondentRecord("DONE", {"temperature": "37.2", "vaccinated": False})),
+        ("5", RespondentRecord("DONE", {"temperature": "36.7", "vaccinated": True})),
+    ]
+
+    stats: PollStats = PollStats.from_records(records, dispatcher.stats_key)
+    text: str = format_report("poll", stats, {"1": "Иванов Иван"}, dispatcher.questions)
+
+    assert stats.done == 3
+    assert stats.choices == {("VACCINATED", "Да"): 2, ("VACCINATED", "Нет"): 1}
+    assert list(stats.silent) == ["1"]
+    assert "Прошли опрос: 3 из 5, отвечают сейчас: 1\n" in text
+    assert "Вы привиты?: Да - 2, Нет - 1\n" in text
+    assert "TEMPERATURE: 1\nVACCINATED: 1\nDONE: 3\n" in text
+    assert text.endswith("Не ответили (1): Иванов Иван")
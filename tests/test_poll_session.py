@@ -0,0 +1,87 @@
+import sqlite3
+from typing import List
+
+import pytest
+
+from poll_dispatcher import PollDispatcher
+from poll_session import SessionRegistry
+from state_store import BaseStateStore, MemoryStateStore, PollStage, RespondentRecord, SQLiteStateStore
+
+POLL_ID: str = "2021-12-10/group-00000000"
+FIRST_STAGE: str = PollStage.IN_PROGRESS.name
+stats_key = PollDispatcher(lambda answers, payload: "").stats_key
+
+
+@pytest.fixture(params=["memory", "sqlite"])
+def state(request, tmp_path) -> BaseStateStore:
+    if request.param == "memory":
+        return MemoryStateStore()
+    return SQLiteStateStore(str(tmp_path / "state.db"))
+
+
+def test_restart_with_smaller_roster_drops_removed_users(state: BaseStateStore) -> None:
+    registry: SessionRegistry = SessionRegistry(state, stats_key)
+    registry.start(POLL_ID, "url", ["1", "2", "3"], FIRST_STAGE)
+    state.save("2", POLL_ID, RespondentRecord(PollStage.DONE.name, {"ill": False}))
+
+    session = registry.start(POLL_ID, "url", ["1", "2"], FIRST_STAGE)
+
+    assert sorted(user_id for user_id, _ in state.items(POLL_ID)) == ["1", "2"]
+    assert registry.find("3") is None
+    assert state.get("2", POLL_ID) == RespondentRecord()
+    assert (session.stats.total, list(session.stats.silent)) == (2, ["1", "2"])
+    assert SessionRegistry(state, stats_key).find("3") is None
+
+
+def test_sqlite_state_is_restored_after_close(tmp_path) -> None:
+    path: str = str(tmp_path / "state.db")
+    state: SQLiteStateStore = SQLiteStateStore(path)
+    SessionRegistry(state, stats_key).start(POLL_ID, "url", ["1", "2", "3"], FIRST_STAGE, initiator_id="7")
+    state.save("2", POLL_ID, RespondentRecord(PollStage.DONE.name, {"ill": True}))
+    state.delete_poll(POLL_ID)
+    answered: RespondentRecord = RespondentRecord("TEMPERATURE", {"temperature": "37,2", "сыпь": True})
+    state.save_many(POLL_ID, [("1", RespondentRecord()), ("2", answered)])
+    state.close()
+
+    restored: SQLiteStateStore = SQLiteStateStore(path)
+
+    assert restored.sessions() == [(POLL_ID, "url", "7")]
+    assert list(restored.items(POLL_ID)) == [("1", RespondentRecord()), ("2", answered)]
+    restored.close()
+
+
+def test_sqlite_legacy_state_is_upgraded(tmp_path) -> None:
+    path: str = str(tmp_path / "state.db")
+    connection: sqlite3.Connection = sqlite3.connect(path)
+    connection.execute(
+        """CREATE TABLE respondents (
+            user_id TEXT NOT NULL,
+            poll_id TEXT NOT NULL,
+            poll_stage INTEGER NOT NULL,
+            ill INTEGER NOT NULL,
+            diagnosis TEXT NOT NULL,
+            medical_certificate INTEGER NOT NULL,
+            medical_certificate_data TEXT NOT NULL,
+            date_of_last_class_attendance TEXT NOT NULL,
+            PRIMARY KEY (poll_id, user_id)
+        ) WITHOUT ROWID"""
+    )
+    connection.executemany(
+        "INSERT INTO respondents VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+        [
+            ("1", POLL_ID, int(PollStage.IN_PROGRESS), 0, "", 0, "", ""),
+            ("2", POLL_ID, int(PollStage.SYMPTOMS), 1, "", 1, "10.12.2021", ""),
+            ("3", POLL_ID, int(PollStage.DONE), 0, "", 0, "", ""),
+        ],
+    )
+    connection.commit()
+    connection.close()
+
+    state: SQLiteStateStore = SQLiteStateStore(path)
+
+    assert list(state.items(POLL_ID)) == [
+        ("1", RespondentRecord()),
+        ("2", RespondentRecord("SYMPTOMS", {"ill": True, "medical_certificate": True, "medical_certificate_data": "10.12.2021"})),
+        ("3", RespondentRecord("DONE", {"ill": False})),
+    ]
+    state.close()
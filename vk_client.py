@@ -0,0 +1,21 @@
+from vkwave.client import AIOHTTPClient
+
+
+class VKAPIClient(AIOHTTPClient):
+    """HTTP клиент vkwave, отправляющий вызовы методов на другой адрес VK API:
+    прокси или локальную имитацию VK (benchmarks/fake_vk.py).
+    """
+
+    def __init__(self, api_url: str) -> None:
+        """Инициализирует класс.
+        Args:
+            api_url (str): Адрес VK API без /method, например http://127.0.0.1:8081.
+        Returns:
+        """
+        super().__init__()
+        self.API_URL = f"{api_url.rstrip('/')}/method/{{method_name}}"
+
+
+def create_vk_client(api_url: str) -> AIOHTTPClient:
+    """Возвращает клиент для адреса VK API или клиент vkwave по умолчанию (api.vk.com)."""
+    return VKAPIClient(api_url) if api_url else AIOHTTPClient()